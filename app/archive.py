@@ -0,0 +1,75 @@
+# app/archive.py
+# Архивация выполненных задач: задание планировщика переносит задачи, выполненные
+# раньше ARCHIVE_AFTER_DAYS, из tasks в tasks_archive. Пачками по ARCHIVE_BATCH
+# в коротких транзакциях с паузой между ними, чтобы не держать писателя;
+# после — incremental_vacuum возвращает освободившиеся страницы.
+import asyncio
+import logging
+
+from .config import (
+    ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH, ARCHIVE_PAUSE_SECONDS, ARCHIVE_VACUUM_PAGES, ARCHIVE_LEASE_SECONDS,
+)
+from .db import db_conn
+from .leases import acquire_lease
+from .metrics import tasks_archived
+from .utils import now_ts
+
+log = logging.getLogger(__name__)
+
+_COLUMNS = ("id", "user_id", "title", "category", "due_at", "is_done", "created_at", "reminded_at",
+            "pre_offset_minutes", "pre_reminded_at", "rrule", "pre_offsets", "done_at")
+
+# DELETE … RETURNING: строки пачки выбираются один раз и переносятся в той же транзакции
+_TAKE_SQL = (
+    f"DELETE FROM tasks WHERE id IN (SELECT id FROM tasks WHERE is_done=1 AND done_at < ? "
+    f"ORDER BY done_at LIMIT ?) RETURNING {', '.join(_COLUMNS)}"
+)
+_PUT_SQL = (
+    f"INSERT INTO tasks_archive ({', '.join(_COLUMNS)}, archived_at) "
+    f"VALUES ({', '.join('?' * (len(_COLUMNS) + 1))})"
+)
+
+
+async def archive_batch(cutoff: int, limit: int = ARCHIVE_BATCH) -> int:
+    """Перенести до limit задач, выполненных раньше cutoff, одной транзакцией."""
+    now = now_ts()
+    async with db_conn() as db:
+        cur = await db.execute(_TAKE_SQL, (cutoff, limit))
+        rows = await cur.fetchall()
+        if rows:
+            await db.executemany(_PUT_SQL, [(*r, now) for r in rows])
+            ids = [r["id"] for r in rows]
+            await db.execute(f"DELETE FROM reminders WHERE task_id IN ({', '.join('?' * len(ids))})", ids)
+        await db.commit()
+    return len(rows)
+
+
+async def archive_done_tasks(after_days: int = ARCHIVE_AFTER_DAYS, batch: int = ARCHIVE_BATCH) -> int:
+    """
+    Задание планировщика (раз в ARCHIVE_EVERY_MINUTES). При нескольких процессах
+    работает только владелец аренды 'archive'. Возвращает число перенесённых задач.
+    """
+    if not await acquire_lease("archive", ARCHIVE_LEASE_SECONDS):
+        return 0
+    cutoff = now_ts() - after_days * 86400
+    total = 0
+    while True:
+        n = await archive_batch(cutoff, batch)
+        total += n
+        tasks_archived.inc(value=n)
+        if n < batch:
+            break
+        await asyncio.sleep(ARCHIVE_PAUSE_SECONDS)
+    if total:
+        await vacuum_free_pages()
+        log.info("archived %d completed tasks", total)
+    return total
+
+
+async def vacuum_free_pages(pages: int = ARCHIVE_VACUUM_PAGES):
+    """Вернуть до pages свободных страниц (без auto_vacuum=INCREMENTAL — ничего не делает)."""
+    async with db_conn() as db:
+        # страница освобождается на каждый шаг statement — выбираем до конца
+        cur = await db.execute(f"PRAGMA incremental_vacuum({int(pages)})")
+        await cur.fetchall()
+        await db.commit()
@@ -8,11 +8,108 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise RuntimeError("Добавьте BOT_TOKEN в .env")
 
+# Приём апдейтов: "polling" (по умолчанию) или "webhook" — встроенный aiohttp-сервер
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")          # публичный https-адрес, напр. https://bot.example.com/webhook
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")    # сверяется с X-Telegram-Bot-Api-Secret-Token; пусто — случайный на запуск
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_QUEUE_SIZE = 1000  # апдейтов в очереди; при переполнении отвечаем 503 и Telegram повторит
+WEBHOOK_WORKERS = 16
+
+# Метрики Prometheus: GET /metrics только на локальном интерфейсе; 0 — выключить
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))
+
 TZ = ZoneInfo("Asia/Tashkent")
 DB_PATH = "tasks.db"
 
-# Время ежедневной сводки
+# Пул соединений SQLite: читатели + один писатель с group commit
+DB_READERS = 4
+DB_BUSY_TIMEOUT_MS = 5000
+GROUP_COMMIT_WINDOW_MS = 2  # сколько ждём попутные записи перед COMMIT
+
+# Профили хранения: PRAGMA, которые app/db.py выставляет каждому соединению.
+# Оба в WAL (читатели не ждут писателя); различаются ценой COMMIT:
+#   durable    — fsync на каждый COMMIT, коммит переживает отключение питания;
+#   throughput — fsync только при checkpoint: при отключении питания можно потерять
+#                последние коммиты (не целостность БД), падение процесса — ничего.
+STORAGE_PROFILES = {
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": DB_BUSY_TIMEOUT_MS,
+        "cache_size": -16384,          # KiB на соединение
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "wal_autocheckpoint": 1000,    # страниц
+    },
+    "throughput": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": DB_BUSY_TIMEOUT_MS,
+        "cache_size": -65536,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        # checkpoint в основном делает фоновое задание, а не COMMIT писателя
+        "wal_autocheckpoint": 10000,
+        "journal_size_limit": 64 * 1024 * 1024,
+    },
+}
+STORAGE_PROFILE = os.getenv("STORAGE_PROFILE", "throughput")
+DB_CHECKPOINT_SECONDS = 60      # PASSIVE checkpoint WAL вне пути COMMIT
+DB_OPTIMIZE_MINUTES = 360       # PRAGMA optimize (обновляет статистику планировщика)
+DB_ANALYSIS_LIMIT = 1000        # строк на индекс для ANALYZE внутри optimize
+
+# Профилирование SQL (app/db_profile.py): статистика по запросам, лог медленных с планом
+DB_PROFILE = os.getenv("DB_PROFILE", "0") == "1"
+DB_SLOW_MS = float(os.getenv("DB_SLOW_MS", "100"))
+
+# Исходящие сообщения: лимиты Telegram (≈30 msg/s на бота, ≈1 msg/s в чат)
+SEND_GLOBAL_RATE = 25
+SEND_CHAT_RATE = 1
+SEND_CHAT_BURST = 3
+SEND_WORKERS = 8
+SEND_MAX_RETRIES = 3
+
+# Outbox напоминаний: повторы с экспоненциальной задержкой и джиттером
+OUTBOX_BATCH = 100            # строк за один захват
+OUTBOX_MAX_INFLIGHT = 500     # сколько сообщений одновременно в очереди отправки
+OUTBOX_MAX_ATTEMPTS = 8       # после стольких неудач строка помечается failed
+OUTBOX_BACKOFF_BASE = 2       # секунд перед второй попыткой, дальше ×2
+OUTBOX_BACKOFF_MAX = 600
+OUTBOX_CLAIM_SECONDS = 600    # захваченная строка вернётся в очередь, если процесс пропал
+OUTBOX_POLL_SECONDS = 30      # страховочный опрос таблицы (строки других процессов, повторы)
+
+# Время ежедневной сводки (по умолчанию; пользователь меняет /tz и /digest)
 MORNING_DIGEST_HOUR = 9  # 09:00 Asia/Tashkent
+# Сводки одной группы растягиваются на столько минут, чтобы не было пика в 09:00
+DIGEST_WINDOW_MINUTES = 10
+# Пропущенный тик (перезапуск, долгий прошлый проход) досылает сводки ещё столько минут после окна
+DIGEST_CATCHUP_MINUTES = 120
+# Сводки шлёт один процесс — владелец аренды 'digest'; продлевается каждую минуту
+DIGEST_LEASE_SECONDS = 90
+
+# FSM (мастер /add): горячий кэш в памяти + отложенная запись в tasks.db
+FSM_CACHE_SIZE = 10000        # сколько сессий держим в памяти
+FSM_TTL_SECONDS = 24 * 3600   # брошенный мастер забываем через сутки
+FSM_FLUSH_SECONDS = 1.0       # как часто сбрасываем изменения в БД одной транзакцией
+
+# Кэш настроек пользователей (пред-офсет, tz, час сводки)
+USER_SETTINGS_CACHE_SIZE = 100000
+USER_SETTINGS_TTL_SECONDS = 300   # изменения из других процессов бота видны не позже чем через 5 мин
+
+# Архив выполненных задач (app/archive.py): tasks держит только открытые и недавние
+ARCHIVE_AFTER_DAYS = 30       # выполненные раньше стольких дней назад уезжают в tasks_archive
+ARCHIVE_BATCH = 500           # строк за одну короткую транзакцию
+ARCHIVE_PAUSE_SECONDS = 0.05  # пауза между пачками — записи хендлеров проходят без очереди
+ARCHIVE_VACUUM_PAGES = 2000   # сколько свободных страниц вернуть ОС за запуск (incremental_vacuum)
+ARCHIVE_EVERY_MINUTES = 60
+ARCHIVE_LEASE_SECONDS = 600
+
+# Остановка бота: сколько ждать уже запущенные задания планировщика (сводка, архив), потом отмена
+SHUTDOWN_JOBS_SECONDS = 10
 
 # Пресеты быстрых сроков
 DEFAULT_DUE_HOUR = 18
@@ -1,51 +1,338 @@
+import asyncio
+import logging
 import sqlite3
+import time
 import aiosqlite
 from contextlib import asynccontextmanager
-from .config import DB_PATH
+from typing import Optional
+from .config import (
+    DB_PATH, DB_READERS, GROUP_COMMIT_WINDOW_MS, DB_PROFILE,
+    STORAGE_PROFILES, STORAGE_PROFILE, DB_ANALYSIS_LIMIT,
+)
+from .db_profile import QueryProfiler, ProfiledCursor
+from .metrics import db_query_seconds, db_commit_seconds
+
+log = logging.getLogger(__name__)
+
+
+def storage_pragmas(profile: str = STORAGE_PROFILE) -> list[str]:
+    """PRAGMA профиля хранения (config.STORAGE_PROFILES) в порядке применения."""
+    try:
+        settings = STORAGE_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"unknown STORAGE_PROFILE: {profile!r}, expected one of {', '.join(STORAGE_PROFILES)}")
+    return [f"PRAGMA {name}={value}" for name, value in settings.items()]
+
+
+_PRAGMAS = storage_pragmas()
+
+
+async def _apply_pragmas(conn: aiosqlite.Connection):
+    for pragma in _PRAGMAS:
+        # journal_mode возвращает строку-результат — выбираем, чтобы statement завершился
+        cur = await conn.execute(pragma)
+        await cur.fetchall()
+
 
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            title TEXT NOT NULL,
-            category TEXT,
-            due_at TEXT,                 -- ISO 8601 в локальном TZ
-            is_done INTEGER NOT NULL DEFAULT 0,
-            created_at TEXT NOT NULL,
-            reminded_at TEXT,            -- признак отправленного основного напоминания
-            pre_offset_minutes INTEGER,  -- индивидуальный пред-офсет (NULL => дефолт юзера)
-            pre_reminded_at TEXT,        -- отправлено пред-напоминание
-            rrule TEXT                   -- FREQ=DAILY|WEEKLY|MONTHLY;INTERVAL=n
-        );
-        """)
-        # Миграции на случай старых БД: оборачиваем в try
-        for alter in [
-            "ALTER TABLE tasks ADD COLUMN reminded_at TEXT;",
-            "ALTER TABLE tasks ADD COLUMN pre_offset_minutes INTEGER;",
-            "ALTER TABLE tasks ADD COLUMN pre_reminded_at TEXT;",
-            "ALTER TABLE tasks ADD COLUMN rrule TEXT;",
-            "ALTER TABLE tasks ADD COLUMN category TEXT;"
-        ]:
+    """Применить недостающие миграции (см. app/migrations.py)."""
+    from .migrations import migrate
+    async with aiosqlite.connect(DB_PATH, isolation_level=None) as db:
+        db.row_factory = sqlite3.Row
+        # действует только на новой БД (до первой таблицы); для существующей нужен
+        # разовый VACUUM — иначе incremental_vacuum после архивации ничего не делает
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await _apply_pragmas(db)
+        await migrate(db)
+
+# ---------- пул соединений ----------
+# Несколько постоянных соединений на чтение + одно соединение-писатель.
+# Записи разных хендлеров копятся в одной транзакции писателя (каждый хендлер —
+# в своём SAVEPOINT) и фиксируются одним COMMIT (group commit). commit() хендлера
+# возвращается, только когда его изменения действительно записаны.
+
+_READ_PREFIXES = ("SELECT", "WITH", "EXPLAIN")
+
+
+def _is_write(sql: str) -> bool:
+    return not sql.lstrip()[:7].upper().startswith(_READ_PREFIXES)
+
+
+async def _connect() -> aiosqlite.Connection:
+    conn = await aiosqlite.connect(DB_PATH, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    await _apply_pragmas(conn)
+    return conn
+
+
+class _Writer:
+    def __init__(self, conn: aiosqlite.Connection):
+        self.conn = conn
+        self.lock = asyncio.Lock()
+        self._in_tx = False
+        self._waiters: list[asyncio.Future] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._owner: Optional[asyncio.Task] = None  # задача, чей юнит держит lock
+
+    async def begin(self):
+        task = asyncio.current_task()
+        if self._owner is task:
+            # вторая запись из той же задачи ждала бы lock, который держит она сама
+            raise RuntimeError("nested write unit: commit() the open db_conn() before writing in another one")
+        await self.lock.acquire()
+        self._owner = task
+        try:
+            if not self._in_tx:
+                await self.conn.execute("BEGIN IMMEDIATE")
+                self._in_tx = True
+            await self.conn.execute("SAVEPOINT unit")
+        except BaseException:
+            self._owner = None
+            self.lock.release()
+            raise
+
+    async def end(self, ok: bool) -> Optional[asyncio.Future]:
+        fut = None
+        try:
+            if ok:
+                await self.conn.execute("RELEASE unit")
+                fut = asyncio.get_running_loop().create_future()
+                self._waiters.append(fut)
+                if self._flush_task is None:
+                    self._flush_task = asyncio.create_task(self._flush())
+            else:
+                await self.conn.execute("ROLLBACK TO unit")
+                await self.conn.execute("RELEASE unit")
+                if not self._waiters:
+                    # в транзакции нет зафиксированных юнитов — закрываем её сразу
+                    await self.conn.execute("ROLLBACK")
+                    self._in_tx = False
+        finally:
+            self._owner = None
+            self.lock.release()
+        return fut
+
+    async def _flush(self):
+        await asyncio.sleep(GROUP_COMMIT_WINDOW_MS / 1000)
+        async with self.lock:
+            waiters, self._waiters = self._waiters, []
+            self._flush_task = None
+            error = None
             try:
-                await db.execute(alter)
-            except Exception:
-                pass
-
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS user_settings (
-            user_id INTEGER PRIMARY KEY,
-            default_pre_offset_minutes INTEGER
-        );
-        """)
-        await db.commit()
+                await self.conn.execute("COMMIT")
+            except Exception as e:
+                error = e
+                try:
+                    await self.conn.execute("ROLLBACK")
+                except Exception:
+                    pass
+            self._in_tx = False
+        for fut in waiters:
+            if fut.done():
+                continue
+            if error is None:
+                fut.set_result(None)
+            else:
+                fut.set_exception(error)
+
+
+class _Pool:
+    def __init__(self):
+        self.readers: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self.writer: Optional[_Writer] = None
+        self._all: list[aiosqlite.Connection] = []
+
+    async def open(self):
+        writer = await _connect()
+        self.writer = _Writer(writer)
+        self._all.append(writer)
+        for _ in range(DB_READERS):
+            conn = await _connect()
+            self._all.append(conn)
+            self.readers.put_nowait(conn)
+
+    async def close(self):
+        for conn in self._all:
+            await conn.close()
+        self._all.clear()
+
+    async def optimize(self):
+        """
+        PRAGMA optimize на каждом соединении: SQLite смотрит, какие таблицы этим
+        соединением запрашивались, и при необходимости обновляет их статистику.
+        Читатель берётся из очереди (не занят запросом), писатель — под своей блокировкой.
+        """
+        for _ in range(DB_READERS):
+            conn = await self.readers.get()
+            try:
+                await _optimize(conn)
+            finally:
+                self.readers.put_nowait(conn)
+        async with self.writer.lock:
+            if not self.writer._in_tx:
+                await _optimize(self.writer.conn)
+
+
+async def _optimize(conn: aiosqlite.Connection):
+    await conn.execute(f"PRAGMA analysis_limit={DB_ANALYSIS_LIMIT}")
+    cur = await conn.execute("PRAGMA optimize")
+    await cur.fetchall()
+
+
+# Профилировщик запросов; None — выключен (DB_PROFILE=0), накладных расходов нет
+profiler: Optional[QueryProfiler] = QueryProfiler() if DB_PROFILE else None
+
+_pool: Optional[_Pool] = None
+_pool_lock: Optional[asyncio.Lock] = None
+
+
+async def _get_pool() -> _Pool:
+    global _pool, _pool_lock
+    if _pool is not None:
+        return _pool
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            pool = _Pool()
+            await pool.open()
+            _pool = pool
+    return _pool
+
+
+async def close_db():
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        if pool.writer._flush_task is not None:
+            await pool.writer._flush_task
+        try:
+            await pool.optimize()  # рекомендация SQLite: optimize перед закрытием соединений
+        except Exception as e:
+            log.warning("PRAGMA optimize failed: %r", e)
+        await pool.close()
+
+
+# ---------- обслуживание (задания планировщика) ----------
+
+async def checkpoint_db(mode: str = "PASSIVE") -> tuple[int, int, int]:
+    """
+    Перенести WAL в основной файл из соединения-читателя: COMMIT писателя не ждёт
+    checkpoint, а PASSIVE не ждёт ни читателей, ни писателя. (busy, страниц в WAL, перенесено).
+    """
+    pool = await _get_pool()
+    conn = await pool.readers.get()
+    try:
+        cur = await conn.execute(f"PRAGMA wal_checkpoint({mode})")
+        busy, log_pages, done = await cur.fetchone()
+    finally:
+        pool.readers.put_nowait(conn)
+    if log_pages > 0 and done < log_pages:
+        log.debug("wal checkpoint: %d of %d pages (busy=%d)", done, log_pages, busy)
+    return busy, log_pages, done
+
+
+async def explain_query_plan(sql: str, parameters=None) -> list[str]:
+    """
+    EXPLAIN QUERY PLAN на соединении-читателе в обход Session: профилировщик
+    не видит собственных EXPLAIN и не профилирует их по кругу.
+    """
+    pool = await _get_pool()
+    conn = await pool.readers.get()
+    try:
+        cur = await conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+        return [r["detail"] for r in await cur.fetchall()]
+    finally:
+        pool.readers.put_nowait(conn)
+
+
+async def optimize_db():
+    await (await _get_pool()).optimize()
+
+
+class Session:
+    """
+    То, что отдаёт db_conn(): интерфейс как у aiosqlite.Connection
+    (execute / executemany / commit / rollback). Чтения до первой записи
+    идут в соединение-читатель, всё начиная с первой записи — в писателя.
+
+    С первой записи до commit()/rollback() сессия держит писателя целиком:
+    остальные записи и group commit ждут. Поэтому юнит записи короткий
+    (сеть и долгие await — до первой записи или после commit) и не вложенный:
+    запись в другом db_conn() той же задачи до commit — RuntimeError, а не зависание.
+    """
+
+    def __init__(self, pool: _Pool):
+        self._pool = pool
+        self._reader: Optional[aiosqlite.Connection] = None
+        self._unit = False
+
+    async def _write_conn(self) -> aiosqlite.Connection:
+        if not self._unit:
+            await self._pool.writer.begin()
+            self._unit = True
+        return self._pool.writer.conn
+
+    async def execute(self, sql: str, parameters=None) -> aiosqlite.Cursor:
+        t0 = time.perf_counter()
+        if self._unit or _is_write(sql):
+            op = "write"
+            conn = await self._write_conn()
+        else:
+            op = "read"
+            if self._reader is None:
+                self._reader = await self._pool.readers.get()
+            conn = self._reader
+        cur = await conn.execute(sql, parameters)
+        elapsed = time.perf_counter() - t0
+        db_query_seconds.observe(elapsed, op)
+        if profiler is not None:
+            profiler.record(sql, elapsed, cur.rowcount)
+            if _is_write(sql) and "RETURNING" not in sql.upper():
+                profiler.finish(sql, parameters, elapsed, cur.rowcount)
+            else:
+                return ProfiledCursor(cur, profiler, sql, parameters, elapsed)
+        return cur
+
+    async def executemany(self, sql: str, parameters) -> aiosqlite.Cursor:
+        if profiler is not None:
+            parameters = list(parameters)  # первая строка нужна для EXPLAIN медленной пачки
+        t0 = time.perf_counter()
+        conn = await self._write_conn()
+        cur = await conn.executemany(sql, parameters)
+        elapsed = time.perf_counter() - t0
+        db_query_seconds.observe(elapsed, "write_many")
+        if profiler is not None:
+            profiler.record(sql, elapsed, cur.rowcount)
+            profiler.finish(sql, parameters[0] if parameters else None, elapsed, cur.rowcount)
+        return cur
+
+    async def commit(self):
+        if not self._unit:
+            return
+        self._unit = False
+        with db_commit_seconds.time():
+            fut = await self._pool.writer.end(True)
+            await fut
+
+    async def rollback(self):
+        if self._unit:
+            self._unit = False
+            await self._pool.writer.end(False)
+
+    async def _release(self):
+        try:
+            await self.rollback()  # незакоммиченное — откатываем, как при закрытии соединения
+        finally:
+            if self._reader is not None:
+                self._pool.readers.put_nowait(self._reader)
+                self._reader = None
+
 
 @asynccontextmanager
 async def db_conn():
-    conn = await aiosqlite.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    session = Session(await _get_pool())
     try:
-        yield conn
+        yield session
     finally:
-        await conn.close()
+        await session._release()
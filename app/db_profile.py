@@ -0,0 +1,170 @@
+# app/db_profile.py
+# Профилирование SQL (включается DB_PROFILE=1): по каждому нормализованному запросу
+# копим число вызовов, время (execute + выборка строк) и строки; запросы дольше
+# DB_SLOW_MS пишутся в лог вместе с EXPLAIN QUERY PLAN. Сводка — dump() / SIGUSR1.
+import asyncio
+import logging
+import re
+import signal
+from functools import lru_cache
+from time import perf_counter as _clock
+from typing import Optional
+
+from .config import DB_SLOW_MS
+
+log = logging.getLogger(__name__)
+
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w?])-?\d+(?:\.\d+)?\b")
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql: str) -> str:
+    """Один ключ на «форму» запроса: литералы → ?, IN (?, ?, …) → IN (?…), пробелы схлопнуты."""
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(?…)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+class _Stat:
+    __slots__ = ("calls", "seconds", "max_seconds", "rows", "slow", "plan")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.plan: Optional[str] = None
+
+
+class QueryProfiler:
+    def __init__(self, slow_ms: float = DB_SLOW_MS):
+        self.slow = slow_ms / 1000
+        self.stats: dict[str, _Stat] = {}
+        self._explaining: set[str] = set()
+
+    def _stat(self, key: str) -> _Stat:
+        st = self.stats.get(key)
+        if st is None:
+            st = self.stats[key] = _Stat()
+        return st
+
+    def record(self, sql: str, seconds: float, rows: int, call: bool = True):
+        """call=False — догрузка строк тем же запросом (fetch*), вызов уже посчитан."""
+        key = normalize_sql(sql)
+        st = self._stat(key)
+        st.calls += call
+        st.seconds += seconds
+        st.rows += max(rows, 0)
+        if call:
+            st.max_seconds = max(st.max_seconds, seconds)
+
+    def finish(self, sql: str, params, total: float, rows: int):
+        """Запрос завершён (или его курсор исчерпан): проверить порог медленного."""
+        key = normalize_sql(sql)
+        st = self._stat(key)
+        st.max_seconds = max(st.max_seconds, total)
+        if total < self.slow:
+            return
+        st.slow += 1
+        if sql.lstrip()[:7].upper() == "EXPLAIN":
+            # EXPLAIN от самого приложения (bench.query_plans): план плана не строим
+            log.warning("slow query %.1f ms, %d rows: %s", total * 1e3, rows, key)
+        elif st.plan is None and key not in self._explaining:
+            self._explaining.add(key)
+            asyncio.get_running_loop().create_task(self._explain_and_log(key, sql, params, total, rows))
+        else:
+            log.warning("slow query %.1f ms, %d rows: %s\n%s", total * 1e3, rows, key, st.plan or "")
+
+    async def _explain_and_log(self, key: str, sql: str, params, total: float, rows: int):
+        from .db import explain_query_plan  # db импортирует нас
+        st = self.stats[key]
+        try:
+            if not isinstance(params, (tuple, list, dict)):
+                # параметры неизвестны — для плана хватит NULL на каждый плейсхолдер
+                params = (None,) * _STRING_RE.sub("", sql).count("?")
+            st.plan = "\n".join(f"  {d}" for d in await explain_query_plan(sql, params))
+        except Exception as e:
+            st.plan = f"  (plan unavailable: {e!r})"
+        finally:
+            self._explaining.discard(key)
+        log.warning("slow query %.1f ms, %d rows: %s\n%s", total * 1e3, rows, key, st.plan)
+
+    def dump(self, top: int = 20) -> str:
+        """Топ запросов по суммарному времени."""
+        lines = [f"{'calls':>8} {'total ms':>10} {'avg ms':>8} {'max ms':>8} {'rows':>9} {'slow':>5}  sql"]
+        ranked = sorted(self.stats.items(), key=lambda kv: kv[1].seconds, reverse=True)[:top]
+        for key, st in ranked:
+            avg = st.seconds / st.calls if st.calls else 0
+            lines.append(f"{st.calls:>8} {st.seconds * 1e3:>10.1f} {avg * 1e3:>8.2f} "
+                         f"{st.max_seconds * 1e3:>8.1f} {st.rows:>9} {st.slow:>5}  {key}")
+        return "\n".join(lines)
+
+    def reset(self):
+        self.stats.clear()
+
+    def log_dump(self):
+        log.warning("SQL profile (top by total time):\n%s", self.dump())
+
+    def install_signal(self):
+        """kill -USR1 <pid> — сводка в лог без остановки бота (где есть SIGUSR1)."""
+        if hasattr(signal, "SIGUSR1"):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, self.log_dump)
+
+
+class ProfiledCursor:
+    """
+    Обёртка курсора: время и строки выборки (fetchone/fetchmany/fetchall,
+    async for) дописываются к статистике того же запроса.
+    """
+
+    def __init__(self, cursor, profiler: QueryProfiler, sql: str, params, seconds: float):
+        self._cursor = cursor
+        self._profiler = profiler
+        self._sql, self._params = sql, params
+        self._total = seconds
+        self._rows = 0
+        self._done = False
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _add(self, seconds: float, rows: int, exhausted: bool):
+        self._total += seconds
+        self._rows += rows
+        self._profiler.record(self._sql, seconds, rows, call=False)
+        if exhausted and not self._done:
+            self._done = True
+            self._profiler.finish(self._sql, self._params, self._total, self._rows)
+
+    async def fetchone(self):
+        # обычно единственный вызов (COUNT, MIN, строка по id) — считаем запрос завершённым
+        t0 = _clock()
+        row = await self._cursor.fetchone()
+        self._add(_clock() - t0, row is not None, True)
+        return row
+
+    async def fetchmany(self, size: Optional[int] = None):
+        t0 = _clock()
+        rows = await (self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany())
+        self._add(_clock() - t0, len(rows), not rows)
+        return rows
+
+    async def fetchall(self):
+        t0 = _clock()
+        rows = await self._cursor.fetchall()
+        self._add(_clock() - t0, len(rows), True)
+        return rows
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        while rows := await self.fetchmany(self._cursor.arraysize or 100):
+            for row in rows:
+                yield row
+
@@ -0,0 +1,169 @@
+# app/fsm_storage.py
+# FSM-хранилище aiogram: активные сессии живут в LRU в памяти (нажатие кнопки
+# не ходит в БД), изменения раз в FSM_FLUSH_SECONDS пачкой пишутся в fsm_state.
+# После перезапуска сессия подтягивается из БД при первом обращении.
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from .config import FSM_CACHE_SIZE, FSM_TTL_SECONDS, FSM_FLUSH_SECONDS
+from .db import db_conn
+
+log = logging.getLogger(__name__)
+
+_UPSERT_SQL = (
+    "INSERT INTO fsm_state (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(key) DO UPDATE SET state=excluded.state, data=excluded.data, updated_at=excluded.updated_at"
+)
+
+
+class _Record:
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(self, state: Optional[str] = None, data: Optional[dict] = None, updated_at: int = 0):
+        self.state = state
+        self.data = data or {}
+        self.updated_at = updated_at
+
+    def empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+def _key(key: StorageKey) -> str:
+    return ":".join(str(v) if v is not None else "" for v in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+    ))
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, max_size: int = FSM_CACHE_SIZE, ttl: int = FSM_TTL_SECONDS,
+                 flush_interval: float = FSM_FLUSH_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._cache: OrderedDict[str, _Record] = OrderedDict()
+        self._dirty: dict[str, _Record] = {}  # ещё не записанные; пустая запись = удалить строку
+        self._flusher: Optional[asyncio.Task] = None
+        self._closed = False
+        self._expired_at = 0.0
+
+    # --- BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        rec = await self._get(_key(key))
+        rec.state = state.state if isinstance(state, State) else state
+        self._touch(_key(key), rec)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get(_key(key))).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        rec = await self._get(_key(key))
+        rec.data = data.copy()
+        self._touch(_key(key), rec)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get(_key(key))).data.copy()
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._flusher:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+        await self.flush()
+
+    # --- кэш ---
+
+    async def _get(self, k: str) -> _Record:
+        rec = self._cache.get(k)
+        if rec is None:
+            rec = self._dirty.get(k) or await self._load(k)
+            # пока ждали БД, сессию мог загрузить параллельный апдейт того же пользователя
+            rec = self._cache.get(k) or rec
+            self._put(k, rec)
+        else:
+            self._cache.move_to_end(k)
+        if rec.updated_at and rec.updated_at < int(time.time()) - self.ttl:
+            # брошенный мастер: начинаем с чистого листа, строку удалит flush
+            rec = _Record(updated_at=int(time.time()))
+            self._put(k, rec)
+            self._dirty[k] = rec
+        return rec
+
+    async def _load(self, k: str) -> _Record:
+        async with db_conn() as db:
+            cur = await db.execute("SELECT state, data, updated_at FROM fsm_state WHERE key=?", (k,))
+            r = await cur.fetchone()
+        if not r:
+            return _Record()
+        return _Record(r["state"], json.loads(r["data"]), r["updated_at"])
+
+    def _put(self, k: str, rec: _Record):
+        self._cache[k] = rec
+        self._cache.move_to_end(k)
+        while len(self._cache) > self.max_size:
+            # вытесняем самую давнюю; если она не записана — она ещё лежит в _dirty
+            self._cache.popitem(last=False)
+
+    def _touch(self, k: str, rec: _Record):
+        rec.updated_at = int(time.time())
+        self._put(k, rec)
+        self._dirty[k] = rec
+        if self._flusher is None and not self._closed:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    # --- запись в БД ---
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                await self._expire()
+            except Exception as e:
+                log.exception("fsm flush failed: %r", e)
+
+    async def flush(self) -> None:
+        """Записать накопленные изменения одной транзакцией."""
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        upserts, deletes = [], []
+        for k, rec in batch.items():
+            if rec.empty():
+                deletes.append((k,))
+            else:
+                upserts.append((k, rec.state, json.dumps(rec.data, ensure_ascii=False), rec.updated_at))
+        try:
+            async with db_conn() as db:
+                if deletes:
+                    await db.executemany("DELETE FROM fsm_state WHERE key=?", deletes)
+                if upserts:
+                    await db.executemany(_UPSERT_SQL, upserts)
+                await db.commit()
+        except Exception:
+            # вернуть в очередь, не затирая более свежие изменения
+            for k, rec in batch.items():
+                self._dirty.setdefault(k, rec)
+            raise
+
+    async def _expire(self):
+        """Раз в минуту: выкинуть из памяти и из БД сессии старше TTL."""
+        if time.monotonic() - self._expired_at < 60:
+            return
+        self._expired_at = time.monotonic()
+        cutoff = int(time.time()) - self.ttl
+        for k in [k for k, rec in self._cache.items() if rec.updated_at and rec.updated_at < cutoff]:
+            if k not in self._dirty:
+                del self._cache[k]
+        async with db_conn() as db:
+            await db.execute("DELETE FROM fsm_state WHERE updated_at < ?", (cutoff,))
+            await db.commit()
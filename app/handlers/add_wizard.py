@@ -8,8 +8,9 @@ from ..keyboards import (
     pre_reminder_kb, repeat_freq_kb, repeat_interval_kb, confirm_kb,
     categories_kb
 )
-from ..utils import now_local, to_iso, parse_local_dt, get_default_pre_offset
-from ..db import db_conn
+from ..utils import now_local, to_ts, get_default_pre_offset
+from ..repository import task_repo, NewTask
+from ..render import render
 from ..config import TZ
 from datetime import datetime
 
@@ -72,30 +73,26 @@ async def cb_catpick(call: CallbackQuery, state: FSMContext):
     cat = None if slug == "none" else cat_by_slug(slug)
     await state.update_data(category=cat)
     base_year = now_local().year
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nШаг 3/5. Выберите ГОД:")
-    await call.message.edit_reply_markup(reply_markup=years_kb(base_year))
+    await render(call.message, selection_preview(await state.get_data()) + "\nШаг 3/5. Выберите ГОД:", years_kb(base_year))
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data.startswith("y_nav:"))
 async def cb_year_nav(call: CallbackQuery, state: FSMContext):
     base = int(call.data.split(":")[1])
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nШаг 3/5. Выберите ГОД:")
-    await call.message.edit_reply_markup(reply_markup=years_kb(base))
+    await render(call.message, selection_preview(await state.get_data()) + "\nШаг 3/5. Выберите ГОД:", years_kb(base))
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data.startswith("y:"))
 async def cb_year(call: CallbackQuery, state: FSMContext):
     year = int(call.data.split(":")[1])
     await state.update_data(year=year, month=None, day=None, hour=None, minute=None)
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nВыберите МЕСЯЦ:")
-    await call.message.edit_reply_markup(reply_markup=months_kb())
+    await render(call.message, selection_preview(await state.get_data()) + "\nВыберите МЕСЯЦ:", months_kb())
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data == "back:year")
 async def cb_back_year(call: CallbackQuery, state: FSMContext):
     base_year = now_local().year
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nШаг 3/5. Выберите ГОД:")
-    await call.message.edit_reply_markup(reply_markup=years_kb(base_year))
+    await render(call.message, selection_preview(await state.get_data()) + "\nШаг 3/5. Выберите ГОД:", years_kb(base_year))
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data.startswith("m:"))
@@ -107,44 +104,38 @@ async def cb_month(call: CallbackQuery, state: FSMContext):
         return
     await state.update_data(month=month, day=None, hour=None, minute=None)
     y = data["year"]
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nВыберите ДЕНЬ:")
-    await call.message.edit_reply_markup(reply_markup=days_kb(y, month))
+    await render(call.message, selection_preview(await state.get_data()) + "\nВыберите ДЕНЬ:", days_kb(y, month))
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data == "back:month")
 async def cb_back_month(call: CallbackQuery, state: FSMContext):
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nВыберите МЕСЯЦ:")
-    await call.message.edit_reply_markup(reply_markup=months_kb())
+    await render(call.message, selection_preview(await state.get_data()) + "\nВыберите МЕСЯЦ:", months_kb())
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data.startswith("d:"))
 async def cb_day(call: CallbackQuery, state: FSMContext):
     day = int(call.data.split(":")[1])
     await state.update_data(day=day, hour=None, minute=None)
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nВыберите ЧАС:")
-    await call.message.edit_reply_markup(reply_markup=hours_kb())
+    await render(call.message, selection_preview(await state.get_data()) + "\nВыберите ЧАС:", hours_kb())
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data == "back:day")
 async def cb_back_day(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     y, m = data.get("year"), data.get("month")
-    await call.message.edit_text(selection_preview(data) + "\nВыберите ДЕНЬ:")
-    await call.message.edit_reply_markup(reply_markup=days_kb(y, m))
+    await render(call.message, selection_preview(data) + "\nВыберите ДЕНЬ:", days_kb(y, m))
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data.startswith("h:"))
 async def cb_hour(call: CallbackQuery, state: FSMContext):
     h = int(call.data.split(":")[1])
     await state.update_data(hour=h, minute=None)
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nВыберите МИНУТЫ:")
-    await call.message.edit_reply_markup(reply_markup=minutes_kb())
+    await render(call.message, selection_preview(await state.get_data()) + "\nВыберите МИНУТЫ:", minutes_kb())
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data == "back:hour")
 async def cb_back_hour(call: CallbackQuery, state: FSMContext):
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nВыберите ЧАС:")
-    await call.message.edit_reply_markup(reply_markup=hours_kb())
+    await render(call.message, selection_preview(await state.get_data()) + "\nВыберите ЧАС:", hours_kb())
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data.startswith("min:"))
@@ -152,15 +143,13 @@ async def cb_min(call: CallbackQuery, state: FSMContext):
     minute = int(call.data.split(":")[1])
     await state.update_data(minute=minute)
     default_pre = await get_default_pre_offset(call.from_user.id)
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nШаг 4/5. Пред-напоминание:")
-    await call.message.edit_reply_markup(reply_markup=pre_reminder_kb(default_pre))
+    await render(call.message, selection_preview(await state.get_data()) + "\nШаг 4/5. Пред-напоминание:", pre_reminder_kb(default_pre))
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data == "back:min")
 async def cb_back_min(call: CallbackQuery, state: FSMContext):
     await state.update_data(minute=None)
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nВыберите МИНУТЫ:")
-    await call.message.edit_reply_markup(reply_markup=minutes_kb())
+    await render(call.message, selection_preview(await state.get_data()) + "\nВыберите МИНУТЫ:", minutes_kb())
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data.startswith("pre:"))
@@ -168,15 +157,13 @@ async def cb_pre(call: CallbackQuery, state: FSMContext):
     val = call.data.split(":")[1]
     pre = None if val == "def" else int(val)
     await state.update_data(pre_offset=pre)
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nШаг 5/5. Повтор:")
-    await call.message.edit_reply_markup(reply_markup=repeat_freq_kb())
+    await render(call.message, selection_preview(await state.get_data()) + "\nШаг 5/5. Повтор:", repeat_freq_kb())
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data == "back:pre")
 async def cb_back_pre(call: CallbackQuery, state: FSMContext):
     default_pre = await get_default_pre_offset(call.from_user.id)
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nШаг 4/5. Пред-напоминание:")
-    await call.message.edit_reply_markup(reply_markup=pre_reminder_kb(default_pre))
+    await render(call.message, selection_preview(await state.get_data()) + "\nШаг 4/5. Пред-напоминание:", pre_reminder_kb(default_pre))
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data.startswith("rep:"))
@@ -184,36 +171,31 @@ async def cb_rep_freq(call: CallbackQuery, state: FSMContext):
     freq = call.data.split(":")[1]
     if freq == "NONE":
         await state.update_data(rrule_freq=None, rrule_interval=None)
-        await call.message.edit_text(selection_preview(await state.get_data()) + "\nПроверить и сохранить?")
-        await call.message.edit_reply_markup(reply_markup=confirm_kb())
+        await render(call.message, selection_preview(await state.get_data()) + "\nПроверить и сохранить?", confirm_kb())
         await call.answer()
         return
     await state.update_data(rrule_freq=freq, rrule_interval=None)
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nВыберите интервал (1–4):")
-    await call.message.edit_reply_markup(reply_markup=repeat_interval_kb())
+    await render(call.message, selection_preview(await state.get_data()) + "\nВыберите интервал (1–4):", repeat_interval_kb())
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data == "back:repfreq")
 async def cb_back_repfreq(call: CallbackQuery, state: FSMContext):
     await state.update_data(rrule_interval=None)
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nШаг 5/5. Повтор:")
-    await call.message.edit_reply_markup(reply_markup=repeat_freq_kb())
+    await render(call.message, selection_preview(await state.get_data()) + "\nШаг 5/5. Повтор:", repeat_freq_kb())
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data.startswith("repint:"))
 async def cb_rep_int(call: CallbackQuery, state: FSMContext):
     interval = int(call.data.split(":")[1])
     await state.update_data(rrule_interval=interval)
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nПроверить и сохранить?")
-    await call.message.edit_reply_markup(reply_markup=confirm_kb())
+    await render(call.message, selection_preview(await state.get_data()) + "\nПроверить и сохранить?", confirm_kb())
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data == "due_skip")
 async def cb_due_skip(call: CallbackQuery, state: FSMContext):
     await state.update_data(year=None, month=None, day=None, hour=None, minute=None)
     default_pre = await get_default_pre_offset(call.from_user.id)
-    await call.message.edit_text(selection_preview(await state.get_data()) + "\nШаг 4/5. Пред-напоминание:")
-    await call.message.edit_reply_markup(reply_markup=pre_reminder_kb(default_pre))
+    await render(call.message, selection_preview(await state.get_data()) + "\nШаг 4/5. Пред-напоминание:", pre_reminder_kb(default_pre))
     await call.answer()
 
 @router.callback_query(AddTask.picking_due, F.data == "save_task")
@@ -232,26 +214,18 @@ async def cb_save(call: CallbackQuery, state: FSMContext):
     if rf and rf != "NONE":
         rrule = f"FREQ={rf};INTERVAL={ri or 1}"
 
-    async with db_conn() as db:
-        await db.execute(
-            "INSERT INTO tasks (user_id, title, category, due_at, is_done, created_at, reminded_at, pre_offset_minutes, pre_reminded_at, rrule) "
-            "VALUES (?, ?, ?, ?, 0, ?, NULL, ?, NULL, ?)",
-            (
-                call.from_user.id,
-                title,
-                data.get("category"),
-                to_iso(due_dt),
-                to_iso(now_local()),
-                pre,
-                rrule
-            )
-        )
-        await db.commit()
+    await task_repo().create(NewTask(
+        user_id=call.from_user.id,
+        title=title,
+        category=data.get("category"),
+        due_at=to_ts(due_dt),
+        pre_offset_minutes=pre,
+        rrule=rrule,
+    ))
 
     await state.clear()
     try:
-        await call.message.edit_text("Задача добавлена ✅")
-        await call.message.edit_reply_markup(reply_markup=None)
+        await render(call.message, "Задача добавлена ✅")
     except Exception:
         await call.message.answer("Задача добавлена ✅", reply_markup=None)
     await call.answer()
@@ -260,8 +234,7 @@ async def cb_save(call: CallbackQuery, state: FSMContext):
 async def cb_cancel(call: CallbackQuery, state: FSMContext):
     await state.clear()
     try:
-        await call.message.edit_text("Отменено.")
-        await call.message.edit_reply_markup(reply_markup=None)
+        await render(call.message, "Отменено.")
     except Exception:
         await call.message.answer("Отменено.")
     await call.answer()
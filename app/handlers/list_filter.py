@@ -1,51 +1,153 @@
-import asyncio
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
+from ..config import CATEGORIES
 from ..db import db_conn
-from ..keyboards import filter_kb, inline_per_task_actions
-from ..utils import pretty_task, cat_by_slug
+from ..keyboards import filter_kb, inline_per_task_actions, list_page_kb
+from ..render import render
+from ..repository import task_repo
+from ..utils import (
+    pretty_task, render_cards, pack_messages, text_len, cat_by_slug, cat_slug, from_ts, now_ts, CARD_SEP, MAX_MESSAGE,
+)
 
 router = Router()
 
+PAGE_SIZE = 10
+HISTORY_SIZE = 20
+
 @router.message(Command("list"))
 async def cmd_list(message: Message):
     await message.answer("Выберите категорию:", reply_markup=filter_kb())
 
-@router.callback_query(F.data.startswith("qfilter:"))
-async def cb_qfilter(call: CallbackQuery):
-    slug = call.data.split(":")[1]
-    where = "user_id=? AND is_done=0"
-    params = [call.from_user.id]
-
-    if slug != "all":
-        name = cat_by_slug(slug)
-        if name is None:
-            await call.answer("Неизвестная категория", show_alert=True)
-            return
-        where += " AND category=?"
-        params.append(name)
-
-    query = f"SELECT * FROM tasks WHERE {where} ORDER BY due_at IS NULL, due_at ASC, id DESC"
-    async with db_conn() as db:
-        cur = await db.execute(query, params)
-        rows = await cur.fetchall()
+@router.callback_query(F.data == "lfilter")
+async def cb_lfilter(call: CallbackQuery):
+    try:
+        await render(call.message, "Выберите категорию:", filter_kb())
+    except Exception:
+        pass
+    await call.answer()
 
+# ---------- фильтр в callback_data ----------
+# "a" — все категории, иначе индекс в CATEGORIES (slug в кириллице съедает лимит 64 байта)
+
+def _filter_code(slug: str) -> str | None:
+    if slug == "all":
+        return "a"
+    for i, c in enumerate(CATEGORIES):
+        if cat_slug(c) == slug:
+            return str(i)
+    return None
+
+def _filter_title(code: str) -> str:
+    return "Все категории" if code == "a" else f"Категория: {CATEGORIES[int(code)]}"
+
+def _cursor(r) -> str:
+    return f"{'-' if r['due_at'] is None else r['due_at']}:{r['id']}"
+
+async def _load_page(user_id: int, code: str, direction: str = "f", ts: str = "-", task_id: int = 0):
+    """direction: f — первая страница, n — после курсора, p — перед курсором."""
+    category = None if code == "a" else CATEGORIES[int(code)]
+    cursor = (None if ts == "-" else int(ts), task_id)
+    rows = await task_repo().list_page(user_id, category, direction, cursor, PAGE_SIZE + 1)
+
+    more = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+    if direction == "p":
+        rows.reverse()
+        return rows, more, True
+    return rows, direction == "n", more
+
+def _render_page(code: str, rows, has_prev: bool, has_next: bool):
+    header = f"{_filter_title(code)}:\n\n"
+    body, shown = pack_messages(render_cards(rows), CARD_SEP, MAX_MESSAGE - text_len(header))[0]
+    if shown < len(rows):
+        # не влезло в одно сообщение — остальные карточки уйдут на следующую страницу
+        rows, has_next = rows[:shown], True
+    text = header + body
+    prev_cur = f"{code}:p:{_cursor(rows[0])}" if has_prev else None
+    next_cur = f"{code}:n:{_cursor(rows[-1])}" if has_next else None
+    items = [(r["id"], r["title"]) for r in rows]
+    return text, list_page_kb(code, items, prev_cur, next_cur)
+
+async def _show_page(call: CallbackQuery, code: str, direction: str = "f", ts: str = "-", task_id: int = 0):
+    rows, has_prev, has_next = await _load_page(call.from_user.id, code, direction, ts, task_id)
     if not rows:
-        await call.message.edit_text("Задач нет для выбранного фильтра.")
-        await call.message.edit_reply_markup(reply_markup=filter_kb())
-        await call.answer()
+        if direction != "f":
+            # курсор устарел (задачи закрыты/удалены) — начинаем сначала
+            return await _show_page(call, code)
+        text, kb = "Задач нет для выбранного фильтра.", filter_kb()
+    else:
+        text, kb = _render_page(code, rows, has_prev, has_next)
+    try:
+        await render(call.message, text, kb)
+    except Exception:
+        pass
+    await call.answer()
+
+@router.callback_query(F.data.startswith("qfilter:"))
+async def cb_qfilter(call: CallbackQuery):
+    code = _filter_code(call.data.split(":")[1])
+    if code is None:
+        await call.answer("Неизвестная категория", show_alert=True)
         return
+    await _show_page(call, code)
+
+@router.callback_query(F.data.startswith("lp:"))
+async def cb_list_page(call: CallbackQuery):
+    # lp:<фильтр>:<n|p>:<ts срока или ->:<id>
+    _, code, direction, ts, sid = call.data.split(":")
+    await _show_page(call, code, direction, ts, int(sid))
 
-    title = "Все категории" if slug == "all" else f"Категория: {cat_by_slug(slug)}"
+@router.callback_query(F.data.startswith("lcard:"))
+async def cb_list_card(call: CallbackQuery):
+    _, code, sid = call.data.split(":")
+    task_id = int(sid)
+    row = await task_repo().get(call.from_user.id, task_id)
+    if not row:
+        await call.answer("Задача не найдена", show_alert=True)
+        return
+    kb = inline_per_task_actions(task_id, back_to=f"qfilter:{'all' if code == 'a' else cat_slug(CATEGORIES[int(code)])}")
     try:
-        await call.message.edit_text(f"{title}. Открытых задач: {len(rows)}")
-        await call.message.edit_reply_markup(reply_markup=filter_kb())
+        await render(call.message, pretty_task(row), kb)
     except Exception:
         pass
+    await call.answer()
 
-    for r in rows:
-        await call.message.answer(pretty_task(r), reply_markup=inline_per_task_actions(r["id"]))
-        await asyncio.sleep(0.05)  # мягкий троттлинг
+# ---------- история выполненных ----------
+# Недавно выполненные лежат в tasks, старые — в tasks_archive (app/archive.py);
+# /history читает обе таблицы по индексам (user_id, done_at).
 
-    await call.answer()
+_HISTORY_SQL = (
+    "SELECT id, title, category, done_at FROM ("
+    " SELECT id, title, category, done_at FROM tasks WHERE user_id=? AND is_done=1"
+    " UNION ALL SELECT id, title, category, done_at FROM tasks_archive WHERE user_id=?"
+    ") ORDER BY done_at DESC LIMIT ?"
+)
+_HISTORY_STATS_SQL = (
+    "SELECT COUNT(*) AS total, IFNULL(SUM(done_at >= ?), 0) AS week, IFNULL(SUM(done_at >= ?), 0) AS month FROM ("
+    " SELECT done_at FROM tasks WHERE user_id=? AND is_done=1"
+    " UNION ALL SELECT done_at FROM tasks_archive WHERE user_id=?"
+    ")"
+)
+
+@router.message(Command("history"))
+async def cmd_history(message: Message):
+    uid = message.from_user.id
+    now = now_ts()
+    async with db_conn() as db:
+        cur = await db.execute(_HISTORY_STATS_SQL, (now - 7 * 86400, now - 30 * 86400, uid, uid))
+        stats = await cur.fetchone()
+        cur = await db.execute(_HISTORY_SQL, (uid, uid, HISTORY_SIZE))
+        rows = await cur.fetchall()
+    if not rows:
+        await message.answer("Выполненных задач пока нет.")
+        return
+    header = (f"✅ Выполнено: {stats['total']} (за 7 дней — {stats['week']}, за 30 дней — {stats['month']})\n\n"
+              f"Последние {len(rows)}:\n")
+    lines = []
+    for r in rows:
+        when = from_ts(r["done_at"]).strftime("%d.%m.%Y %H:%M") if r["done_at"] is not None else "—"
+        cat = f" 🏷 {r['category']}" if r["category"] else ""
+        lines.append(f"#{r['id']} {r['title']}{cat} — {when}")
+    body, _ = pack_messages(lines, "\n", MAX_MESSAGE - text_len(header))[0]
+    await message.answer(header + body)
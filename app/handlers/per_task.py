@@ -1,10 +1,12 @@
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
-from ..db import db_conn
-from ..utils import parse_local_dt, to_iso, pretty_task
-from ..models import next_occurrence, parse_rrule
+from ..utils import to_ts, format_ts, pretty_task
+from ..models import compile_rrule
 from ..keyboards import inline_per_task_actions
+from ..render import render
+from ..reminders import parse_offsets, SNOOZE_MINUTES
+from ..repository import task_repo
 from ..quick_due import make_due_today, make_due_tomorrow, make_due_this_week
 
 router = Router()
@@ -22,27 +24,16 @@ async def cb_quick_due(call: CallbackQuery):
     else:
         new_dt = make_due_this_week(); label = "на этой неделе"
 
-    async with db_conn() as db:
-        cur = await db.execute("SELECT * FROM tasks WHERE id=? AND user_id=?", (task_id, call.from_user.id))
-        row = await cur.fetchone()
-        if not row:
-            await call.answer("Задача не найдена", show_alert=True)
-            return
-
-        await db.execute(
-            "UPDATE tasks SET due_at=?, reminded_at=NULL, pre_reminded_at=NULL WHERE id=?",
-            (to_iso(new_dt), task_id)
-        )
-        cur = await db.execute("SELECT * FROM tasks WHERE id=?", (task_id,))
-        updated = await cur.fetchone()
-        await db.commit()
+    updated = await task_repo().reschedule(call.from_user.id, task_id, to_ts(new_dt))
+    if not updated:
+        await call.answer("Задача не найдена", show_alert=True)
+        return
 
     try:
-        await call.message.edit_text(pretty_task(updated))
-        await call.message.edit_reply_markup(reply_markup=inline_per_task_actions(task_id))
+        await render(call.message, pretty_task(updated), inline_per_task_actions(task_id))
     except Exception:
         pass
-    await call.answer(f"Срок установлен {label} ({updated['due_at']})")
+    await call.answer(f"Срок установлен {label} ({format_ts(updated['due_at'])})")
 
 # Категории на карточке
 from ..keyboards import categories_kb
@@ -51,13 +42,11 @@ from ..utils import cat_by_slug
 @router.callback_query(F.data.startswith("catmenu:"))
 async def cb_catmenu(call: CallbackQuery):
     task_id = int(call.data.split(":")[1])
-    async with db_conn() as db:
-        cur = await db.execute("SELECT * FROM tasks WHERE id=? AND user_id=?", (task_id, call.from_user.id))
-        row = await cur.fetchone()
-        if not row:
-            await call.answer("Задача не найдена", show_alert=True)
-            return
-    await call.message.edit_reply_markup(reply_markup=categories_kb(for_task_id=task_id))
+    if not await task_repo().get(call.from_user.id, task_id):
+        await call.answer("Задача не найдена", show_alert=True)
+        return
+    # через render, чтобы кэш знал, что на карточке сейчас клавиатура категорий
+    await render(call.message, call.message.text, categories_kb(for_task_id=task_id))
     await call.answer("Выберите категорию")
 
 @router.callback_query(F.data.startswith("catset:"))
@@ -66,15 +55,13 @@ async def cb_catset(call: CallbackQuery):
     task_id = int(sid)
     value = None if slug == "none" else cat_by_slug(slug)
 
-    async with db_conn() as db:
-        await db.execute("UPDATE tasks SET category=? WHERE id=? AND user_id=?", (value, task_id, call.from_user.id))
-        cur = await db.execute("SELECT * FROM tasks WHERE id=?", (task_id,))
-        updated = await cur.fetchone()
-        await db.commit()
+    updated = await task_repo().set_category(call.from_user.id, task_id, value)
+    if not updated:
+        await call.answer("Задача не найдена", show_alert=True)
+        return
 
     try:
-        await call.message.edit_text(pretty_task(updated))
-        await call.message.edit_reply_markup(reply_markup=inline_per_task_actions(task_id))
+        await render(call.message, pretty_task(updated), inline_per_task_actions(task_id))
     except Exception:
         pass
     await call.answer("Категория обновлена")
@@ -100,23 +87,50 @@ async def cmd_delete_cmd(message: Message):
 async def cmd_repeat(message: Message):
     parts = message.text.strip().split(maxsplit=2)
     if len(parts) < 3 or not parts[1].isdigit():
-        await message.answer("Использование: /repeat <id> <RRULE>, напр.: /repeat 12 FREQ=WEEKLY;INTERVAL=2")
+        await message.answer("Использование: /repeat <id> <RRULE>, напр.: /repeat 12 FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH")
         return
     task_id = int(parts[1])
-    rrule = parts[2].upper().strip()
-    if not parse_rrule(rrule):
-        await message.answer("Некорректный RRULE. Допустимо: FREQ=DAILY|WEEKLY|MONTHLY и INTERVAL=n")
+    rule = compile_rrule(parts[2].upper().strip())
+    if not rule:
+        await message.answer(
+            "Некорректный RRULE. Допустимо: FREQ=DAILY|WEEKLY|MONTHLY|YEARLY, INTERVAL=n, "
+            "BYDAY=MO,TU,… (для WEEKLY), COUNT=n, UNTIL=ГГГГММДД"
+        )
+        return
+    rrule = str(rule)
+    if not await task_repo().set_rrule(message.from_user.id, task_id, rrule):
+        await message.answer("Задача не найдена.")
         return
-    async with db_conn() as db:
-        cur = await db.execute("SELECT * FROM tasks WHERE id=? AND user_id=?", (task_id, message.from_user.id))
-        row = await cur.fetchone()
-        if not row:
-            await message.answer("Задача не найдена.")
-            return
-        await db.execute("UPDATE tasks SET rrule=? WHERE id=?", (rrule, task_id))
-        await db.commit()
     await message.answer(f"Повторение для задачи #{task_id} установлено: {rrule}")
 
+@router.message(Command("pre"))
+async def cmd_pre(message: Message):
+    parts = message.text.strip().split(maxsplit=2)
+    if len(parts) < 3 or not parts[1].isdigit():
+        await message.answer("Использование: /pre <id> <минуты,...>, напр.: /pre 12 1440,60 (или /pre 12 def)")
+        return
+    task_id = int(parts[1])
+    if parts[2].strip().lower() == "def":
+        offsets = None
+    else:
+        parsed = parse_offsets(parts[2])
+        if not parsed:
+            await message.answer("Укажите положительные минуты через запятую, напр.: 1440,60")
+            return
+        offsets = ",".join(str(m) for m in parsed)
+    if not await task_repo().set_pre_offsets(message.from_user.id, task_id, offsets):
+        await message.answer("Задача не найдена.")
+        return
+    await message.answer(f"Пред-напоминания для задачи #{task_id}: {offsets or 'по умолчанию'}")
+
+@router.callback_query(F.data.startswith("snooze:"))
+async def cb_snooze(call: CallbackQuery):
+    task_id = int(call.data.split(":")[1])
+    if await task_repo().snooze(call.from_user.id, task_id) is None:
+        await call.answer("Задача не найдена", show_alert=True)
+        return
+    await call.answer(f"Напомню через {SNOOZE_MINUTES} мин")
+
 @router.callback_query(F.data.startswith("done:"))
 async def cb_done(call: CallbackQuery):
     task_id = int(call.data.split(":")[1])
@@ -130,46 +144,25 @@ async def cb_del(call: CallbackQuery):
     await call.answer("Удалено")
 
 async def handle_done(user_id: int, task_id: int, msg_obj, edit: bool = False):
-    async with db_conn() as db:
-        cur = await db.execute("SELECT * FROM tasks WHERE id=? AND user_id=?", (task_id, user_id))
-        row = await cur.fetchone()
-        if not row:
-            await msg_obj.answer("Задача не найдена.")
-            return
-
-        rrule = row["rrule"]
-        due_at = parse_local_dt(row["due_at"]) if row["due_at"] else None
-
-        if rrule and due_at:
-            nxt = next_occurrence(due_at, rrule)
-            if nxt is None:
-                await db.execute("UPDATE tasks SET is_done=1 WHERE id=?", (task_id,))
-            else:
-                await db.execute(
-                    "UPDATE tasks SET due_at=?, is_done=0, reminded_at=NULL, pre_reminded_at=NULL WHERE id=?",
-                    (to_iso(nxt), task_id)
-                )
-        else:
-            await db.execute("UPDATE tasks SET is_done=1 WHERE id=?", (task_id,))
-        await db.commit()
+    if not await task_repo().complete(user_id, task_id):
+        await msg_obj.answer("Задача не найдена.")
+        return
 
     text = f"Задача #{task_id}: ✅ выполнено"
     if edit and msg_obj:
         try:
-            await msg_obj.edit_text(text)
+            await render(msg_obj, text)
         except Exception:
             await msg_obj.answer(text)
     else:
         await msg_obj.answer(text)
 
 async def handle_delete(user_id: int, task_id: int, msg_obj, edit: bool = False):
-    async with db_conn() as db:
-        await db.execute("DELETE FROM tasks WHERE id=? AND user_id=?", (task_id, user_id))
-        await db.commit()
+    await task_repo().delete(user_id, task_id)
     text = f"Задача #{task_id}: 🗑 удалена"
     if edit and msg_obj:
         try:
-            await msg_obj.edit_text(text)
+            await render(msg_obj, text)
         except Exception:
             await msg_obj.answer(text)
     else:
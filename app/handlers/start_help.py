@@ -3,9 +3,14 @@ from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 from aiogram.utils.markdown import code
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from ..keyboards import main_kb
-from ..utils import get_default_pre_offset, set_default_pre_offset
+from ..utils import (
+    get_default_pre_offset, set_default_pre_offset,
+    get_digest_settings, set_user_tz, set_digest_hour
+)
+from ..timer_queue import reminder_queue
 
 router = Router()
 
@@ -17,9 +22,11 @@ async def cmd_start(message: Message):
         "• /add — добавить задачу (инлайн-мастер)\n"
         "• /list — список с фильтром по категориям\n"
         "• /done <id> — выполнить\n"
+        "• /history — выполненные задачи и статистика\n"
         "• /delete <id> — удалить\n"
         "• /repeat <id> <RRULE> — задать повтор\n"
-        "• /settings — дефолт пред-напоминания\n"
+        "• /pre <id> <минуты,...> — пред-напоминания, напр. 1440,60\n"
+        "• /settings — дефолт пред-напоминания, часовой пояс и час сводки\n"
         "• /help — помощь",
         reply_markup=main_kb()
     )
@@ -28,20 +35,46 @@ async def cmd_start(message: Message):
 async def cmd_help(message: Message):
     await message.answer(
         "➕ /add — текст → категория → год → месяц → день → час → минуты (0/10/20/30/40/50) → пред-напоминание → повтор → сохранить.\n"
-        "📋 /list — выберите категорию, затем получите карточки с быстрыми кнопками сроков.\n"
+        "📋 /list — выберите категорию: задачи по 10 на странице (◀/▶), нажмите на задачу — карточка с быстрыми кнопками сроков.\n"
         "⏰ Напоминания приходят в срок; 🔔 пред-напоминания — за N минут.\n"
-        "🗓 Сводка — ежедневно в 09:00 (Asia/Tashkent)."
+        "🗓 Сводка — ежедневно в 09:00 (Asia/Tashkent); поменять: /tz <пояс>, /digest <час>."
     )
 
 @router.message(Command("settings"))
 async def cmd_settings(message: Message):
     minutes = await get_default_pre_offset(message.from_user.id)
     cur = minutes if minutes is not None else "не задан"
+    tz, hour = await get_digest_settings(message.from_user.id)
     await message.answer(
         f"Текущий дефолт пред-напоминания: {cur}\n"
-        "Установить: /setpre 0 | /setpre 10 | /setpre 30 | /setpre 60"
+        "Установить: /setpre 0 | /setpre 10 | /setpre 30 | /setpre 60\n\n"
+        f"Сводка: {hour:02d}:00, часовой пояс {tz}\n"
+        "Установить: /tz Europe/Moscow | /digest 8"
     )
 
+@router.message(Command("tz"))
+async def cmd_tz(message: Message):
+    parts = message.text.strip().split()
+    if len(parts) != 2:
+        await message.answer("Использование: /tz <часовой пояс>, напр.: /tz Europe/Moscow")
+        return
+    try:
+        tz = ZoneInfo(parts[1])
+    except (ZoneInfoNotFoundError, ValueError):
+        await message.answer("Неизвестный часовой пояс. Пример: Asia/Tashkent, Europe/Moscow")
+        return
+    await set_user_tz(message.from_user.id, tz.key)
+    await message.answer(f"Часовой пояс сводки: {tz.key}")
+
+@router.message(Command("digest"))
+async def cmd_digest(message: Message):
+    parts = message.text.strip().split()
+    if len(parts) != 2 or not parts[1].isdigit() or not (0 <= int(parts[1]) <= 23):
+        await message.answer("Использование: /digest <час 0..23>")
+        return
+    await set_digest_hour(message.from_user.id, int(parts[1]))
+    await message.answer(f"Сводка будет приходить в {int(parts[1]):02d}:00 по вашему часовому поясу.")
+
 @router.message(Command("setpre"))
 async def cmd_setpre(message: Message):
     parts = message.text.strip().split()
@@ -52,7 +85,7 @@ async def cmd_setpre(message: Message):
     if not (0 <= minutes <= 1440):
         await message.answer("Минуты должны быть 0..1440")
         return
-    await set_default_pre_offset(message.from_user.id, minutes)
+    reminder_queue.notify(await set_default_pre_offset(message.from_user.id, minutes))
     await message.answer(f"Дефолт пред-напоминания: {minutes} мин.")
 
 # Текстовые кнопки главного меню
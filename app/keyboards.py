@@ -1,4 +1,10 @@
-from typing import Optional
+# app/keyboards.py
+# Клавиатуры строим один раз: статичные кэшируются целиком, параметризованные —
+# в ограниченных LRU. Разметка aiogram изменяемая (MutableTelegramObject), поэтому
+# из кэша вызывающий получает копию со своими рядами и кнопками — правка одной
+# клавиатуры не утечёт в чужие чаты; копия втрое дешевле построения (bench.keyboards_bench).
+from functools import lru_cache, wraps
+from typing import Optional, Union
 from aiogram.types import (
     ReplyKeyboardMarkup, KeyboardButton,
     InlineKeyboardMarkup, InlineKeyboardButton
@@ -6,6 +12,28 @@ from aiogram.types import (
 from .config import CATEGORIES
 from .utils import _days_in_month, cat_slug
 
+Markup = Union[InlineKeyboardMarkup, ReplyKeyboardMarkup]
+
+def _fresh(markup: Markup) -> Markup:
+    """Копия: новые списки рядов и копии кнопок (у наших кнопок только строковые поля)."""
+    field = "inline_keyboard" if isinstance(markup, InlineKeyboardMarkup) else "keyboard"
+    rows = [[b.model_copy() for b in row] for row in getattr(markup, field)]
+    return markup.model_copy(update={field: rows})
+
+def cached_kb(maxsize: Optional[int] = None):
+    """lru_cache построенной клавиатуры, каждый вызов — своя копия (_fresh)."""
+    def decorate(build):
+        cached = lru_cache(maxsize=maxsize)(build)
+
+        @wraps(build)
+        def get(*args, **kwargs):
+            return _fresh(cached(*args, **kwargs))
+        get.cache_clear = cached.cache_clear
+        get.cache_info = cached.cache_info
+        return get
+    return decorate
+
+@cached_kb()
 def main_kb():
     return ReplyKeyboardMarkup(
         keyboard=[
@@ -17,6 +45,7 @@ def main_kb():
         resize_keyboard=True,
     )
 
+@cached_kb(64)
 def years_kb(base_year: int) -> InlineKeyboardMarkup:
     y = base_year
     buttons = [[InlineKeyboardButton(text=str(y+i), callback_data=f"y:{y+i}") for i in range(0, 3)]]
@@ -28,6 +57,7 @@ def years_kb(base_year: int) -> InlineKeyboardMarkup:
     buttons.append(nav)
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+@cached_kb()
 def months_kb() -> InlineKeyboardMarkup:
     rows = []
     for r in range(0, 12, 3):
@@ -36,7 +66,11 @@ def months_kb() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 def days_kb(year: int, month: int) -> InlineKeyboardMarkup:
-    total = _days_in_month(year, month)
+    # вариантов всего четыре: 28, 29, 30 и 31 день
+    return _days_kb(_days_in_month(year, month))
+
+@cached_kb()
+def _days_kb(total: int) -> InlineKeyboardMarkup:
     buttons, row = [], []
     for d in range(1, total+1):
         row.append(InlineKeyboardButton(text=str(d), callback_data=f"d:{d}"))
@@ -47,6 +81,7 @@ def days_kb(year: int, month: int) -> InlineKeyboardMarkup:
     buttons.append([InlineKeyboardButton(text="◀ Месяц", callback_data="back:month")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+@cached_kb()
 def hours_kb() -> InlineKeyboardMarkup:
     buttons = []
     for r in range(0, 24, 6):
@@ -54,6 +89,7 @@ def hours_kb() -> InlineKeyboardMarkup:
     buttons.append([InlineKeyboardButton(text="◀ День", callback_data="back:day")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+@cached_kb()
 def minutes_kb() -> InlineKeyboardMarkup:
     opts = [0,10,20,30,40,50]
     rows = [
@@ -63,6 +99,7 @@ def minutes_kb() -> InlineKeyboardMarkup:
     rows.append([InlineKeyboardButton(text="◀ Час", callback_data="back:hour")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
+@cached_kb(256)
 def pre_reminder_kb(default_minutes: Optional[int]) -> InlineKeyboardMarkup:
     row1 = [
         InlineKeyboardButton(text=f"Default ({default_minutes if default_minutes is not None else '—'})", callback_data="pre:def"),
@@ -76,6 +113,7 @@ def pre_reminder_kb(default_minutes: Optional[int]) -> InlineKeyboardMarkup:
     back = [InlineKeyboardButton(text="◀ Минуты", callback_data="back:min")]
     return InlineKeyboardMarkup(inline_keyboard=[row1, row2, back])
 
+@cached_kb()
 def repeat_freq_kb() -> InlineKeyboardMarkup:
     row1 = [
         InlineKeyboardButton(text="Без повтора", callback_data="rep:NONE"),
@@ -86,17 +124,20 @@ def repeat_freq_kb() -> InlineKeyboardMarkup:
     back = [InlineKeyboardButton(text="◀ Пред-напоминание", callback_data="back:pre")]
     return InlineKeyboardMarkup(inline_keyboard=[row1, back])
 
+@cached_kb()
 def repeat_interval_kb() -> InlineKeyboardMarkup:
     row = [InlineKeyboardButton(text=str(i), callback_data=f"repint:{i}") for i in range(1,5)]
     back = [InlineKeyboardButton(text="◀ Частота", callback_data="back:repfreq")]
     return InlineKeyboardMarkup(inline_keyboard=[row, back])
 
+@cached_kb()
 def confirm_kb() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[[
         InlineKeyboardButton(text="💾 Сохранить", callback_data="save_task"),
         InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_task"),
     ]])
 
+@cached_kb(1024)
 def categories_kb(for_task_id: int | None = None) -> InlineKeyboardMarkup:
     rows, row = [], []
     for i, c in enumerate(CATEGORIES, 1):
@@ -112,6 +153,7 @@ def categories_kb(for_task_id: int | None = None) -> InlineKeyboardMarkup:
         rows.append([InlineKeyboardButton(text="Снять категорию", callback_data=f"catset:{for_task_id}:none")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
+@cached_kb()
 def filter_kb() -> InlineKeyboardMarkup:
     head = [InlineKeyboardButton(text="Все", callback_data="qfilter:all")]
     cat_buttons = [InlineKeyboardButton(text=c, callback_data=f"qfilter:{cat_slug(c)}") for c in CATEGORIES]
@@ -123,14 +165,37 @@ def filter_kb() -> InlineKeyboardMarkup:
             rows.append(chunk)
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
+@cached_kb(4096)
 def inline_task_actions(task_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[[
         InlineKeyboardButton(text="✅ Сделано", callback_data=f"done:{task_id}"),
+        InlineKeyboardButton(text="⏰ +1 ч", callback_data=f"snooze:{task_id}"),
         InlineKeyboardButton(text="🗑 Удалить", callback_data=f"del:{task_id}")
     ]])
 
-def inline_per_task_actions(task_id: int) -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[
+def list_page_kb(code: str, items: list[tuple[int, str]],
+                 prev_cursor: Optional[str], next_cursor: Optional[str]) -> InlineKeyboardMarkup:
+    """items: [(task_id, title)] текущей страницы; курсоры — хвост callback_data 'lp:'."""
+    rows, row = [], []
+    for task_id, title in items:
+        short = title if len(title) <= 20 else title[:19] + "…"
+        row.append(InlineKeyboardButton(text=f"#{task_id} {short}", callback_data=f"lcard:{code}:{task_id}"))
+        if len(row) == 2:
+            rows.append(row); row = []
+    if row:
+        rows.append(row)
+    nav = []
+    if prev_cursor:
+        nav.append(InlineKeyboardButton(text="◀", callback_data=f"lp:{prev_cursor}"))
+    nav.append(InlineKeyboardButton(text="🔎 Фильтр", callback_data="lfilter"))
+    if next_cursor:
+        nav.append(InlineKeyboardButton(text="▶", callback_data=f"lp:{next_cursor}"))
+    rows.append(nav)
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+@cached_kb(4096)
+def inline_per_task_actions(task_id: int, back_to: Optional[str] = None) -> InlineKeyboardMarkup:
+    rows = [
         [
             InlineKeyboardButton(text="📅 На сегодня", callback_data=f"qdue:today:{task_id}"),
             InlineKeyboardButton(text="📆 На завтра", callback_data=f"qdue:tom:{task_id}"),
@@ -143,4 +208,7 @@ def inline_per_task_actions(task_id: int) -> InlineKeyboardMarkup:
             InlineKeyboardButton(text="✅ Сделано", callback_data=f"done:{task_id}"),
             InlineKeyboardButton(text="🗑 Удалить", callback_data=f"del:{task_id}")
         ]
-    ])
+    ]
+    if back_to:
+        rows.append([InlineKeyboardButton(text="◀ К списку", callback_data=back_to)])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
@@ -0,0 +1,35 @@
+# app/leases.py
+# Аренды (leases) для нескольких процессов бота на одной БД: задание планировщика
+# выполняет только владелец аренды. Владелец продлевает её при каждом запуске;
+# если он пропал, после expires_at аренду забирает другой процесс.
+import os
+import socket
+
+from .db import db_conn
+from .utils import now_ts
+
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_ACQUIRE_SQL = (
+    "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+    "ON CONFLICT(name) DO UPDATE SET owner=excluded.owner, expires_at=excluded.expires_at "
+    "WHERE leases.owner=excluded.owner OR leases.expires_at < ? "
+    "RETURNING owner"
+)
+
+
+async def acquire_lease(name: str, ttl: int, owner: str = INSTANCE_ID) -> bool:
+    """Взять или продлить аренду одним атомарным upsert; False — она у другого процесса."""
+    now = now_ts()
+    async with db_conn() as db:
+        cur = await db.execute(_ACQUIRE_SQL, (name, owner, now + ttl, now))
+        rows = await cur.fetchall()
+        await db.commit()
+    return bool(rows)
+
+
+async def release_lease(name: str, owner: str = INSTANCE_ID) -> None:
+    """Отдать аренду при остановке, чтобы другой процесс не ждал истечения ttl."""
+    async with db_conn() as db:
+        await db.execute("DELETE FROM leases WHERE name=? AND owner=?", (name, owner))
+        await db.commit()
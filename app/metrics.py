@@ -0,0 +1,205 @@
+# app/metrics.py
+# Метрики процесса в текстовом формате Prometheus: счётчики, гистограммы и
+# датчики-функции. Обновление — словарь по меткам и bisect по границам корзин,
+# без блокировок (всё в одном event loop). Отдаются по GET /metrics на локальном порту.
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Optional
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+
+from .config import METRICS_HOST, METRICS_PORT
+
+log = logging.getLogger(__name__)
+
+# Границы корзин задержек, секунды: от долей миллисекунды (SQL) до десятков секунд (сводка)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry: list = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()):
+        self.name, self.doc, self.labelnames = name, doc, labels
+        self._values: dict[tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, *labels, value: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def get(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        for labels, v in self._values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_num(v)}")
+        return lines
+
+
+class _Series:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, n: int):
+        self.counts = [0] * n  # по корзинам, последняя — +Inf; накопительные — при выдаче
+        self.sum = 0.0
+
+
+class _Timer:
+    __slots__ = ("hist", "labels", "t0")
+
+    def __init__(self, hist: "Histogram", labels: tuple):
+        self.hist, self.labels = hist, labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0, *self.labels)
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.doc, self.labelnames = name, doc, labels
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, _Series] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, *labels):
+        s = self._series.get(labels)
+        if s is None:
+            s = self._series[labels] = _Series(len(self.buckets) + 1)
+        s.counts[bisect_left(self.buckets, value)] += 1
+        s.sum += value
+
+    def time(self, *labels) -> _Timer:
+        """with hist.time("x"): ... — наблюдать длительность блока."""
+        return _Timer(self, labels)
+
+    def count(self, *labels) -> int:
+        s = self._series.get(labels)
+        return sum(s.counts) if s else 0
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for labels, s in self._series.items():
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), s.counts):
+                acc += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_num(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {acc}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(s.sum)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {acc}")
+        return lines
+
+
+class Gauge:
+    """Значение считается функцией в момент выдачи — в горячем пути ничего не делаем."""
+
+    def __init__(self, name: str, doc: str, fn: Callable[[], float]):
+        self.name, self.doc, self.fn = name, doc, fn
+        _registry.append(self)
+
+    def expose(self) -> list[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge", f"{self.name} {_num(value)}"]
+
+
+def render_metrics() -> str:
+    lines = []
+    for m in _registry:
+        lines += m.expose()
+    return "\n".join(lines) + "\n"
+
+
+# ---------- метрики бота ----------
+
+handler_seconds = Histogram("todobot_handler_seconds", "Handler latency", ("handler",))
+handler_errors = Counter("todobot_handler_errors_total", "Handler exceptions", ("handler", "error"))
+
+db_query_seconds = Histogram("todobot_db_query_seconds", "SQL statement time incl. pool wait", ("op",))
+db_commit_seconds = Histogram("todobot_db_commit_seconds", "Time until a unit of work is committed (group commit)")
+
+scheduler_tick_seconds = Histogram("todobot_scheduler_tick_seconds", "check_pre_and_due duration")
+reminders_fired = Counter("todobot_reminders_fired_total", "Reminders moved to the outbox", ("kind",))
+digest_seconds = Histogram("todobot_digest_seconds", "send_morning_digest run duration")
+digests_queued = Counter("todobot_digests_queued_total", "Morning digests queued for sending")
+tasks_archived = Counter("todobot_tasks_archived_total", "Completed tasks moved to tasks_archive")
+
+send_seconds = Histogram("todobot_send_seconds", "sendMessage API call duration")
+messages_sent = Counter("todobot_messages_sent_total", "Messages delivered by the send queue", ("priority",))
+send_failures = Counter("todobot_send_failures_total", "Failed sends after retries", ("error",))
+send_retry_after = Counter("todobot_send_retry_after_total", "429 responses from Telegram")
+outbox_results = Counter("todobot_outbox_results_total", "Outbox row outcomes", ("result",))
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: handler уже выбран, меряем только его работу."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: dict[str, Any],
+    ) -> Any:
+        obj = data.get("handler")
+        name = getattr(obj.callback, "__name__", "?") if obj is not None else "?"
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            handler_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - t0, name)
+
+
+def setup_metrics(dp):
+    """Подключить middleware к сообщениям и колбэкам (распространяется на вложенные роутеры)."""
+    mw = MetricsMiddleware()
+    dp.message.middleware(mw)
+    dp.callback_query.middleware(mw)
+
+
+async def _handle(request: web.Request) -> web.Response:
+    return web.Response(body=render_metrics().encode(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> Optional[web.AppRunner]:
+    """GET /metrics на host:port; port=0 — выключено. Занятый порт не мешает боту работать."""
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", _handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        log.warning("metrics server on %s:%s not started: %r", host, port, e)
+        await runner.cleanup()
+        return None
+    log.info("metrics on http://%s:%s/metrics", host, port)
+    return runner
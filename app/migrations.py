@@ -0,0 +1,264 @@
+# app/migrations.py
+# Версионные миграции схемы. Номер применённой версии хранится в PRAGMA user_version;
+# каждый шаг идёт в своей транзакции и написан идемпотентно (старые БД до появления
+# user_version имеют версию 0 и частично применённую схему).
+
+_TASKS_DDL = """
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            category TEXT,
+            due_at INTEGER,              -- unix-время (секунды UTC)
+            is_done INTEGER NOT NULL DEFAULT 0,
+            created_at INTEGER NOT NULL,
+            reminded_at INTEGER,         -- когда отправлено основное напоминание
+            pre_offset_minutes INTEGER,  -- индивидуальный пред-офсет (NULL => дефолт юзера)
+            pre_reminded_at INTEGER,     -- когда отправлено пред-напоминание
+            rrule TEXT,                  -- RRULE: FREQ, INTERVAL, BYDAY, COUNT, UNTIL
+            pre_offsets TEXT             -- несколько пред-офсетов: '1440,60' (NULL => pre_offset_minutes)
+        );
+"""
+
+_EPOCH_COLUMNS = ("due_at", "created_at", "reminded_at", "pre_reminded_at")
+
+
+async def _add_columns(db, alters: list[str]):
+    for alter in alters:
+        try:
+            await db.execute(alter)
+        except Exception:
+            pass  # колонка уже есть
+
+
+async def _m1_base_schema(db):
+    await db.execute(_TASKS_DDL.format(name="tasks"))
+    await _add_columns(db, [
+        "ALTER TABLE tasks ADD COLUMN reminded_at INTEGER;",
+        "ALTER TABLE tasks ADD COLUMN pre_offset_minutes INTEGER;",
+        "ALTER TABLE tasks ADD COLUMN pre_reminded_at INTEGER;",
+        "ALTER TABLE tasks ADD COLUMN rrule TEXT;",
+        "ALTER TABLE tasks ADD COLUMN category TEXT;",
+        "ALTER TABLE tasks ADD COLUMN pre_offsets TEXT;",
+    ])
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS user_settings (
+        user_id INTEGER PRIMARY KEY,
+        default_pre_offset_minutes INTEGER,
+        tz TEXT,                     -- часовой пояс сводки (NULL => TZ из config)
+        digest_hour INTEGER          -- час сводки (NULL => MORNING_DIGEST_HOUR)
+    );
+    """)
+    await _add_columns(db, [
+        "ALTER TABLE user_settings ADD COLUMN tz TEXT;",
+        "ALTER TABLE user_settings ADD COLUMN digest_hour INTEGER;",
+    ])
+
+
+async def _m2_epoch_columns(db):
+    """
+    Старые БД хранили время ISO-строками ('2025-11-11T09:50:00+05:00').
+    Пересобираем tasks с INTEGER-колонками и переводим значения в unix-время.
+    """
+    cur = await db.execute("PRAGMA table_info(tasks)")
+    types = {r[1]: (r[2] or "").upper() for r in await cur.fetchall()}
+    if types.get("due_at") == "INTEGER":
+        return
+    from .utils import parse_local_dt, now_ts
+
+    def to_epoch(v):
+        if v is None or isinstance(v, int):
+            return v
+        dt = parse_local_dt(str(v))
+        return int(dt.timestamp()) if dt else None
+
+    cols = list(types)
+    epoch_idx = [i for i, c in enumerate(cols) if c in _EPOCH_COLUMNS]
+    created_idx = cols.index("created_at")
+    fallback = now_ts()
+
+    cur = await db.execute("SELECT seq FROM sqlite_sequence WHERE name='tasks'")
+    seq = await cur.fetchone()
+    await db.execute("DROP TABLE IF EXISTS tasks_new")
+    await db.execute(_TASKS_DDL.format(name="tasks_new"))
+    cur = await db.execute(f"SELECT {', '.join(cols)} FROM tasks")
+    insert = f"INSERT INTO tasks_new ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+    while True:
+        chunk = await cur.fetchmany(1000)
+        if not chunk:
+            break
+        rows = []
+        for r in chunk:
+            r = list(r)
+            for i in epoch_idx:
+                r[i] = to_epoch(r[i])
+            if r[created_idx] is None:
+                r[created_idx] = fallback
+            rows.append(r)
+        await db.executemany(insert, rows)
+    await db.execute("DROP TABLE tasks")
+    await db.execute("ALTER TABLE tasks_new RENAME TO tasks")
+    if seq:
+        await db.execute("UPDATE sqlite_sequence SET seq=max(seq, ?) WHERE name='tasks'", (seq[0],))
+
+
+async def _m3_reminders(db):
+    """Ожидающие уведомления с заранее посчитанным временем срабатывания."""
+    cur = await db.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='reminders'")
+    has_reminders = await cur.fetchone() is not None
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS reminders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,          -- pre | due | snooze
+        offset_minutes INTEGER,      -- pre: за сколько минут до срока; snooze: на сколько отложено
+        fire_at INTEGER NOT NULL     -- unix-время срабатывания
+    );
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_reminders_fire_at ON reminders(fire_at);")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_reminders_task ON reminders(task_id);")
+    if not has_reminders:
+        from .reminders import sync_all_reminders
+        await sync_all_reminders(db)
+
+
+async def _m4_hot_query_indexes(db):
+    """
+    Индексы под горячие запросы (проверка: python -m bench.query_plans).
+    Выражение сортировки /list должно совпадать с repository._SORT_KEY.
+    """
+    for ddl in [
+        # /list: страница «все категории» и страница категории (keyset по сроку, id)
+        "CREATE INDEX IF NOT EXISTS idx_tasks_open_user_due ON tasks"
+        "(user_id, IFNULL(due_at, 9223372036854775807), id) WHERE is_done=0;",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_open_user_cat_due ON tasks"
+        "(user_id, category, IFNULL(due_at, 9223372036854775807), id) WHERE is_done=0;",
+        # сводка: открытые задачи со сроком в порядке (user_id, due_at) — без сортировки
+        "CREATE INDEX IF NOT EXISTS idx_tasks_open_digest ON tasks"
+        "(user_id, due_at) WHERE is_done=0 AND due_at IS NOT NULL;",
+        # группы сводки (tz, час)
+        "CREATE INDEX IF NOT EXISTS idx_user_settings_digest ON user_settings(tz, digest_hour);",
+    ]:
+        await db.execute(ddl)
+
+
+async def _m5_fsm_state(db):
+    """Состояния FSM (мастер /add), которые переживают перезапуск; пишет app/fsm_storage.py."""
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS fsm_state (
+        key TEXT PRIMARY KEY,        -- bot:chat:user:thread:business:destiny
+        state TEXT,
+        data TEXT NOT NULL,          -- JSON
+        updated_at INTEGER NOT NULL  -- unix-время последнего изменения (для TTL)
+    );
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_fsm_state_updated ON fsm_state(updated_at);")
+
+
+async def _m6_leases(db):
+    """Аренды заданий планировщика для нескольких процессов на одной БД (app/leases.py)."""
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,       -- имя задания, напр. 'digest'
+        owner TEXT NOT NULL,         -- host:pid владельца
+        expires_at INTEGER NOT NULL  -- unix-время; после него аренду может взять другой процесс
+    );
+    """)
+
+
+async def _m7_outbox(db):
+    """Исходящие уведомления: пишутся в одной транзакции с задачей, отправляет app/outbox.py."""
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,                     -- reminder | digest
+        task_id INTEGER,                        -- для кнопок действий под сообщением
+        text TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending', -- pending | failed (отправленные удаляются)
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_try_at INTEGER NOT NULL,           -- unix-время следующей попытки (или конца захвата)
+        error TEXT                              -- последняя ошибка отправки
+    );
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox(next_try_at) WHERE status='pending';")
+
+
+async def _m8_archive(db):
+    """
+    Время выполнения задачи и архив выполненных (app/archive.py переносит туда
+    задачи, выполненные раньше ARCHIVE_AFTER_DAYS, чтобы tasks оставалась маленькой).
+    """
+    from .utils import now_ts
+    await _add_columns(db, ["ALTER TABLE tasks ADD COLUMN done_at INTEGER;"])
+    # для старых выполненных задач точного времени нет — берём самое позднее известное,
+    # но не позже миграции: задача, выполненная до будущего срока, не уходит в будущее
+    await db.execute(
+        "UPDATE tasks SET done_at=MIN(MAX(created_at, IFNULL(reminded_at, 0), IFNULL(due_at, 0)), ?) "
+        "WHERE is_done=1 AND done_at IS NULL",
+        (now_ts(),)
+    )
+    await db.execute(_TASKS_DDL.format(name="tasks_archive"))
+    await _add_columns(db, [
+        "ALTER TABLE tasks_archive ADD COLUMN done_at INTEGER;",
+        "ALTER TABLE tasks_archive ADD COLUMN archived_at INTEGER;",
+    ])
+    for ddl in [
+        # архивация: выполненные по возрастанию done_at
+        "CREATE INDEX IF NOT EXISTS idx_tasks_done ON tasks(done_at) WHERE is_done=1;",
+        # /history: выполненные пользователя, свежие первыми — в горячей таблице и в архиве
+        "CREATE INDEX IF NOT EXISTS idx_tasks_done_user ON tasks(user_id, done_at) WHERE is_done=1;",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_archive_user ON tasks_archive(user_id, done_at);",
+    ]:
+        await db.execute(ddl)
+
+
+async def _m9_digest_log(db):
+    """День последней утренней сводки пользователя: пропущенный срез окна досылается позже, без повторов."""
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS digest_log (
+        user_id INTEGER PRIMARY KEY,
+        sent_on INTEGER NOT NULL     -- unix-время начала локального дня последней сводки
+    );
+    """)
+
+
+async def _m10_done_at_not_future(db):
+    """БД, где шаг 8 заполнил done_at сроком из будущего: время выполнения — не позже миграции."""
+    from .utils import now_ts
+    now = now_ts()
+    await db.execute("UPDATE tasks SET done_at=? WHERE is_done=1 AND done_at > ?", (now, now))
+
+
+MIGRATIONS = [
+    (1, _m1_base_schema),
+    (2, _m2_epoch_columns),
+    (3, _m3_reminders),
+    (4, _m4_hot_query_indexes),
+    (5, _m5_fsm_state),
+    (6, _m6_leases),
+    (7, _m7_outbox),
+    (8, _m8_archive),
+    (9, _m9_digest_log),
+    (10, _m10_done_at_not_future),
+]
+
+
+async def migrate(db) -> int:
+    """Применить шаги с версией больше PRAGMA user_version. Соединение — в autocommit."""
+    cur = await db.execute("PRAGMA user_version")
+    version = (await cur.fetchone())[0]
+    for ver, step in MIGRATIONS:
+        if ver <= version:
+            continue
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            await step(db)
+            await db.execute(f"PRAGMA user_version={ver}")
+            await db.execute("COMMIT")
+        except BaseException:
+            await db.execute("ROLLBACK")
+            raise
+        version = ver
+    return version
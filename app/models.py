@@ -1,7 +1,158 @@
-from datetime import datetime, timedelta
+# app/models.py
+# Повторы задач: RRULE-строка компилируется один раз в неизменяемый Rule (с кэшем),
+# следующий срок после «сейчас» считается арифметикой, без пошагового перебора.
+# Поддержано: FREQ=DAILY|WEEKLY|MONTHLY|YEARLY, INTERVAL, BYDAY (для WEEKLY),
+# COUNT (сколько сроков осталось, включая текущий) и UNTIL.
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Optional
 
-def parse_rrule(text: str) -> Optional[tuple[str, int]]:
+from .config import TZ
+
+FREQS = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+# Сколько подряд несуществующих дат (31-е, 29 февраля) может выпасть в серии:
+# 29.02 с шагом в год пропускает максимум 7 лет (через 2100), с запасом.
+_MAX_SKIPS = 16
+
+
+def _days_in_month(year: int, month: int) -> int:
+    if month == 2:
+        leap = (year % 400 == 0) or (year % 4 == 0 and year % 100 != 0)
+        return 29 if leap else 28
+    return 30 if month in (4, 6, 9, 11) else 31
+
+
+def _parse_until(text: str) -> Optional[int]:
+    """'20251231' (конец дня по TZ) или '20251231T235959Z' / '20251231T235959' → unix-время."""
+    try:
+        if len(text) == 8 and text.isdigit():
+            d = datetime.strptime(text, "%Y%m%d")
+            return int(d.replace(hour=23, minute=59, second=59, tzinfo=TZ).timestamp())
+        if text.endswith("Z"):
+            return int(datetime.strptime(text, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc).timestamp())
+        return int(datetime.strptime(text, "%Y%m%dT%H%M%S").replace(tzinfo=TZ).timestamp())
+    except ValueError:
+        return None
+
+
+@dataclass(frozen=True)
+class Rule:
+    freq: str
+    interval: int = 1
+    byday: tuple[int, ...] = ()   # дни недели 0=пн … 6=вс, только WEEKLY
+    count: Optional[int] = None   # сколько сроков осталось, включая текущий
+    until: Optional[int] = None   # unix-время, включительно
+
+    def __str__(self) -> str:
+        parts = [f"FREQ={self.freq}", f"INTERVAL={self.interval}"]
+        if self.byday:
+            parts.append("BYDAY=" + ",".join(WEEKDAYS[d] for d in self.byday))
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        if self.until is not None:
+            parts.append("UNTIL=" + datetime.fromtimestamp(self.until, timezone.utc).strftime("%Y%m%dT%H%M%SZ"))
+        return ";".join(parts)
+
+    def next_after(self, due: datetime, after: Optional[datetime] = None) -> Optional[tuple[datetime, "Rule"]]:
+        """
+        Первый срок серии, начатой в due, строго позже due и after.
+        Возвращает (срок, правило для сохранения — с уменьшенным COUNT) или None, если серия кончилась.
+        """
+        after = due if after is None or after < due else after.astimezone(due.tzinfo)
+        if self.freq in ("DAILY", "WEEKLY") and not self.byday:
+            nxt, steps = self._fixed_step(due, after)
+        elif self.freq == "WEEKLY":
+            nxt, steps = self._by_weekday(due, after)
+        else:
+            found = self._by_month(due, after)
+            if found is None:
+                return None
+            nxt, steps = found
+
+        if self.until is not None and nxt.timestamp() > self.until:
+            return None
+        if self.count is None:
+            return nxt, self
+        if steps is None:
+            steps = self._month_steps(due, nxt)
+        if steps >= self.count:
+            return None
+        return nxt, replace(self, count=self.count - steps)
+
+    # --- DAILY / WEEKLY: постоянный шаг ---
+
+    def _fixed_step(self, due: datetime, after: datetime) -> tuple[datetime, int]:
+        step = timedelta(days=self.interval * (7 if self.freq == "WEEKLY" else 1))
+        k = (after - due) // step + 1
+        return due + k * step, k
+
+    # --- WEEKLY;BYDAY: слоты (неделя цикла, день) ---
+
+    def _slot_ordinal(self, due: datetime, monday0: datetime, x: datetime) -> int:
+        """Сколько слотов серии (включая дни первой недели до due) приходится на время <= x."""
+        week = (x - monday0).days // 7
+        cycle, rem = divmod(week, self.interval)
+        n = cycle * len(self.byday)
+        if rem:
+            return n + len(self.byday)
+        week_start = monday0 + timedelta(weeks=week)
+        return n + sum(1 for d in self.byday if week_start + timedelta(days=d) <= x)
+
+    def _by_weekday(self, due: datetime, after: datetime) -> tuple[datetime, int]:
+        monday0 = due - timedelta(days=due.weekday())
+        week = (after - monday0).days // 7
+        cycle_week = week - week % self.interval
+        nxt = None
+        for w in (cycle_week, cycle_week + self.interval):
+            start = monday0 + timedelta(weeks=w)
+            nxt = next((start + timedelta(days=d) for d in self.byday if start + timedelta(days=d) > after), None)
+            if nxt is not None:
+                break
+        steps = self._slot_ordinal(due, monday0, nxt) - self._slot_ordinal(due, monday0, due)
+        return nxt, steps
+
+    # --- MONTHLY / YEARLY: настоящие месяцы, несуществующие даты пропускаются (RFC 5545) ---
+
+    def _months(self) -> int:
+        return self.interval * (12 if self.freq == "YEARLY" else 1)
+
+    def _shift(self, due: datetime, k: int) -> Optional[datetime]:
+        m = due.month - 1 + k * self._months()
+        year, month = due.year + m // 12, m % 12 + 1
+        if due.day > _days_in_month(year, month):
+            return None
+        return due.replace(year=year, month=month)
+
+    def _by_month(self, due: datetime, after: datetime) -> Optional[tuple[datetime, None]]:
+        months_between = (after.year - due.year) * 12 + after.month - due.month
+        k = max(1, months_between // self._months())
+        for _ in range(_MAX_SKIPS + 2):
+            nxt = self._shift(due, k)
+            if nxt is not None and nxt > after:
+                return nxt, None
+            k += 1
+        return None
+
+    def _month_steps(self, due: datetime, nxt: datetime) -> int:
+        """Число настоящих сроков в (due, nxt]; считаем только при COUNT и не дальше него."""
+        k_last = ((nxt.year - due.year) * 12 + nxt.month - due.month) // self._months()
+        if due.day <= 28:
+            return k_last
+        steps = 0
+        for k in range(1, k_last + 1):
+            if self._shift(due, k) is not None:
+                steps += 1
+                if steps >= self.count:
+                    break
+        return steps
+
+
+@lru_cache(maxsize=1024)
+def compile_rrule(text: str | None) -> Optional[Rule]:
+    """Разобрать RRULE; None — строка не поддерживается. Результат общий и неизменяемый."""
     if not text:
         return None
     parts = {}
@@ -10,21 +161,33 @@ def parse_rrule(text: str) -> Optional[tuple[str, int]]:
             k, v = piece.split("=", 1)
             parts[k.strip().upper()] = v.strip().upper()
     freq = parts.get("FREQ")
-    if freq not in {"DAILY", "WEEKLY", "MONTHLY"}:
+    if freq not in FREQS:
         return None
-    interval = int(parts.get("INTERVAL", "1"))
-    return (freq, max(1, interval))
-
-def next_occurrence(due: datetime, rrule: str) -> Optional[datetime]:
-    parsed = parse_rrule(rrule)
-    if not parsed:
+    interval = parts.get("INTERVAL", "1")
+    if not interval.isdigit():
         return None
-    freq, interval = parsed
-    if freq == "DAILY":
-        return due + timedelta(days=interval)
-    if freq == "WEEKLY":
-        return due + timedelta(weeks=interval)
-    if freq == "MONTHLY":
-        # упрощённый месяц = 30 дней
-        return due + timedelta(days=30 * interval)
-    return None
+
+    byday = ()
+    if parts.get("BYDAY"):
+        days = [d.strip() for d in parts["BYDAY"].split(",")]
+        if any(d not in WEEKDAYS for d in days):
+            return None
+        byday = tuple(sorted({WEEKDAYS.index(d) for d in days}))
+        if freq == "DAILY" and int(interval) <= 1:
+            freq = "WEEKLY"  # FREQ=DAILY;BYDAY=MO,…,FR — то же, что еженедельно по этим дням
+        elif freq != "WEEKLY":
+            return None
+
+    count = None
+    if "COUNT" in parts:
+        if not parts["COUNT"].isdigit() or int(parts["COUNT"]) < 1:
+            return None
+        count = int(parts["COUNT"])
+
+    until = None
+    if "UNTIL" in parts:
+        until = _parse_until(parts["UNTIL"])
+        if until is None:
+            return None
+
+    return Rule(freq, max(1, int(interval)), byday, count, until)
@@ -0,0 +1,155 @@
+# app/outbox.py
+# Transactional outbox уведомлений: планировщик пишет строки в outbox в той же
+# транзакции, что и изменение задачи (сводку — что и отметку в digest_log), и сразу
+# идёт дальше; отдельный цикл забирает их пачками, отдаёт в send_queue и по итогу
+# удаляет строку, откладывает повтор (экспонента + джиттер) или помечает постоянную
+# ошибку (бот заблокирован и т.п.).
+import asyncio
+import logging
+import random
+from typing import Optional
+
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNotFound, TelegramRetryAfter,
+)
+
+from .config import (
+    OUTBOX_BATCH, OUTBOX_MAX_INFLIGHT, OUTBOX_MAX_ATTEMPTS, OUTBOX_BACKOFF_BASE,
+    OUTBOX_BACKOFF_MAX, OUTBOX_CLAIM_SECONDS, OUTBOX_POLL_SECONDS,
+)
+from .db import db_conn
+from .metrics import Gauge, outbox_results
+from .keyboards import inline_task_actions
+from .sender import send_queue, PRIO_REMINDER, PRIO_DIGEST
+from .utils import now_ts
+
+log = logging.getLogger(__name__)
+
+# Повторять бессмысленно: пользователь заблокировал бота, чат удалён, текст отвергнут
+PERMANENT_ERRORS = (TelegramForbiddenError, TelegramBadRequest, TelegramNotFound)
+
+# приоритет в send_queue по виду строки: напоминания обгоняют сводки
+_PRIORITY = {"reminder": PRIO_REMINDER, "digest": PRIO_DIGEST}
+
+INSERT_SQL = "INSERT INTO outbox (chat_id, kind, task_id, text, next_try_at) VALUES (?, ?, ?, ?, ?)"
+
+# Захват пачки: next_try_at сдвигается на OUTBOX_CLAIM_SECONDS, и другие процессы
+# эти строки не видят, пока не истечёт захват.
+CLAIM_SQL = (
+    "UPDATE outbox SET next_try_at=? WHERE id IN "
+    "(SELECT id FROM outbox WHERE status='pending' AND next_try_at <= ? ORDER BY next_try_at LIMIT ?) "
+    "RETURNING id, chat_id, kind, task_id, text, attempts"
+)
+
+
+def backoff(attempts: int, retry_after: Optional[int] = None) -> int:
+    """Секунды до следующей попытки: base·2^(n-1) с джиттером в верхней половине, не меньше retry_after."""
+    delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1))
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    return max(int(delay) + 1, retry_after or 0)
+
+
+async def add_messages(db, rows: list[tuple[int, str, Optional[int]]], kind: str = "reminder"):
+    """rows: [(chat_id, text, task_id)]; в транзакции вызывающего, отправка — после commit."""
+    if rows:
+        now = now_ts()
+        await db.executemany(INSERT_SQL, [(chat_id, kind, task_id, text, now) for chat_id, text, task_id in rows])
+
+
+class Outbox:
+    def __init__(self):
+        self._wake = asyncio.Event()
+        self._inflight: set[int] = set()
+        self._results: list[tuple[dict, Optional[BaseException]]] = []
+
+    def notify(self):
+        """Появились новые строки (после commit) — разбудить цикл."""
+        self._wake.set()
+
+    async def run(self):
+        while True:
+            self._wake.clear()
+            try:
+                await self._flush_results()
+                if len(self._inflight) >= OUTBOX_MAX_INFLIGHT:
+                    timeout = OUTBOX_POLL_SECONDS  # разбудит завершение отправки
+                elif await self._claim():
+                    continue
+                else:
+                    timeout = await self._next_delay()
+            except Exception as e:
+                log.exception("outbox tick failed: %r", e)
+                timeout = 1
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self) -> int:
+        now = now_ts()
+        limit = min(OUTBOX_BATCH, OUTBOX_MAX_INFLIGHT - len(self._inflight))
+        async with db_conn() as db:
+            cur = await db.execute(CLAIM_SQL, (now + OUTBOX_CLAIM_SECONDS, now, limit))
+            rows = [dict(r) for r in await cur.fetchall()]
+            await db.commit()
+        for row in rows:
+            if row["id"] in self._inflight:
+                continue  # наш же захват истёк, сообщение ещё в очереди отправки
+            self._inflight.add(row["id"])
+            markup = inline_task_actions(row["task_id"]) if row["task_id"] else None
+            prio = _PRIORITY.get(row["kind"], PRIO_REMINDER)
+            fut = send_queue.send_message(row["chat_id"], row["text"], priority=prio, reply_markup=markup)
+            fut.add_done_callback(lambda f, row=row: self._done(row, f))
+        return len(rows)
+
+    def _done(self, row: dict, fut: asyncio.Future):
+        exc = fut.exception() if not fut.cancelled() else asyncio.CancelledError()
+        self._results.append((row, exc))
+        self._wake.set()
+
+    async def _flush_results(self):
+        if not self._results:
+            return
+        results, self._results = self._results, []
+        sent, retry, failed = [], [], []
+        now = now_ts()
+        for row, exc in results:
+            attempts = row["attempts"] + 1
+            if exc is None:
+                sent.append((row["id"],))
+            elif isinstance(exc, PERMANENT_ERRORS) or attempts >= OUTBOX_MAX_ATTEMPTS:
+                failed.append((attempts, repr(exc), row["id"]))
+            else:
+                retry_after = exc.retry_after if isinstance(exc, TelegramRetryAfter) else None
+                retry.append((attempts, now + backoff(attempts, retry_after), repr(exc), row["id"]))
+        try:
+            async with db_conn() as db:
+                if sent:
+                    await db.executemany("DELETE FROM outbox WHERE id=?", sent)
+                if retry:
+                    await db.executemany("UPDATE outbox SET attempts=?, next_try_at=?, error=? WHERE id=?", retry)
+                if failed:
+                    await db.executemany("UPDATE outbox SET status='failed', attempts=?, error=? WHERE id=?", failed)
+                await db.commit()
+        except Exception:
+            self._results = results + self._results
+            raise
+        for row, _ in results:
+            self._inflight.discard(row["id"])
+        for result, rows in (("sent", sent), ("retry", retry), ("failed", failed)):
+            if rows:
+                outbox_results.inc(result, value=len(rows))
+        if failed:
+            log.warning("outbox: %d messages failed permanently", len(failed))
+
+    async def _next_delay(self) -> float:
+        async with db_conn() as db:
+            cur = await db.execute("SELECT MIN(next_try_at) AS next_at FROM outbox WHERE status='pending'")
+            next_at = (await cur.fetchone())["next_at"]
+        if next_at is None:
+            return OUTBOX_POLL_SECONDS
+        return min(OUTBOX_POLL_SECONDS, max(0.0, next_at - now_ts()))
+
+
+outbox = Outbox()
+Gauge("todobot_outbox_inflight", "Outbox rows handed to the send queue", lambda: len(outbox._inflight))
@@ -0,0 +1,154 @@
+# app/reminders.py
+# Таблица reminders: одна строка на каждое ожидающее уведомление
+# (пред-напоминания, основное напоминание, отложенные «snooze»).
+# fire_at считается при записи задачи, планировщик делает range scan по индексу.
+from typing import Optional
+
+from .user_settings import settings_cache
+from .utils import now_ts
+
+SNOOZE_MINUTES = 60
+
+# Дефолтный офсет пользователя берём из кэша настроек, а не JOIN'ом
+_TASK_SQL = (
+    "SELECT t.id, t.user_id, t.due_at, t.is_done, t.reminded_at, t.pre_reminded_at, "
+    "t.pre_offset_minutes, t.pre_offsets FROM tasks t"
+)
+
+
+def parse_offsets(text: str | None) -> list[int]:
+    """'1440,60' -> [1440, 60]; мусор и неположительные значения отбрасываем."""
+    if not text:
+        return []
+    out = []
+    for piece in text.split(","):
+        piece = piece.strip()
+        if piece.isdigit() and int(piece) > 0:
+            out.append(int(piece))
+    return sorted(set(out), reverse=True)
+
+
+def effective_offsets(r) -> list[int]:
+    """Пред-офсеты задачи: список задачи → индивидуальный офсет → дефолт пользователя."""
+    if r["pre_offsets"]:
+        return parse_offsets(r["pre_offsets"])
+    pre = r["pre_offset_minutes"]
+    if pre is None:
+        pre = r["default_pre_offset_minutes"]
+    return [int(pre)] if pre is not None and pre > 0 else []
+
+
+def reminder_rows(r, now_ts: int) -> list[tuple]:
+    """Строки (task_id, user_id, kind, offset_minutes, fire_at) для pre/due задачи."""
+    if r["is_done"] or r["due_at"] is None:
+        return []
+    due_ts = r["due_at"]
+    sent_ts = r["pre_reminded_at"]
+    rows = []
+    overdue_pre = None
+    for off in effective_offsets(r):
+        fire_at = due_ts - off * 60
+        if sent_ts is not None and fire_at <= sent_ts:
+            continue
+        if fire_at <= now_ts:
+            # из уже наступивших пред-напоминаний шлём только ближайшее к сроку
+            if overdue_pre is None or fire_at > overdue_pre[4]:
+                overdue_pre = (r["id"], r["user_id"], "pre", off, fire_at)
+            continue
+        rows.append((r["id"], r["user_id"], "pre", off, fire_at))
+    if overdue_pre:
+        rows.append(overdue_pre)
+
+    if r["reminded_at"] is None:
+        rows.append((r["id"], r["user_id"], "due", None, due_ts))
+    return rows
+
+
+async def _with_defaults(db, task_rows, default: Optional[dict[int, Optional[int]]] = None) -> list[dict]:
+    """
+    Строки задач + default_pre_offset_minutes. Настройки нужны только задачам без
+    своих офсетов; их пользователи добираются из кэша одной пачкой.
+    default — {user_id: офсет}, уже известный вызывающему (ещё не закоммиченная запись).
+    """
+    rows = [dict(r) for r in task_rows]
+    need = {r["user_id"] for r in rows if not r["pre_offsets"] and r["pre_offset_minutes"] is None}
+    if default:
+        need -= default.keys()
+    settings = await settings_cache.get_many(need, db) if need else {}
+    for r in rows:
+        if default and r["user_id"] in default:
+            r["default_pre_offset_minutes"] = default[r["user_id"]]
+        else:
+            s = settings.get(r["user_id"])
+            r["default_pre_offset_minutes"] = s.default_pre_offset_minutes if s else None
+    return rows
+
+
+async def rebuild_reminders(db, task_rows, default: Optional[dict[int, Optional[int]]] = None) -> Optional[int]:
+    """pre/due-напоминания пачки задач заново (executemany); snooze не трогаем. Ближайший fire_at."""
+    task_rows = await _with_defaults(db, task_rows, default)
+    if not task_rows:
+        return None
+    now = now_ts()
+    await db.executemany(
+        "DELETE FROM reminders WHERE task_id=? AND kind IN ('pre', 'due')",
+        [(r["id"],) for r in task_rows]
+    )
+    new_rows = [row for r in task_rows for row in reminder_rows(r, now)]
+    if new_rows:
+        await db.executemany(
+            "INSERT INTO reminders (task_id, user_id, kind, offset_minutes, fire_at) VALUES (?, ?, ?, ?, ?)",
+            new_rows
+        )
+    return min((row[4] for row in new_rows), default=None)
+
+
+async def sync_task_reminders(db, task_id: int, drop_snoozes: bool = False) -> Optional[int]:
+    """
+    Пересобрать напоминания задачи внутри транзакции вызывающего.
+    Возвращает ближайший fire_at (для reminder_queue.notify).
+    """
+    cur = await db.execute(_TASK_SQL + " WHERE t.id=?", (task_id,))
+    r = await cur.fetchone()
+    if not r:
+        await db.execute("DELETE FROM reminders WHERE task_id=?", (task_id,))
+        return None
+    return await sync_row_reminders(db, r, drop_snoozes)
+
+
+async def sync_row_reminders(db, r, drop_snoozes: bool = False) -> Optional[int]:
+    """То же по строке задачи, которая у вызывающего уже есть (UPDATE … RETURNING *)."""
+    if r["is_done"] or drop_snoozes:
+        await db.execute("DELETE FROM reminders WHERE task_id=? AND kind='snooze'", (r["id"],))
+    return await rebuild_reminders(db, [r])
+
+
+async def drop_task_reminders(db, task_ids: list[int]):
+    """Задачи выполнены или удалены: им не нужно ни одного напоминания."""
+    if task_ids:
+        await db.executemany("DELETE FROM reminders WHERE task_id=?", [(i,) for i in task_ids])
+
+
+async def sync_user_reminders(db, user_id: int, default_pre_offset: Optional[int]) -> Optional[int]:
+    """Пересобрать напоминания задач, зависящих от дефолтного пред-офсета пользователя (новое значение)."""
+    cur = await db.execute(
+        _TASK_SQL + " WHERE t.user_id=? AND t.is_done=0 AND t.due_at IS NOT NULL "
+        "AND t.pre_offset_minutes IS NULL AND t.pre_offsets IS NULL",
+        (user_id,)
+    )
+    return await rebuild_reminders(db, await cur.fetchall(), {user_id: default_pre_offset})
+
+
+async def sync_all_reminders(db) -> Optional[int]:
+    """Первичное заполнение таблицы для старых БД."""
+    cur = await db.execute(_TASK_SQL + " WHERE t.is_done=0 AND t.due_at IS NOT NULL")
+    next_at = None
+    while True:
+        chunk = await cur.fetchmany(1000)
+        if not chunk:
+            break
+        at = await rebuild_reminders(db, chunk)
+        if at is not None and (next_at is None or at < next_at):
+            next_at = at
+    return next_at
+
@@ -0,0 +1,44 @@
+# app/render.py
+# Перерисовка сообщений бота: текст и клавиатура уходят одним editMessageText,
+# а если содержимое сообщения не изменилось — запрос не отправляется вовсе.
+from collections import OrderedDict
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, InlineKeyboardMarkup
+
+# сколько сообщений помним (LRU); забытое просто перерисуется лишний раз
+_MAX_MESSAGES = 10000
+_last: OrderedDict[tuple[int, int], int] = OrderedDict()
+
+
+def _digest(text: str, reply_markup: Optional[InlineKeyboardMarkup]) -> int:
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup else ""
+    return hash((text, markup))
+
+
+def _remember(key: tuple[int, int], digest: int):
+    _last[key] = digest
+    _last.move_to_end(key)
+    if len(_last) > _MAX_MESSAGES:
+        _last.popitem(last=False)
+
+
+async def render(message: Message, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> bool:
+    """
+    Показать text с reply_markup в сообщении message (без клавиатуры — убрать её).
+    Возвращает False, если сообщение уже так выглядит и запрос не отправлялся.
+    """
+    key = (message.chat.id, message.message_id)
+    digest = _digest(text, reply_markup)
+    if _last.get(key) == digest:
+        _last.move_to_end(key)
+        return False
+    try:
+        await message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        # состояние ушло от кэша (перезапуск, вытеснение) — но на экране уже то, что нужно
+        if "message is not modified" not in str(e):
+            raise
+    _remember(key, digest)
+    return True
@@ -0,0 +1,600 @@
+# app/repository.py
+# Операции с задачами в одном месте: хендлеры и планировщик вызывают методы
+# TaskRepository, а не пишут SQL. SQLiteTaskRepository делает каждую операцию
+# за минимум запросов (UPDATE … RETURNING * вместо SELECT → UPDATE → SELECT,
+# пачки — executemany / многострочный INSERT … RETURNING) в одной транзакции
+# и пересобирает напоминания задачи. MemoryTaskRepository — то же в словарях,
+# для проверок и бенчмарков хендлеров без диска (use_repository).
+import heapq
+import itertools
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Iterable, Mapping, NamedTuple, Optional, Sequence
+
+from .db import db_conn
+from .models import compile_rrule
+from .reminders import (
+    SNOOZE_MINUTES, drop_task_reminders, rebuild_reminders, reminder_rows, sync_row_reminders,
+)
+from .timer_queue import reminder_queue
+from .utils import from_ts, now_local, now_ts, to_ts
+
+# Строка задачи: sqlite3.Row (SQLite) или dict (в памяти) — доступ по имени колонки
+Task = Mapping[str, Any]
+
+_IN_CHUNK = 500
+
+# Ключ сортировки списка: срок (без срока — в конце), затем id.
+# Страницы листаются keyset-пагинацией по этому ключу: один запрос на страницу.
+# Выражение должно совпадать с индексами idx_tasks_open_user_*.
+_NO_DUE = 2**63 - 1
+_SORT_KEY = f"IFNULL(due_at, {_NO_DUE})"
+
+# Забрать наступившие напоминания одним DELETE … RETURNING: строка достаётся ровно
+# одному процессу, даже если несколько ботов работают с одной БД.
+CLAIM_REMINDERS_SQL = (
+    "DELETE FROM reminders WHERE id IN "
+    "(SELECT id FROM reminders WHERE fire_at <= ? ORDER BY fire_at LIMIT ?) "
+    "RETURNING task_id, kind, offset_minutes"
+)
+
+_NEW_COLUMNS = ("user_id", "title", "category", "due_at", "created_at", "pre_offset_minutes", "rrule")
+
+
+@dataclass(frozen=True)
+class NewTask:
+    user_id: int
+    title: str
+    category: Optional[str] = None
+    due_at: Optional[int] = None              # unix-время
+    pre_offset_minutes: Optional[int] = None  # None => дефолт пользователя
+    rrule: Optional[str] = None
+
+
+class Fired(NamedTuple):
+    """Наступившее напоминание живой задачи; task — строка до переноса повтора."""
+    task: Task
+    kind: str                      # pre | due | snooze
+    offset_minutes: Optional[int]
+
+
+def _sort_key(due_at: Optional[int], task_id: int) -> tuple[int, int]:
+    return (_NO_DUE if due_at is None else due_at, task_id)
+
+
+def _page_sql(with_category: bool, direction: str) -> str:
+    """Параметры: user_id, [category], [срок, срок, id курсора], limit."""
+    where = "user_id=? AND is_done=0"
+    if with_category:
+        where += " AND category=?"
+    order = "ASC"
+    # (срок, id) > курсора, записанное так, чтобы граница по сроку была поиском по индексу:
+    # сравнение кортежей SQLite в диапазон индекса не превращает
+    if direction == "n":
+        where += f" AND {_SORT_KEY} >= ? AND ({_SORT_KEY} > ? OR id > ?)"
+    elif direction == "p":
+        where += f" AND {_SORT_KEY} <= ? AND ({_SORT_KEY} < ? OR id < ?)"
+        order = "DESC"
+    return f"SELECT * FROM tasks WHERE {where} ORDER BY {_SORT_KEY} {order}, id {order} LIMIT ?"
+
+
+def next_occurrence(r: Task, now: datetime) -> Optional[tuple[int, str]]:
+    """Следующий срок повторяющейся задачи после now: (due_at, rrule с уменьшенным COUNT); None — не повтор или серия кончилась."""
+    rule = compile_rrule(r["rrule"])
+    if not rule or r["due_at"] is None:
+        return None
+    found = rule.next_after(from_ts(r["due_at"]), now)
+    if not found:
+        return None
+    nxt, rest = found
+    return to_ts(nxt), str(rest)
+
+
+class TaskRepository(ABC):
+    """
+    Интерфейс хранилища задач (абстрактный: бэкенд без какого-либо метода
+    не создаётся). Все операции проверяют владельца (user_id);
+    «не найдено» — None / False. Методы с собственной транзакцией сами сообщают
+    reminder_queue о новом ближайшем напоминании после commit.
+    """
+
+    @abstractmethod
+    async def get(self, user_id: int, task_id: int) -> Optional[Task]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create(self, task: NewTask) -> Task:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create_many(self, tasks: Sequence[NewTask]) -> list[Task]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def reschedule(self, user_id: int, task_id: int, due_at: Optional[int]) -> Optional[Task]:
+        """Новый срок; отметки об отправленных напоминаниях сбрасываются."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def reschedule_many(self, user_id: int, changes: Sequence[tuple[int, Optional[int]]]) -> int:
+        """[(task_id, due_at)]; возвращает число изменённых задач."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def complete(self, user_id: int, task_id: int, now: Optional[datetime] = None) -> Optional[Task]:
+        """
+        Выполнить; повторяющаяся задача переносится на следующий срок (is_done остаётся 0).
+        Уже выполненная возвращается как есть — повторное нажатие не сдвигает done_at.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def complete_many(self, user_id: int, task_ids: Sequence[int], now: Optional[datetime] = None) -> list[Task]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, user_id: int, task_id: int) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_category(self, user_id: int, task_id: int, category: Optional[str]) -> Optional[Task]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_rrule(self, user_id: int, task_id: int, rrule: Optional[str]) -> Optional[Task]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_pre_offsets(self, user_id: int, task_id: int, offsets: Optional[str]) -> Optional[Task]:
+        """offsets — '1440,60'; None => пред-офсет задачи / дефолт пользователя."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def snooze(self, user_id: int, task_id: int, minutes: int = SNOOZE_MINUTES) -> Optional[int]:
+        """Отложенное напоминание открытой задачи; возвращает fire_at."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_page(self, user_id: int, category: Optional[str], direction: str = "f",
+                        cursor: tuple[Optional[int], int] = (None, 0), limit: int = 10) -> list[Task]:
+        """
+        Открытые задачи по (срок, id): f — с начала, n — после cursor (срок, id),
+        p — перед cursor, ближайшие к нему первыми (в обратном порядке).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def claim_reminders(self, db, now: datetime, limit: int) -> tuple[int, list[Fired]]:
+        """
+        Забрать до limit наступивших напоминаний в транзакции вызывающего db
+        (в ней же планировщик пишет outbox): отметить отправку, перенести
+        повторяющиеся задачи. Возвращает (сколько забрано, живые из них).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def next_fire_at(self) -> Optional[int]:
+        raise NotImplementedError
+
+
+class SQLiteTaskRepository(TaskRepository):
+    async def get(self, user_id: int, task_id: int) -> Optional[Task]:
+        async with db_conn() as db:
+            cur = await db.execute("SELECT * FROM tasks WHERE id=? AND user_id=?", (task_id, user_id))
+            return await cur.fetchone()
+
+    async def create(self, task: NewTask) -> Task:
+        return (await self.create_many([task]))[0]
+
+    async def create_many(self, tasks: Sequence[NewTask]) -> list[Task]:
+        created = now_ts()
+        out = []
+        async with db_conn() as db:
+            for i in range(0, len(tasks), _IN_CHUNK):
+                chunk = tasks[i:i + _IN_CHUNK]
+                values = ", ".join([f"({', '.join('?' * len(_NEW_COLUMNS))})"] * len(chunk))
+                cur = await db.execute(
+                    f"INSERT INTO tasks ({', '.join(_NEW_COLUMNS)}) VALUES {values} RETURNING *",
+                    [v for t in chunk
+                     for v in (t.user_id, t.title, t.category, t.due_at, created, t.pre_offset_minutes, t.rrule)]
+                )
+                out += await cur.fetchall()
+            next_at = await rebuild_reminders(db, out)
+            await db.commit()
+        reminder_queue.notify(next_at)
+        return out
+
+    async def _update_one(self, sql: str, params: tuple, drop_snoozes: bool = False,
+                          sync: bool = True) -> Optional[Task]:
+        """UPDATE … RETURNING * одной задачи и, если нужно, пересборка её напоминаний по этой же строке."""
+        next_at = None
+        async with db_conn() as db:
+            cur = await db.execute(sql + " RETURNING *", params)
+            row = await cur.fetchone()
+            if row is None:
+                return None
+            if sync:
+                next_at = await sync_row_reminders(db, row, drop_snoozes)
+            await db.commit()
+        reminder_queue.notify(next_at)
+        return row
+
+    async def reschedule(self, user_id: int, task_id: int, due_at: Optional[int]) -> Optional[Task]:
+        return await self._update_one(
+            "UPDATE tasks SET due_at=?, reminded_at=NULL, pre_reminded_at=NULL WHERE id=? AND user_id=?",
+            (due_at, task_id, user_id)
+        )
+
+    async def reschedule_many(self, user_id: int, changes: Sequence[tuple[int, Optional[int]]]) -> int:
+        if not changes:
+            return 0
+        async with db_conn() as db:
+            await db.executemany(
+                "UPDATE tasks SET due_at=?, reminded_at=NULL, pre_reminded_at=NULL WHERE id=? AND user_id=?",
+                [(due_at, task_id, user_id) for task_id, due_at in changes]
+            )
+            rows = await self._select_ids(db, user_id, [task_id for task_id, _ in changes])
+            next_at = await rebuild_reminders(db, rows)
+            await db.commit()
+        reminder_queue.notify(next_at)
+        return len(rows)
+
+    async def _select_ids(self, db, user_id: int, task_ids: Sequence[int]) -> list[Task]:
+        rows = []
+        for i in range(0, len(task_ids), _IN_CHUNK):
+            chunk = list(task_ids[i:i + _IN_CHUNK])
+            cur = await db.execute(
+                f"SELECT * FROM tasks WHERE user_id=? AND id IN ({', '.join('?' * len(chunk))})", [user_id, *chunk]
+            )
+            rows += await cur.fetchall()
+        return rows
+
+    async def complete(self, user_id: int, task_id: int, now: Optional[datetime] = None) -> Optional[Task]:
+        next_at = None
+        async with db_conn() as db:
+            # обычная задача (без повтора) — один UPDATE; повторяющуюся сначала читаем
+            cur = await db.execute(
+                "UPDATE tasks SET is_done=1, done_at=? WHERE id=? AND user_id=? AND rrule IS NULL AND is_done=0 "
+                "RETURNING *", (now_ts(), task_id, user_id)
+            )
+            row = await cur.fetchone()
+            if row is None:
+                cur = await db.execute("SELECT * FROM tasks WHERE id=? AND user_id=?", (task_id, user_id))
+                row = await cur.fetchone()
+                if row is None or row["is_done"]:
+                    # уже выполнена (старая клавиатура, двойное нажатие) — done_at не сдвигаем
+                    return row
+                found = next_occurrence(row, now or now_local())
+                if found is not None:
+                    cur = await db.execute(
+                        "UPDATE tasks SET due_at=?, rrule=?, is_done=0, reminded_at=NULL, pre_reminded_at=NULL "
+                        "WHERE id=? RETURNING *", (*found, task_id)
+                    )
+                    row = await cur.fetchone()
+                    next_at = await sync_row_reminders(db, row, drop_snoozes=True)
+                else:
+                    cur = await db.execute("UPDATE tasks SET is_done=1, done_at=? WHERE id=? AND is_done=0 RETURNING *",
+                                           (now_ts(), task_id))
+                    row = await cur.fetchone()
+            if row["is_done"]:
+                await drop_task_reminders(db, [task_id])
+            await db.commit()
+        reminder_queue.notify(next_at)
+        return row
+
+    async def complete_many(self, user_id: int, task_ids: Sequence[int], now: Optional[datetime] = None) -> list[Task]:
+        now = now or now_local()
+        done_at = now_ts()
+        async with db_conn() as db:
+            rows = await self._select_ids(db, user_id, task_ids)
+            done, advanced, closed = [], [], []
+            for r in rows:
+                if r["is_done"]:
+                    done.append(r)  # уже выполнена — строка как есть, done_at не сдвигаем
+                    continue
+                found = next_occurrence(r, now)
+                if found is None:
+                    done.append(dict(r, is_done=1, done_at=done_at))
+                    closed.append(r["id"])
+                else:
+                    advanced.append(dict(r, due_at=found[0], rrule=found[1], is_done=0,
+                                         reminded_at=None, pre_reminded_at=None))
+            if closed:
+                await db.executemany("UPDATE tasks SET is_done=1, done_at=? WHERE id=? AND is_done=0",
+                                     [(done_at, task_id) for task_id in closed])
+            if advanced:
+                await db.executemany(
+                    "UPDATE tasks SET due_at=?, rrule=?, is_done=0, reminded_at=NULL, pre_reminded_at=NULL WHERE id=?",
+                    [(r["due_at"], r["rrule"], r["id"]) for r in advanced]
+                )
+            await drop_task_reminders(db, closed + [r["id"] for r in advanced])
+            next_at = await rebuild_reminders(db, advanced)
+            await db.commit()
+        reminder_queue.notify(next_at)
+        return done + advanced
+
+    async def delete(self, user_id: int, task_id: int) -> bool:
+        async with db_conn() as db:
+            cur = await db.execute("DELETE FROM tasks WHERE id=? AND user_id=?", (task_id, user_id))
+            deleted = cur.rowcount > 0
+            if deleted:
+                await drop_task_reminders(db, [task_id])
+            await db.commit()
+        return deleted
+
+    async def set_category(self, user_id: int, task_id: int, category: Optional[str]) -> Optional[Task]:
+        return await self._update_one("UPDATE tasks SET category=? WHERE id=? AND user_id=?",
+                                      (category, task_id, user_id), sync=False)
+
+    async def set_rrule(self, user_id: int, task_id: int, rrule: Optional[str]) -> Optional[Task]:
+        return await self._update_one("UPDATE tasks SET rrule=? WHERE id=? AND user_id=?", (rrule, task_id, user_id))
+
+    async def set_pre_offsets(self, user_id: int, task_id: int, offsets: Optional[str]) -> Optional[Task]:
+        return await self._update_one(
+            "UPDATE tasks SET pre_offsets=?, pre_reminded_at=NULL WHERE id=? AND user_id=?",
+            (offsets, task_id, user_id)
+        )
+
+    async def snooze(self, user_id: int, task_id: int, minutes: int = SNOOZE_MINUTES) -> Optional[int]:
+        fire_at = now_ts() + minutes * 60
+        async with db_conn() as db:
+            # проверка задачи и вставка — одним INSERT … SELECT
+            cur = await db.execute(
+                "INSERT INTO reminders (task_id, user_id, kind, offset_minutes, fire_at) "
+                "SELECT id, user_id, 'snooze', ?, ? FROM tasks WHERE id=? AND user_id=? AND is_done=0",
+                (minutes, fire_at, task_id, user_id)
+            )
+            if not cur.rowcount:
+                return None
+            await db.commit()
+        reminder_queue.notify(fire_at)
+        return fire_at
+
+    async def list_page(self, user_id: int, category: Optional[str], direction: str = "f",
+                        cursor: tuple[Optional[int], int] = (None, 0), limit: int = 10) -> list[Task]:
+        params: list = [user_id]
+        if category is not None:
+            params.append(category)
+        if direction in ("n", "p"):
+            key, task_id = _sort_key(*cursor)
+            params += (key, key, task_id)
+        params.append(limit)
+        async with db_conn() as db:
+            cur = await db.execute(_page_sql(category is not None, direction), params)
+            return await cur.fetchall()
+
+    async def claim_reminders(self, db, now: datetime, limit: int) -> tuple[int, list[Fired]]:
+        ts = int(now.timestamp())
+        cur = await db.execute(CLAIM_REMINDERS_SQL, (ts, limit))
+        claimed = await cur.fetchall()
+        if not claimed:
+            return 0, []
+        task_ids = list({c["task_id"] for c in claimed})
+        cur = await db.execute(
+            f"SELECT * FROM tasks WHERE id IN ({', '.join('?' * len(task_ids))}) AND is_done=0", task_ids
+        )
+        tasks = {r["id"]: r for r in await cur.fetchall()}  # строки без живой задачи просто удалены
+
+        fired, pre_sent, due_sent, advanced = [], [], [], []
+        for c in claimed:
+            r = tasks.get(c["task_id"])
+            if r is None:
+                continue
+            fired.append(Fired(r, c["kind"], c["offset_minutes"]))
+            if c["kind"] == "pre":
+                pre_sent.append((ts, r["id"]))
+            elif c["kind"] == "due":
+                # основное напоминание ушло: повторяющуюся задачу переносим на следующий срок
+                found = next_occurrence(r, now)
+                if found is None:
+                    due_sent.append((ts, r["id"]))
+                else:
+                    advanced.append(dict(r, due_at=found[0], rrule=found[1], reminded_at=None, pre_reminded_at=None))
+        if pre_sent:
+            await db.executemany("UPDATE tasks SET pre_reminded_at=? WHERE id=?", pre_sent)
+        if due_sent:
+            await db.executemany("UPDATE tasks SET reminded_at=? WHERE id=?", due_sent)
+        if advanced:
+            await db.executemany(
+                "UPDATE tasks SET due_at=?, rrule=?, reminded_at=NULL, pre_reminded_at=NULL WHERE id=?",
+                [(r["due_at"], r["rrule"], r["id"]) for r in advanced]
+            )
+            await rebuild_reminders(db, advanced)
+        return len(claimed), fired
+
+    async def next_fire_at(self) -> Optional[int]:
+        async with db_conn() as db:
+            cur = await db.execute("SELECT MIN(fire_at) AS next_at FROM reminders")
+            return (await cur.fetchone())["next_at"]
+
+
+class MemoryTaskRepository(TaskRepository):
+    """
+    Те же операции в словарях процесса, без БД. Напоминания считаются тем же
+    reminder_rows; дефолтные пред-офсеты пользователей — в default_pre_offsets.
+    """
+
+    def __init__(self):
+        self._tasks: dict[int, dict] = {}
+        self._by_user: dict[int, set[int]] = {}
+        self._ids = itertools.count(1)
+        self._reminders: dict[int, tuple] = {}  # id -> (task_id, user_id, kind, offset_minutes, fire_at)
+        self._by_task: dict[int, set[int]] = {}
+        self._heap: list[tuple[int, int]] = []  # (fire_at, id); удалённые пропускаются при извлечении
+        self._reminder_ids = itertools.count(1)
+        self.default_pre_offsets: dict[int, Optional[int]] = {}
+
+    def _own(self, user_id: int, task_id: int) -> Optional[dict]:
+        t = self._tasks.get(task_id)
+        return t if t is not None and t["user_id"] == user_id else None
+
+    def _add_reminder(self, row: tuple):
+        rid = next(self._reminder_ids)
+        self._reminders[rid] = row
+        self._by_task.setdefault(row[0], set()).add(rid)
+        heapq.heappush(self._heap, (row[4], rid))
+
+    def _drop_reminder(self, rid: int):
+        task_id = self._reminders.pop(rid)[0]
+        self._by_task[task_id].discard(rid)
+
+    def _drop_all(self, task_id: int):
+        for rid in self._by_task.pop(task_id, ()):
+            del self._reminders[rid]
+
+    def _sync(self, t: dict, drop_snoozes: bool = False) -> Optional[int]:
+        for rid in list(self._by_task.get(t["id"], ())):
+            if self._reminders[rid][2] != "snooze" or t["is_done"] or drop_snoozes:
+                self._drop_reminder(rid)
+        rows = reminder_rows(dict(t, default_pre_offset_minutes=self.default_pre_offsets.get(t["user_id"])), now_ts())
+        for row in rows:
+            self._add_reminder(row)
+        return min((row[4] for row in rows), default=None)
+
+    def _notify_min(self, fire_ats: Iterable[Optional[int]]):
+        reminder_queue.notify(min((f for f in fire_ats if f is not None), default=None))
+
+    async def get(self, user_id: int, task_id: int) -> Optional[Task]:
+        t = self._own(user_id, task_id)
+        return dict(t) if t is not None else None
+
+    async def create(self, task: NewTask) -> Task:
+        return (await self.create_many([task]))[0]
+
+    async def create_many(self, tasks: Sequence[NewTask]) -> list[Task]:
+        created = now_ts()
+        out, fire_ats = [], []
+        for n in tasks:
+            t = {"id": next(self._ids), "user_id": n.user_id, "title": n.title, "category": n.category,
+                 "due_at": n.due_at, "is_done": 0, "created_at": created, "reminded_at": None,
+                 "pre_offset_minutes": n.pre_offset_minutes, "pre_reminded_at": None, "rrule": n.rrule,
+                 "pre_offsets": None, "done_at": None}
+            self._tasks[t["id"]] = t
+            self._by_user.setdefault(n.user_id, set()).add(t["id"])
+            fire_ats.append(self._sync(t))
+            out.append(dict(t))
+        self._notify_min(fire_ats)
+        return out
+
+    def _update(self, user_id: int, task_id: int, values: dict, sync: bool = True,
+                drop_snoozes: bool = False) -> Optional[Task]:
+        t = self._own(user_id, task_id)
+        if t is None:
+            return None
+        t.update(values)
+        if sync:
+            reminder_queue.notify(self._sync(t, drop_snoozes))
+        return dict(t)
+
+    async def reschedule(self, user_id: int, task_id: int, due_at: Optional[int]) -> Optional[Task]:
+        return self._update(user_id, task_id, {"due_at": due_at, "reminded_at": None, "pre_reminded_at": None})
+
+    async def reschedule_many(self, user_id: int, changes: Sequence[tuple[int, Optional[int]]]) -> int:
+        return sum([await self.reschedule(user_id, task_id, due_at) is not None for task_id, due_at in changes])
+
+    async def complete(self, user_id: int, task_id: int, now: Optional[datetime] = None) -> Optional[Task]:
+        t = self._own(user_id, task_id)
+        if t is None or t["is_done"]:
+            return None if t is None else dict(t)  # уже выполнена — done_at не сдвигаем
+        found = next_occurrence(t, now or now_local())
+        if found is None:
+            t.update(is_done=1, done_at=now_ts())
+            self._drop_all(task_id)
+            return dict(t)
+        return self._update(user_id, task_id, {"due_at": found[0], "rrule": found[1], "is_done": 0,
+                                               "reminded_at": None, "pre_reminded_at": None}, drop_snoozes=True)
+
+    async def complete_many(self, user_id: int, task_ids: Sequence[int], now: Optional[datetime] = None) -> list[Task]:
+        now = now or now_local()
+        out = []
+        for task_id in task_ids:
+            t = await self.complete(user_id, task_id, now)
+            if t is not None:
+                out.append(t)
+        return out
+
+    async def delete(self, user_id: int, task_id: int) -> bool:
+        if self._own(user_id, task_id) is None:
+            return False
+        del self._tasks[task_id]
+        self._by_user[user_id].discard(task_id)
+        self._drop_all(task_id)
+        return True
+
+    async def set_category(self, user_id: int, task_id: int, category: Optional[str]) -> Optional[Task]:
+        return self._update(user_id, task_id, {"category": category}, sync=False)
+
+    async def set_rrule(self, user_id: int, task_id: int, rrule: Optional[str]) -> Optional[Task]:
+        return self._update(user_id, task_id, {"rrule": rrule})
+
+    async def set_pre_offsets(self, user_id: int, task_id: int, offsets: Optional[str]) -> Optional[Task]:
+        return self._update(user_id, task_id, {"pre_offsets": offsets, "pre_reminded_at": None})
+
+    async def snooze(self, user_id: int, task_id: int, minutes: int = SNOOZE_MINUTES) -> Optional[int]:
+        t = self._own(user_id, task_id)
+        if t is None or t["is_done"]:
+            return None
+        fire_at = now_ts() + minutes * 60
+        self._add_reminder((task_id, user_id, "snooze", minutes, fire_at))
+        reminder_queue.notify(fire_at)
+        return fire_at
+
+    async def list_page(self, user_id: int, category: Optional[str], direction: str = "f",
+                        cursor: tuple[Optional[int], int] = (None, 0), limit: int = 10) -> list[Task]:
+        key = lambda t: _sort_key(t["due_at"], t["id"])  # noqa: E731
+        rows = [t for t in map(self._tasks.__getitem__, self._by_user.get(user_id, ()))
+                if not t["is_done"] and (category is None or t["category"] == category)]
+        if direction == "n":
+            rows = [t for t in rows if key(t) > _sort_key(*cursor)]
+        elif direction == "p":
+            rows = [t for t in rows if key(t) < _sort_key(*cursor)]
+            return [dict(t) for t in heapq.nlargest(limit, rows, key)]
+        return [dict(t) for t in heapq.nsmallest(limit, rows, key)]
+
+    async def claim_reminders(self, db, now: datetime, limit: int) -> tuple[int, list[Fired]]:
+        ts = int(now.timestamp())
+        claimed = []
+        while self._heap and self._heap[0][0] <= ts and len(claimed) < limit:
+            _, rid = heapq.heappop(self._heap)
+            if rid in self._reminders:
+                claimed.append(self._reminders[rid])
+                self._drop_reminder(rid)
+        # как в SQLite: все напоминания пачки видят строку задачи до изменений
+        before = {task_id: dict(t) for task_id, *_ in claimed
+                  if (t := self._tasks.get(task_id)) is not None and not t["is_done"]}
+        fired = []
+        for task_id, _, kind, offset, _ in claimed:
+            if task_id not in before:
+                continue
+            t = self._tasks[task_id]
+            fired.append(Fired(before[task_id], kind, offset))
+            if kind == "pre":
+                t["pre_reminded_at"] = ts
+            elif kind == "due":
+                found = next_occurrence(t, now)
+                if found is None:
+                    t["reminded_at"] = ts
+                else:
+                    t.update(due_at=found[0], rrule=found[1], reminded_at=None, pre_reminded_at=None)
+                    self._sync(t)
+        return len(claimed), fired
+
+    async def next_fire_at(self) -> Optional[int]:
+        while self._heap and self._heap[0][1] not in self._reminders:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+
+_repository: TaskRepository = SQLiteTaskRepository()
+
+
+def task_repo() -> TaskRepository:
+    return _repository
+
+
+def use_repository(repo: TaskRepository) -> TaskRepository:
+    """Подменить хранилище (MemoryTaskRepository в бенчмарках); возвращает прежнее."""
+    global _repository
+    previous, _repository = _repository, repo
+    return previous
@@ -1,117 +1,228 @@
+import asyncio
+import logging
 from aiogram import Bot
 from .db import db_conn
-from .utils import now_local, to_iso, parse_local_dt, pretty_task
-from .models import next_occurrence
-from .keyboards import inline_task_actions
-from .config import TZ
+from .utils import now_local, format_ts, render_cards, pack_messages
+from .timer_queue import reminder_queue, MAX_SLEEP_SECONDS
+from .repository import task_repo
+from .outbox import outbox, add_messages
+from .config import TZ, MORNING_DIGEST_HOUR, DIGEST_WINDOW_MINUTES, DIGEST_CATCHUP_MINUTES, DIGEST_LEASE_SECONDS
+from .leases import acquire_lease
+from .metrics import scheduler_tick_seconds, reminders_fired, digest_seconds, digests_queued
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from typing import AsyncIterator, Optional
 
-async def check_pre_and_due(bot: Bot):
-    now = now_local().replace(second=0, microsecond=0)
-    now_iso = to_iso(now)
+log = logging.getLogger(__name__)
 
-    async with db_conn() as db:
-        # Пред-напоминания
-        cur = await db.execute(
-            "SELECT t.*, "
-            "(CASE WHEN t.pre_offset_minutes IS NOT NULL THEN t.pre_offset_minutes "
-            " ELSE us.default_pre_offset_minutes END) AS eff_pre "
-            "FROM tasks t LEFT JOIN user_settings us ON us.user_id=t.user_id "
-            "WHERE t.is_done=0 AND t.due_at IS NOT NULL AND t.pre_reminded_at IS NULL"
-        )
-        rows = await cur.fetchall()
-        for r in rows:
-            due = parse_local_dt(r["due_at"])
-            if not due:
-                continue
-            eff_pre = r["eff_pre"]
-            if eff_pre is None or eff_pre <= 0:
-                continue
-            pre_time = due - timedelta(minutes=int(eff_pre))
-            if now >= pre_time:
-                try:
-                    await bot.send_message(
-                        r["user_id"],
-                        f"🔔 Пред-напоминание: задача #{r['id']} — «{r['title']}»\n"
-                        f"Срок: {r['due_at']} (за {int(eff_pre)} мин)",
-                        reply_markup=inline_task_actions(r["id"])
-                    )
-                except Exception:
-                    pass
-                await db.execute("UPDATE tasks SET pre_reminded_at=? WHERE id=?", (now_iso, r["id"]))
-        await db.commit()
-
-        # Основные напоминания
-        cur = await db.execute(
-            "SELECT * FROM tasks WHERE is_done=0 AND due_at IS NOT NULL AND reminded_at IS NULL AND due_at <= ?",
-            (now_iso,)
-        )
-        rows = await cur.fetchall()
-        for r in rows:
-            try:
-                await bot.send_message(
-                    r["user_id"],
-                    f"⏰ Напоминание: срок задачи #{r['id']} — «{r['title']}» наступил.\nСрок: {r['due_at']}",
-                    reply_markup=inline_task_actions(r["id"])
-                )
-            except Exception:
-                pass
-
-            if r["rrule"] and r["due_at"]:
-                due = parse_local_dt(r["due_at"])
-                nxt = due
-                safety = 0
-                while nxt is not None and nxt <= now and safety < 1000:
-                    nxt = next_occurrence(nxt, r["rrule"])
-                    safety += 1
-                if nxt and nxt > now:
-                    await db.execute(
-                        "UPDATE tasks SET due_at=?, reminded_at=NULL, pre_reminded_at=NULL WHERE id=?",
-                        (to_iso(nxt), r["id"])
-                    )
-                else:
-                    await db.execute("UPDATE tasks SET reminded_at=? WHERE id=?", (now_iso, r["id"]))
-            else:
-                await db.execute("UPDATE tasks SET reminded_at=? WHERE id=?", (now_iso, r["id"]))
-        await db.commit()
+REMINDER_BATCH = 500
+
+def _reminder_text(r, kind: str, offset_minutes: Optional[int]) -> str:
+    if kind == "pre":
+        return (f"🔔 Пред-напоминание: задача #{r['id']} — «{r['title']}»\n"
+                f"Срок: {format_ts(r['due_at'])} (за {offset_minutes} мин)")
+    if kind == "snooze":
+        return f"⏰ Отложенное напоминание: задача #{r['id']} — «{r['title']}»\nСрок: {format_ts(r['due_at'])}"
+    return f"⏰ Напоминание: срок задачи #{r['id']} — «{r['title']}» наступил.\nСрок: {format_ts(r['due_at'])}"
+
+async def check_pre_and_due() -> Optional[int]:
+    """
+    Забираем наступившие reminders пачками и в той же транзакции кладём
+    сообщения в outbox; сеть здесь не трогаем. Возвращает следующий fire_at.
+    """
+    with scheduler_tick_seconds.time():
+        return await _check_pre_and_due()
+
+async def _check_pre_and_due() -> Optional[int]:
+    now = now_local()
+    repo = task_repo()
+
+    while True:
+        async with db_conn() as db:
+            claimed, fired = await repo.claim_reminders(db, now, REMINDER_BATCH)
+            messages = []
+            for f in fired:
+                messages.append((f.task["user_id"], _reminder_text(f.task, f.kind, f.offset_minutes), f.task["id"]))
+                reminders_fired.inc(f.kind)
+            await add_messages(db, messages)
+            await db.commit()
+        if messages:
+            outbox.notify()
+        if claimed < REMINDER_BATCH:
+            break  # неполная пачка — наступивших больше нет
+
+    return await repo.next_fire_at()
+
+async def run_reminders():
+    """Событийный цикл напоминаний: спим ровно до ближайшего fire_at."""
+    await reminder_queue.load()
+    while True:
+        delay = reminder_queue.seconds_until_next()
+        if delay is None or delay > 0:
+            if not await reminder_queue.wait(delay) and (delay is None or delay > MAX_SLEEP_SECONDS):
+                # напоминания могли добавить другие процессы бота — сверяемся с БД
+                await reminder_queue.load()
+            continue
+        reminder_queue.pop_due()
+        try:
+            reminder_queue.notify(await check_pre_and_due())
+        except Exception as e:
+            log.exception("reminders tick failed: %r", e)
+            await asyncio.sleep(1)
+            await reminder_queue.load()
+
+DIGEST_FETCH = 1000
+
+def format_digest(overdue: list, today_rows: list, now: Optional[datetime] = None) -> list[str]:
+    """Текст сводки, разбитый на сообщения по MAX_MESSAGE (разрыв только между задачами)."""
+    now = now or now_local()
+    parts = ["Утренняя сводка задач:"]
+    for title, rows in (("❗ Просроченные:", overdue), ("📅 Сегодня:", today_rows)):
+        if not rows:
+            continue
+        cards = render_cards(rows, now)
+        # заголовок раздела — вместе с первой задачей, чтобы не остался в конце сообщения
+        lead = "\n" if len(parts) > 1 else ""
+        parts.append(f"{lead}{title}\n— {cards[0]}")
+        parts += [f"— {c}" for c in cards[1:]]
+    return [text for text, _ in pack_messages(parts, "\n")]
+
+def _digest_sql(by_group: bool, by_range: bool) -> str:
+    """Параметры: конец дня, [tz по умолч., tz, час по умолч., час, начало дня], [user_id от, до]."""
+    sql = "SELECT t.* FROM tasks t "
+    where = "t.is_done=0 AND t.due_at IS NOT NULL AND t.due_at < ?"
+    if by_group:
+        sql += "LEFT JOIN user_settings us ON us.user_id=t.user_id "
+        where += (" AND COALESCE(us.tz, ?)=? AND COALESCE(us.digest_hour, ?)=?"
+                  " AND NOT EXISTS (SELECT 1 FROM digest_log d WHERE d.user_id=t.user_id AND d.sent_on >= ?)")
+    if by_range:
+        # диапазон user_id индекс idx_tasks_open_digest находит поиском, остаток от деления — нет
+        where += " AND t.user_id >= ? AND t.user_id < ?"
+    return sql + f"WHERE {where} ORDER BY t.user_id, t.due_at"
+
+# Границы user_id открытых задач со сроком: два поиска по краям индекса
+_USER_SPAN_SQL = (
+    "SELECT (SELECT MIN(user_id) FROM tasks WHERE is_done=0 AND due_at IS NOT NULL), "
+    "(SELECT MAX(user_id) FROM tasks WHERE is_done=0 AND due_at IS NOT NULL)"
+)
+_MARK_SENT_SQL = (
+    "INSERT INTO digest_log (user_id, sent_on) VALUES (?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET sent_on=excluded.sent_on"
+)
+# сводок в одной транзакции записи: писатель не занят надолго
+DIGEST_COMMIT_USERS = 500
+
+async def iter_digests(
+    db, start: datetime, end: datetime,
+    group: Optional[tuple[str, int]] = None, users: Optional[tuple[int, int]] = None
+) -> AsyncIterator[tuple[int, str]]:
+    """
+    Один упорядоченный проход по открытым задачам со сроком до конца дня.
+    Строки читаем пачками и отдаём сводку (список сообщений), как только
+    сменился user_id, — в памяти задачи только одного пользователя.
+    group=(tz, час) — только пользователи с такими настройками сводки,
+    которым сегодняшняя сводка ещё не ушла (digest_log);
+    users=(от, до) — только user_id из [от, до) (срез окна доставки).
+    """
+    start_ts, end_ts = int(start.timestamp()), int(end.timestamp())
+    params: list = [end_ts]
+    if group:
+        params += [TZ.key, group[0], MORNING_DIGEST_HOUR, group[1], start_ts]
+    if users:
+        params += list(users)
+    cur = await db.execute(_digest_sql(group is not None, users is not None), params)
+    now = now_local()  # один момент на все карточки прохода
+    uid, overdue, today_rows = None, [], []
+    while True:
+        chunk = await cur.fetchmany(DIGEST_FETCH)
+        if not chunk:
+            break
+        for r in chunk:
+            if r["user_id"] != uid:
+                if uid is not None:
+                    yield uid, format_digest(overdue, today_rows, now)
+                uid, overdue, today_rows = r["user_id"], [], []
+            (overdue if r["due_at"] < start_ts else today_rows).append(r)
+    if uid is not None:
+        yield uid, format_digest(overdue, today_rows, now)
+
+async def digest_groups(db) -> set[tuple[str, int]]:
+    """Все сочетания (часовой пояс, час сводки); дефолтное есть всегда."""
+    cur = await db.execute(
+        "SELECT DISTINCT COALESCE(tz, ?) AS tz, COALESCE(digest_hour, ?) AS hour FROM user_settings",
+        (TZ.key, MORNING_DIGEST_HOUR)
+    )
+    groups = {(r["tz"], r["hour"]) for r in await cur.fetchall()}
+    groups.add((TZ.key, MORNING_DIGEST_HOUR))
+    return groups
+
+# группа (tz, час) -> (начало её дня, первый user_id следующего среза); только ускорение:
+# после перезапуска срезы начинаются заново, а повторы отсекает digest_log
+_digest_cursor: dict[tuple[str, int], tuple[int, int]] = {}
 
 async def send_morning_digest(bot: Bot):
-    from .config import TZ
-    today = now_local().date()
-    start = datetime(today.year, today.month, today.day, 0, 0, tzinfo=TZ)
-    end = start + timedelta(days=1)
+    """
+    Запускается раз в минуту. Сводка группы (tz, час) растянута на
+    DIGEST_WINDOW_MINUTES: к k-й минуте после часа уходят пользователи из первых
+    (k+1)/window диапазона user_id. Сообщения пишутся в outbox, отправляет его цикл.
+    Срез пропущенной минуты уходит следующим тиком (до DIGEST_CATCHUP_MINUTES
+    после окна); кому сводка уже в outbox — в digest_log.
+    При нескольких процессах работает только владелец аренды 'digest'.
+    """
+    if not await acquire_lease("digest", DIGEST_LEASE_SECONDS):
+        return  # сводки шлёт другой процесс бота
+    with digest_seconds.time():
+        await _send_digests()
+
+async def _send_digests():
+    now = now_local()
+    window = max(1, DIGEST_WINDOW_MINUTES)
+    span = None
 
     async with db_conn() as db:
-        cur = await db.execute("SELECT DISTINCT user_id FROM tasks WHERE is_done=0")
-        users = [r["user_id"] for r in await cur.fetchall()]
-        for uid in users:
-            cur1 = await db.execute(
-                "SELECT * FROM tasks WHERE user_id=? AND is_done=0 AND due_at IS NOT NULL AND due_at < ? "
-                "ORDER BY due_at ASC",
-                (uid, to_iso(start))
-            )
-            overdue = await cur1.fetchall()
-            cur2 = await db.execute(
-                "SELECT * FROM tasks WHERE user_id=? AND is_done=0 AND due_at IS NOT NULL AND due_at >= ? AND due_at < ? "
-                "ORDER BY due_at ASC",
-                (uid, to_iso(start), to_iso(end))
-            )
-            today_rows = await cur2.fetchall()
-
-            if not overdue and not today_rows:
+        for tz_name, hour in await digest_groups(db):
+            try:
+                tz = ZoneInfo(tz_name)
+            except (ZoneInfoNotFoundError, ValueError):
                 continue
+            local = now.astimezone(tz)
+            k = local.hour * 60 + local.minute - hour * 60
+            if not 0 <= k < window + DIGEST_CATCHUP_MINUTES:
+                continue
+            if span is None:
+                cur = await db.execute(_USER_SPAN_SQL)
+                span = tuple(await cur.fetchone())
+            lo, hi = span
+            if lo is None:
+                return  # открытых задач со сроком нет ни у кого
+            start = datetime(local.year, local.month, local.day, tzinfo=tz)
+            end = start + timedelta(days=1)
+            start_ts = int(start.timestamp())
+            day, first = _digest_cursor.get((tz_name, hour), (None, lo))
+            if day != start_ts:
+                first = lo
+            # последний срез — до конца диапазона, включая пользователей, появившихся за окно
+            upper = lo + (hi - lo + 1) * (k + 1) // window if k + 1 < window else hi + 1
+            if first >= upper:
+                continue
+            digests = []
+            async for uid, texts in iter_digests(db, start, end, group=(tz_name, hour), users=(first, upper)):
+                digests.append((uid, texts))
+                if len(digests) >= DIGEST_COMMIT_USERS:
+                    await _queue_digests(db, digests, start_ts)
+                    digests = []
+            await _queue_digests(db, digests, start_ts)
+            _digest_cursor[(tz_name, hour)] = (start_ts, upper)
 
-            lines = []
-            if overdue:
-                lines.append("❗ Просроченные:")
-                lines += [f"— {pretty_task(r)}" for r in overdue]
-            if today_rows:
-                if lines:
-                    lines.append("")
-                lines.append("📅 Сегодня:")
-                lines += [f"— {pretty_task(r)}" for r in today_rows]
-
-            try:
-                await bot.send_message(uid, "Утренняя сводка задач:\n" + "\n".join(lines))
-            except Exception:
-                pass
+async def _queue_digests(db, digests: list[tuple[int, list[str]]], day_ts: int):
+    """
+    Сообщения сводок — в outbox, отметка — в digest_log, одной транзакцией:
+    «отмечено» значит «надёжно в очереди», сбой до отправки сводку не теряет.
+    """
+    if not digests:
+        return
+    await add_messages(db, [(uid, text, None) for uid, texts in digests for text in texts], kind="digest")
+    await db.executemany(_MARK_SENT_SQL, [(uid, day_ts) for uid, _ in digests])
+    await db.commit()
+    digests_queued.inc(value=len(digests))
+    outbox.notify()
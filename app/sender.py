@@ -0,0 +1,165 @@
+# app/sender.py
+# Общая очередь исходящих сообщений: приоритеты (напоминания → сводки → карточки),
+# token bucket на весь бот и на каждый чат, ограниченная параллельность
+# и соблюдение retry_after из ответов 429.
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from .config import SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_WORKERS, SEND_MAX_RETRIES
+from .metrics import Gauge, send_seconds, messages_sent, send_failures, send_retry_after
+
+log = logging.getLogger(__name__)
+
+PRIO_REMINDER = 0
+PRIO_DIGEST = 1
+PRIO_LIST = 2
+_PRIO_NAMES = {PRIO_REMINDER: "reminder", PRIO_DIGEST: "digest", PRIO_LIST: "list"}
+
+# сколько неактивных чатов держим до чистки их бакетов
+_CHATS_PRUNE_AT = 5000
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self) -> float:
+        """0 — токен взят; иначе сколько секунд ждать до следующего."""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while (d := self.delay()) > 0:
+            await asyncio.sleep(d)
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class _Chat:
+    __slots__ = ("items", "bucket", "active", "last_used")
+
+    def __init__(self):
+        self.items: list[tuple] = []  # куча (prio, seq, text, kwargs, fut, attempt)
+        self.bucket = TokenBucket(SEND_CHAT_RATE, SEND_CHAT_BURST)
+        self.active = False  # чат стоит в _ready / ждёт бакета / отправляется
+        self.last_used = time.monotonic()
+
+
+class SendQueue:
+    """
+    В _ready у каждого чата не больше одной записи — сообщения одного чата
+    уходят строго по очереди, а длинный список одного пользователя
+    не занимает всех воркеров.
+    """
+
+    def __init__(self):
+        self._ready: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._chats: dict[int, _Chat] = {}
+        self._seq = itertools.count()
+        self._global = TokenBucket(SEND_GLOBAL_RATE, SEND_GLOBAL_RATE)
+        self._bot: Optional[Bot] = None
+        self._workers: list[asyncio.Task] = []
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(SEND_WORKERS)]
+
+    async def stop(self):
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    def send_message(self, chat_id: int, text: str, priority: int = PRIO_LIST, **kwargs) -> asyncio.Future:
+        """Поставить сообщение в очередь; future резолвится отправленным Message."""
+        fut = asyncio.get_running_loop().create_future()
+        fut.add_done_callback(_log_failure)
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            if len(self._chats) >= _CHATS_PRUNE_AT:
+                self._prune()
+            chat = self._chats[chat_id] = _Chat()
+        heapq.heappush(chat.items, (priority, next(self._seq), text, kwargs, fut, 0))
+        if not chat.active:
+            chat.active = True
+            self._schedule(chat_id, chat)
+        return fut
+
+    def _schedule(self, chat_id: int, chat: _Chat):
+        prio, seq = chat.items[0][:2]
+        self._ready.put_nowait((prio, seq, chat_id))
+
+    def _prune(self):
+        cutoff = time.monotonic() - 60
+        for chat_id in [cid for cid, c in self._chats.items() if not c.active and c.last_used < cutoff]:
+            del self._chats[chat_id]
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            prio, seq, chat_id = await self._ready.get()
+            chat = self._chats[chat_id]
+            delay = chat.bucket.delay()
+            if delay > 0:
+                # чат исчерпал лимит — вернётся в очередь позже, воркер свободен
+                loop.call_later(delay, self._ready.put_nowait, (prio, seq, chat_id))
+                continue
+            await self._global.acquire()
+
+            prio, seq, text, kwargs, fut, attempt = heapq.heappop(chat.items)
+            t0 = time.perf_counter()
+            try:
+                msg = await self._bot.send_message(chat_id, text, **kwargs)
+            except TelegramRetryAfter as e:
+                send_retry_after.inc()
+                # 429 может прийти от общего лимита бота — притормаживаем все чаты, не только этот
+                chat.bucket.block(e.retry_after)
+                self._global.block(e.retry_after)
+                if attempt + 1 < SEND_MAX_RETRIES:
+                    heapq.heappush(chat.items, (prio, seq, text, kwargs, fut, attempt + 1))
+                elif not fut.done():
+                    fut.set_exception(e)
+            except Exception as e:
+                if not fut.done():
+                    fut.set_exception(e)
+            else:
+                messages_sent.inc(_PRIO_NAMES.get(prio, str(prio)))
+                if not fut.done():
+                    fut.set_result(msg)
+            send_seconds.observe(time.perf_counter() - t0)
+
+            chat.last_used = time.monotonic()
+            if chat.items:
+                self._schedule(chat_id, chat)
+            else:
+                chat.active = False
+
+
+def _log_failure(fut: asyncio.Future):
+    if not fut.cancelled() and fut.exception() is not None:
+        send_failures.inc(type(fut.exception()).__name__)
+        log.warning("send failed: %r", fut.exception())
+
+
+send_queue = SendQueue()
+Gauge("todobot_send_queue_chats", "Chats with messages waiting in the send queue",
+      lambda: sum(c.active for c in send_queue._chats.values()))
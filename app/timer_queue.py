@@ -0,0 +1,65 @@
+import asyncio
+import heapq
+from typing import Optional
+
+from .db import db_conn
+from .utils import now_local
+
+# Максимальный сон цикла напоминаний (страховка от перевода часов)
+MAX_SLEEP_SECONDS = 60
+
+
+class ReminderQueue:
+    """
+    Куча моментов пробуждения цикла напоминаний (unix-время).
+    Сами уведомления лежат в таблице reminders; куча лишь говорит,
+    когда делать range scan по fire_at. Более поздние моменты не храним:
+    после каждого скана следующий берётся из MIN(fire_at) по индексу.
+    Лишний (устаревший) элемент стоит одного пустого запроса.
+    """
+
+    def __init__(self):
+        self._heap: list[int] = []
+        self._changed = asyncio.Event()
+
+    def notify(self, fire_at: Optional[int]) -> None:
+        """Сообщить о новом (возможно, более раннем) моменте срабатывания."""
+        if fire_at is None:
+            return
+        if not self._heap or fire_at < self._heap[0]:
+            heapq.heappush(self._heap, int(fire_at))
+            self._changed.set()
+
+    async def load(self) -> None:
+        self._heap.clear()
+        async with db_conn() as db:
+            cur = await db.execute("SELECT MIN(fire_at) AS next_at FROM reminders")
+            r = await cur.fetchone()
+        self.notify(r["next_at"] if r else None)
+
+    def seconds_until_next(self) -> Optional[float]:
+        if not self._heap:
+            return None
+        return self._heap[0] - now_local().timestamp()
+
+    def pop_due(self) -> bool:
+        """Снять все наступившие моменты; True — пора сканировать reminders."""
+        now_ts = now_local().timestamp()
+        fired = False
+        while self._heap and self._heap[0] <= now_ts:
+            heapq.heappop(self._heap)
+            fired = True
+        return fired
+
+    async def wait(self, timeout: Optional[float]) -> bool:
+        """Спим до ближайшего момента или до появления более раннего; True — разбудил notify."""
+        self._changed.clear()
+        timeout = MAX_SLEEP_SECONDS if timeout is None else min(timeout, MAX_SLEEP_SECONDS)
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+reminder_queue = ReminderQueue()
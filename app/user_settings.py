@@ -0,0 +1,158 @@
+# app/user_settings.py
+# Настройки пользователя (дефолтный пред-офсет, часовой пояс и час сводки) —
+# единая точка доступа: LRU в памяти с TTL поверх таблицы user_settings.
+# Запись идёт сразу в БД и после commit обновляет кэш (write-through);
+# промахи пачки добираются одним запросом WHERE user_id IN (...).
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from .config import USER_SETTINGS_CACHE_SIZE, USER_SETTINGS_TTL_SECONDS
+from .db import db_conn
+
+_COLUMNS = ("default_pre_offset_minutes", "tz", "digest_hour")
+_SELECT_SQL = "SELECT user_id, default_pre_offset_minutes, tz, digest_hour FROM user_settings"
+_IN_CHUNK = 500
+
+
+@dataclass(frozen=True)
+class UserSettings:
+    """Сырые значения строки; None — «как по умолчанию» (config)."""
+    default_pre_offset_minutes: Optional[int] = None
+    tz: Optional[str] = None
+    digest_hour: Optional[int] = None
+
+
+DEFAULTS = UserSettings()
+
+
+def _from_row(r) -> UserSettings:
+    return UserSettings(r["default_pre_offset_minutes"], r["tz"], r["digest_hour"])
+
+
+class SettingsCache:
+    def __init__(self, max_size: int = USER_SETTINGS_CACHE_SIZE, ttl: float = USER_SETTINGS_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cache: OrderedDict[int, tuple[UserSettings, float]] = OrderedDict()
+        # номер последней записи: загрузка, во время которой была запись, в кэш не кладётся
+        self._writes = 0
+        # до этого момента в кэше вся таблица (после warm): промах = настроек нет, в БД не ходим
+        self._complete_until = 0.0
+
+    def _lookup(self, user_id: int, now: float) -> Optional[UserSettings]:
+        hit = self._cache.get(user_id)
+        if hit is None:
+            return None
+        if hit[1] < now:
+            del self._cache[user_id]
+            return None
+        self._cache.move_to_end(user_id)
+        return hit[0]
+
+    def put(self, user_id: int, settings: UserSettings):
+        self._cache[user_id] = (settings, time.monotonic() + self.ttl)
+        self._cache.move_to_end(user_id)
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+            self._complete_until = 0.0
+
+    def invalidate(self, user_id: int):
+        self._writes += 1
+        self._cache.pop(user_id, None)
+
+    def written(self, user_id: int, settings: UserSettings):
+        """Запись закоммичена: положить новое значение, а загрузки, начатые раньше, не кэшировать."""
+        self._writes += 1
+        self.put(user_id, settings)
+
+    async def get(self, user_id: int, db=None) -> UserSettings:
+        return (await self.get_many((user_id,), db))[user_id]
+
+    async def get_many(self, user_ids: Iterable[int], db=None) -> dict[int, UserSettings]:
+        """
+        Настройки пачки пользователей; промахи — одним запросом на _IN_CHUNK id.
+        db — соединение/сессия вызывающего (внутри его транзакции), иначе своя сессия.
+        """
+        now = time.monotonic()
+        out, missing = {}, []
+        for uid in set(user_ids):
+            s = self._lookup(uid, now)
+            if s is None:
+                missing.append(uid)
+            else:
+                out[uid] = s
+        if not missing:
+            return out
+        if now < self._complete_until:
+            return out | dict.fromkeys(missing, DEFAULTS)
+        writes = self._writes
+        if db is None:
+            async with db_conn() as session:
+                loaded = await self._load(session, missing)
+        else:
+            loaded = await self._load(db, missing)
+        cacheable = writes == self._writes
+        for uid in missing:
+            s = loaded.get(uid, DEFAULTS)
+            out[uid] = s
+            if cacheable:
+                self.put(uid, s)
+        return out
+
+    async def _load(self, db, user_ids: list[int]) -> dict[int, UserSettings]:
+        loaded = {}
+        for i in range(0, len(user_ids), _IN_CHUNK):
+            chunk = user_ids[i:i + _IN_CHUNK]
+            cur = await db.execute(f"{_SELECT_SQL} WHERE user_id IN ({', '.join('?' * len(chunk))})", chunk)
+            for r in await cur.fetchall():
+                loaded[r["user_id"]] = _from_row(r)
+        return loaded
+
+    async def warm(self) -> int:
+        """Загрузить настройки всех пользователей (до max_size) одним проходом; при старте."""
+        writes = self._writes
+        now = time.monotonic()
+        n = 0
+        async with db_conn() as db:
+            cur = await db.execute(f"{_SELECT_SQL} LIMIT ?", (self.max_size,))
+            while chunk := await cur.fetchmany(1000):
+                if writes != self._writes:
+                    return n  # параллельная запись — дальше заполнится по промахам
+                for r in chunk:
+                    self._cache[r["user_id"]] = (_from_row(r), now + self.ttl)
+                n += len(chunk)
+        if n < self.max_size:
+            self._complete_until = now + self.ttl
+        return n
+
+    async def set(self, user_id: int, db, **values) -> UserSettings:
+        """
+        Upsert колонок values в транзакции вызывающего db. Кэш сбрасывается сразу;
+        новое значение кладётся вызовом written после commit (см. update_settings).
+        """
+        for column in values:
+            if column not in _COLUMNS:
+                raise ValueError(f"unknown user setting: {column}")
+        self.invalidate(user_id)
+        cols = ", ".join(values)
+        cur = await db.execute(
+            f"INSERT INTO user_settings (user_id, {cols}) VALUES (?, {', '.join('?' * len(values))}) "
+            f"ON CONFLICT(user_id) DO UPDATE SET {', '.join(f'{c}=excluded.{c}' for c in values)} "
+            f"RETURNING {', '.join(_COLUMNS)}",
+            (user_id, *values.values())
+        )
+        return _from_row(await cur.fetchone())
+
+
+settings_cache = SettingsCache()
+
+
+async def update_settings(user_id: int, **values) -> UserSettings:
+    """Записать настройки отдельной транзакцией и обновить кэш после commit."""
+    async with db_conn() as db:
+        settings = await settings_cache.set(user_id, db, **values)
+        await db.commit()
+    settings_cache.written(user_id, settings)
+    return settings
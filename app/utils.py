@@ -1,11 +1,15 @@
 # app/utils.py
+import re
 import sqlite3
 from datetime import datetime
+from functools import lru_cache
+from operator import itemgetter
 from typing import Optional
 
-from .config import TZ, CATEGORIES
+from .config import TZ, CATEGORIES, MORNING_DIGEST_HOUR
 from .db import db_conn
-from .models import parse_rrule  # ок: utils -> models (без циклов)
+from .user_settings import settings_cache, update_settings
+from .models import compile_rrule  # ок: utils -> models (без циклов)
 
 
 # ---------- время и парсинг ----------
@@ -18,6 +22,55 @@ def to_iso(dt: datetime | None) -> Optional[str]:
     return dt.replace(second=0, microsecond=0).isoformat() if dt else None
 
 
+# В БД время хранится целыми секундами UTC (unix time); ISO — только для показа.
+
+def to_ts(dt: datetime | None) -> Optional[int]:
+    return int(dt.replace(second=0, microsecond=0).timestamp()) if dt else None
+
+
+def now_ts() -> int:
+    return int(datetime.now(TZ).timestamp())
+
+
+def from_ts(ts: int | None) -> Optional[datetime]:
+    return datetime.fromtimestamp(ts, TZ) if ts is not None else None
+
+
+def format_ts(ts: int | None) -> str:
+    return datetime.fromtimestamp(ts, TZ).isoformat(timespec="seconds") if ts is not None else "—"
+
+
+# Форматы, которые fromisoformat не берёт (или брал не во всех версиях Python):
+# регулярка выбирает единственный подходящий формат заранее, без перебора через ValueError.
+_LEGACY_FORMATS = (
+    (re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}[+-]\d{4}"), "%Y-%m-%dT%H:%M:%S%z"),
+    (re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}[+-]\d{4}"), "%Y-%m-%dT%H:%M%z"),
+    (re.compile(r"\d{4}-\d{1,2}-\d{1,2} \d{1,2}:\d{1,2}:\d{1,2}"), "%Y-%m-%d %H:%M:%S"),
+    (re.compile(r"\d{4}-\d{1,2}-\d{1,2} \d{1,2}:\d{1,2}"), "%Y-%m-%d %H:%M"),
+    (re.compile(r"\d{4}-\d{1,2}-\d{1,2}"), "%Y-%m-%d"),
+)
+# Строгая форма ISO 8601, которую гарантированно понимает datetime.fromisoformat
+_ISO_RE = re.compile(r"\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,6})?)?(?:Z|[+-]\d{2}:\d{2})?)?")
+
+
+@lru_cache(maxsize=4096)
+def _parse_dt(s: str) -> Optional[datetime]:
+    try:
+        if _ISO_RE.fullmatch(s):
+            dt = datetime.fromisoformat(s)
+        else:
+            fmt = next((f for rx, f in _LEGACY_FORMATS if rx.fullmatch(s)), None)
+            if fmt is None:
+                return None
+            dt = datetime.strptime(s, fmt)
+    except ValueError:
+        # форма подошла, но значения нет в календаре (2025-02-30, 25:00)
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=TZ)
+    return dt.astimezone(TZ)
+
+
 def parse_local_dt(text: str) -> Optional[datetime]:
     """
     Поддерживаем:
@@ -27,26 +80,12 @@ def parse_local_dt(text: str) -> Optional[datetime]:
     - 'YYYY-MM-DDTHH:MM%z'           (ISO без секунд, с таймзоной)
     - 'YYYY-MM-DDTHH:MM:SS%z'        (ISO с секундами, с таймзоной)
     Возвращаем aware-datetime в Asia/Tashkent.
+    Сначала fromisoformat, затем один strptime по заранее определённому формату;
+    повторяющиеся строки отдаются из LRU-кэша (datetime неизменяем, делить безопасно).
     """
     if not text:
         return None
-    s = text.strip()
-    formats = (
-        "%Y-%m-%dT%H:%M:%S%z",  # ISO c секундами и TZ (например: 2025-11-11T09:50:00+05:00)
-        "%Y-%m-%dT%H:%M%z",     # ISO без секунд и с TZ
-        "%Y-%m-%d %H:%M:%S",    # локальное без TZ, с секундами
-        "%Y-%m-%d %H:%M",       # локальное без TZ
-        "%Y-%m-%d",             # только дата
-    )
-    for fmt in formats:
-        try:
-            dt = datetime.strptime(s, fmt)
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=TZ)
-            return dt.astimezone(TZ)
-        except ValueError:
-            continue
-    return None
+    return _parse_dt(text.strip())
 
 
 # ---------- календарная математика ----------
@@ -76,23 +115,35 @@ def cat_by_slug(slug: str) -> str | None:
 # ---------- дефолтный пред-офсет пользователя ----------
 
 async def get_default_pre_offset(user_id: int) -> Optional[int]:
-    async with db_conn() as db:
-        cur = await db.execute(
-            "SELECT default_pre_offset_minutes FROM user_settings WHERE user_id=?",
-            (user_id,)
-        )
-        r = await cur.fetchone()
-        return r["default_pre_offset_minutes"] if r and r["default_pre_offset_minutes"] is not None else None
+    return (await settings_cache.get(user_id)).default_pre_offset_minutes
 
 
-async def set_default_pre_offset(user_id: int, minutes: Optional[int]):
+async def set_default_pre_offset(user_id: int, minutes: Optional[int]) -> Optional[int]:
     async with db_conn() as db:
-        await db.execute(
-            "INSERT INTO user_settings (user_id, default_pre_offset_minutes) VALUES (?, ?) "
-            "ON CONFLICT(user_id) DO UPDATE SET default_pre_offset_minutes=excluded.default_pre_offset_minutes",
-            (user_id, minutes)
-        )
+        settings = await settings_cache.set(user_id, db, default_pre_offset_minutes=minutes)
+        # задачи без своего офсета зависят от дефолта — пересчитываем их fire_at
+        from .reminders import sync_user_reminders
+        next_at = await sync_user_reminders(db, user_id, minutes)
         await db.commit()
+    settings_cache.written(user_id, settings)
+    return next_at
+
+
+# ---------- часовой пояс и час сводки ----------
+
+async def get_digest_settings(user_id: int) -> tuple[str, int]:
+    s = await settings_cache.get(user_id)
+    tz = s.tz or TZ.key
+    hour = s.digest_hour if s.digest_hour is not None else MORNING_DIGEST_HOUR
+    return tz, hour
+
+
+async def set_user_tz(user_id: int, tz_name: Optional[str]):
+    await update_settings(user_id, tz=tz_name)
+
+
+async def set_digest_hour(user_id: int, hour: Optional[int]):
+    await update_settings(user_id, digest_hour=hour)
 
 
 # ---------- humanize ----------
@@ -109,25 +160,51 @@ def _ru_plural(n: int, forms: tuple[str, str, str]) -> str:
     return forms[2]
 
 
+_WEEKDAYS_RU = ("пн", "вт", "ср", "чт", "пт", "сб", "вс")
+
+
+@lru_cache(maxsize=1024)
 def human_rrule(rrule: str | None) -> str:
-    if not rrule:
-        return "—"
-    parsed = parse_rrule(rrule)
-    if not parsed:
+    rule = compile_rrule(rrule)
+    if not rule:
         return "—"
-    freq, interval = parsed
-    n = interval
-    if freq == "DAILY":
-        if n == 1: return "каждый день"
-        if n == 2: return "через день"
-        return f"каждые {n} {_ru_plural(n, ('день', 'дня', 'дней'))}"
-    if freq == "WEEKLY":
-        if n == 1: return "каждую неделю"
-        return f"каждые {n} {_ru_plural(n, ('неделю', 'недели', 'недель'))}"
-    if freq == "MONTHLY":
-        if n == 1: return "каждый месяц"
-        return f"каждые {n} {_ru_plural(n, ('месяц', 'месяца', 'месяцев'))}"
-    return "—"
+    n = rule.interval
+    if rule.freq == "DAILY":
+        if n == 1: text = "каждый день"
+        elif n == 2: text = "через день"
+        else: text = f"каждые {n} {_ru_plural(n, ('день', 'дня', 'дней'))}"
+    elif rule.freq == "WEEKLY":
+        if n == 1: text = "каждую неделю"
+        else: text = f"каждые {n} {_ru_plural(n, ('неделю', 'недели', 'недель'))}"
+        if rule.byday:
+            text += " по " + ", ".join(_WEEKDAYS_RU[d] for d in rule.byday)
+    elif rule.freq == "MONTHLY":
+        if n == 1: text = "каждый месяц"
+        else: text = f"каждые {n} {_ru_plural(n, ('месяц', 'месяца', 'месяцев'))}"
+    else:
+        if n == 1: text = "каждый год"
+        else: text = f"каждые {n} {_ru_plural(n, ('год', 'года', 'лет'))}"
+    if rule.count is not None:
+        text += f", ещё {rule.count} {_ru_plural(rule.count, ('раз', 'раза', 'раз'))}"
+    if rule.until is not None:
+        text += f", до {datetime.fromtimestamp(rule.until, TZ):%d.%m.%Y}"
+    return text
+
+
+@lru_cache(maxsize=4096)
+def _diff_text(future: bool, hours: int) -> str:
+    days, hours = divmod(hours, 24)
+    if days == 0 and hours == 0:
+        return ("Осталось до завершения: менее часа" if future
+                else "Просрочено на: менее часа")
+
+    d_part = f"{days} {_ru_plural(days, ('день', 'дня', 'дней'))}" if days else None
+    h_part = f"{hours} {_ru_plural(hours, ('час', 'часа', 'часов'))}" if hours else None
+    parts = ", ".join(p for p in (d_part, h_part) if p)
+
+    return (f"Осталось до завершения: {parts}"
+            if future else
+            f"Просрочено на: {parts}")
 
 
 def human_time_diff_ru(due_dt: datetime, now_dt: datetime) -> str:
@@ -136,26 +213,72 @@ def human_time_diff_ru(due_dt: datetime, now_dt: datetime) -> str:
     или 'Просрочено на: 1 день, 3 часа'
     Если разница < 1 часа — 'менее часа'.
     """
-    delta = due_dt - now_dt
-    sign_future = delta.total_seconds() >= 0
-    total = abs(int(delta.total_seconds()))
-    days = total // 86400
-    hours = (total % 86400) // 3600
+    delta = (due_dt - now_dt).total_seconds()
+    return _diff_text(delta >= 0, abs(int(delta)) // 3600)
 
-    if days == 0 and hours == 0:
-        return ("Осталось до завершения: менее часа" if sign_future
-                else "Просрочено на: менее часа")
 
-    d_part = f"{days} {_ru_plural(days, ('день', 'дня', 'дней'))}" if days else None
-    h_part = f"{hours} {_ru_plural(hours, ('час', 'часа', 'часов'))}" if hours else None
-    parts = [p for p in (d_part, h_part) if p]
+# ---------- форматирование карточки задачи ----------
+# Карточки собираются пачкой: часы читаются один раз, повторяющиеся фрагменты
+# (срок, пред-офсет, повтор, категория, «осталось») берутся из LRU-кэшей.
 
-    return (f"Осталось до завершения: {', '.join(parts)}"
-            if sign_future else
-            f"Просрочено на: {', '.join(parts)}")
+MAX_MESSAGE = 4096          # лимит Telegram на текст сообщения (в UTF-16)
+CARD_SEP = "\n\n— — —\n\n"   # между карточками в списке
 
 
-# ---------- форматирование карточки задачи ----------
+@lru_cache(maxsize=65536)
+def _due_fragment(ts: int) -> str:
+    return f"срок: {datetime.fromtimestamp(ts, TZ).isoformat(timespec='seconds')} |"  # ISO с таймзоной
+
+
+@lru_cache(maxsize=1024)
+def _pre_fragment(pre) -> str:
+    return f"предупредить за: {pre} мин |" if pre is not None else "предупредить за: — |"
+
+
+@lru_cache(maxsize=1024)
+def _rrule_fragment(rrule: str | None) -> str:
+    return f"повтор: {human_rrule(rrule)} |"
+
+
+@lru_cache(maxsize=256)
+def _cat_fragment(category: str | None) -> str:
+    return f"\n\n🏷 {category}" if category else ""
+
+
+_CARD_COLUMNS = ("id", "is_done", "title", "due_at", "pre_offsets", "pre_offset_minutes", "rrule", "category")
+
+
+@lru_cache(maxsize=64)
+def _column_index(keys: tuple[str, ...]) -> tuple[int, ...]:
+    # sqlite3.Row ищет колонку по имени перебором — на пачку считаем позиции один раз
+    return tuple(keys.index(c) for c in _CARD_COLUMNS)
+
+
+def _card(values, now: float) -> str:
+    task_id, is_done, title, due, pre_offsets, pre_offset, rrule, category = values
+    if due is None:
+        due_part, remain = "срок: — |", ""
+    else:
+        delta = due - now
+        due_part = _due_fragment(due)
+        remain = "\n\n" + _diff_text(delta >= 0, abs(int(delta)) // 3600)
+    return (f"#{task_id} {'✅' if is_done else '🟡'} {title} |\n\n{due_part}\n\n"
+            f"{_pre_fragment(pre_offsets or pre_offset)}\n\n"
+            f"{_rrule_fragment(rrule)}{_cat_fragment(category)}{remain}")
+
+
+def render_cards(rows, now: Optional[datetime] = None) -> list[str]:
+    """Карточки пачки строк tasks (SELECT *); now — один момент на всю пачку."""
+    rows = rows if isinstance(rows, list) else list(rows)
+    if not rows:
+        return []
+    now_f = (now or now_local()).timestamp()
+    if isinstance(rows[0], sqlite3.Row):
+        get = itemgetter(*_column_index(tuple(rows[0].keys())))
+    else:
+        get = itemgetter(*_CARD_COLUMNS)
+    return [_card(get(r), now_f) for r in rows]
+
 
 def pretty_task(row: sqlite3.Row) -> str:
     """
@@ -171,39 +294,32 @@ def pretty_task(row: sqlite3.Row) -> str:
 
     Осталось до завершения: 7 дней, 5 часов
     """
-    r = dict(row)
-
-    # Заголовок
-    mark = "✅" if r.get("is_done") else "🟡"
-    title = r.get("title", "")
-    header = f"#{r.get('id')} {mark} {title} |"
-
-    # Срок и «сколько осталось»
-    due_line = "срок: — |"
-    remain_line = None
-    if r.get("due_at"):
-        dt = parse_local_dt(r["due_at"])
-        if dt:
-            due_str = dt.isoformat(timespec="seconds")  # ISO с таймзоной
-            due_line = f"срок: {due_str} |"
-            remain_line = human_time_diff_ru(dt, now_local())
-        else:
-            due_line = f"срок: {r['due_at']} |"
+    return render_cards([row])[0]
 
-    # Пред-напоминание
-    pre = r.get("pre_offset_minutes")
-    pre_line = f"предупредить за: {pre} мин |" if pre is not None else "предупредить за: — |"
 
-    # Повтор (человечно)
-    rep_line = f"повтор: {human_rrule(r.get('rrule'))} |"
+def text_len(text: str) -> int:
+    """Длина так, как её считает Telegram: в единицах UTF-16 (эмодзи — две)."""
+    return len(text.encode("utf-16-le")) // 2
 
-    # Категория
-    cat_line = f"🏷 {r['category']}" if r.get("category") else ""
 
-    blocks = [header, due_line, pre_line, rep_line]
-    if cat_line:
-        blocks.append(cat_line)
-    if remain_line:
-        blocks.append(remain_line)
-
-    return "\n\n".join(blocks)
+def pack_messages(parts, sep: str, limit: int = MAX_MESSAGE) -> list[tuple[str, int]]:
+    """
+    Склеить части через sep в сообщения не длиннее limit, разрывая только между
+    частями. Возвращает [(текст, сколько частей вошло)]; часть длиннее limit
+    обрезается с «…».
+    """
+    out, buf, size = [], [], 0
+    sep_len = text_len(sep)
+    for part in parts:
+        n = text_len(part)
+        if n > limit:
+            part = part[:limit - 1 - (n - len(part))] + "…"
+            n = text_len(part)
+        if buf and size + sep_len + n > limit:
+            out.append((sep.join(buf), len(buf)))
+            buf, size = [], 0
+        size += n + (sep_len if buf else 0)
+        buf.append(part)
+    if buf:
+        out.append((sep.join(buf), len(buf)))
+    return out
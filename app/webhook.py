@@ -0,0 +1,111 @@
+# app/webhook.py
+# Режим webhook: aiohttp-сервер принимает апдейты, проверяет секрет, сразу отвечает 200
+# и кладёт тело в ограниченную очередь; воркеры разбирают её через dp.feed_update.
+import asyncio
+import logging
+import secrets
+from typing import Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from .config import (
+    WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT,
+    WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS,
+)
+
+log = logging.getLogger(__name__)
+
+
+class WebhookServer:
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: Optional[str] = WEBHOOK_SECRET,
+                 host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT, path: str = WEBHOOK_PATH,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE, workers: int = WEBHOOK_WORKERS):
+        if not secret:
+            # без секрета любой POST на публичный адрес попадёт в диспетчер как апдейт
+            raise ValueError("webhook secret is required")
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.host, self.port, self.path = host, port, path
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._runner: Optional[web.AppRunner] = None
+        self._tasks: list[asyncio.Task] = []
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not secrets.compare_digest(
+            request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), self.secret
+        ):
+            return web.Response(status=401, text="Unauthorized")
+        try:
+            data = await request.json(loads=self.bot.session.json_loads)
+        except ValueError:
+            return web.Response(status=400, text="Bad Request")
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            # Telegram повторит доставку позже — лучше, чем держать соединение
+            log.warning("webhook queue full, update %s rejected", data.get("update_id"))
+            return web.Response(status=503, text="Busy")
+        return web.Response(text="ok")
+
+    async def _worker(self):
+        while True:
+            data = await self.queue.get()
+            try:
+                update = Update.model_validate(data, context={"bot": self.bot})
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                log.exception("update %s failed: %r", data.get("update_id"), e)
+            finally:
+                self.queue.task_done()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        log.info("webhook server on %s:%s%s", self.host, self.port, self.path)
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Перестать принимать, доработать уже принятые апдейты (не дольше drain_timeout)."""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            log.warning("webhook stop: %d updates dropped", self.queue.qsize())
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Аналог dp.start_polling для webhook: startup/shutdown диспетчера, регистрация URL, сервер."""
+    if not WEBHOOK_URL:
+        raise RuntimeError("Для BOT_MODE=webhook задайте WEBHOOK_URL в .env")
+    secret = WEBHOOK_SECRET
+    if not secret:
+        # одному процессу хватит случайного секрета на запуск; нескольким на один URL
+        # нужен общий WEBHOOK_SECRET — иначе каждый set_webhook отменит секрет соседей
+        secret = secrets.token_urlsafe(32)
+        log.warning("WEBHOOK_SECRET is not set, using a random secret for this run")
+    server = WebhookServer(dp, bot, secret=secret)
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        await server.start()
+        await bot.set_webhook(
+            WEBHOOK_URL,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
@@ -0,0 +1,111 @@
+# bench/archive_bench.py
+# Архивация выполненных задач: сколько переносится в секунду, насколько при этом
+# задерживаются обычные записи (UPDATE задачи, как /done) и сколько места
+# возвращает incremental_vacuum. Проверяет, что ни одна задача не потерялась.
+#
+#   python -m bench.archive_bench --tasks 200000 --done 0.6
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import time
+
+from .common import setup_env
+
+
+def fill(db_path: str, tasks: int, done_share: float, seed: int = 42):
+    """Задачи 1000 пользователей; доля done_share выполнена 31–400 дней назад."""
+    from app.utils import now_ts
+
+    rnd = random.Random(seed)
+    now = now_ts()
+    conn = sqlite3.connect(db_path)
+    rows = []
+    for _ in range(tasks):
+        done = rnd.random() < done_share
+        rows.append((rnd.randint(1, 1000), f"Задача {rnd.randint(1, 10**6)} " + "x" * rnd.randint(0, 80),
+                     now + rnd.randint(-86400, 86400), int(done),
+                     now - rnd.randint(31, 400) * 86400 if done else None, now - 500 * 86400))
+    conn.executemany(
+        "INSERT INTO tasks (user_id, title, due_at, is_done, done_at, created_at) VALUES (?, ?, ?, ?, ?, ?)", rows
+    )
+    conn.commit()
+    conn.close()
+
+
+def db_size(path: str) -> tuple[int, int]:
+    conn = sqlite3.connect(path)
+    pages, free = conn.execute("PRAGMA page_count").fetchone()[0], conn.execute("PRAGMA freelist_count").fetchone()[0]
+    conn.close()
+    return pages, free
+
+
+async def writer_latencies(stop: asyncio.Event, ids: list[int]) -> list[float]:
+    """Поток записей «как от хендлеров», пока идёт архивация."""
+    from app.db import db_conn
+
+    out = []
+    rnd = random.Random(1)
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        async with db_conn() as db:
+            await db.execute("UPDATE tasks SET title=title WHERE id=?", (rnd.choice(ids),))
+            await db.commit()
+        out.append(time.perf_counter() - t0)
+        await asyncio.sleep(0.005)
+    return out
+
+
+async def run(args):
+    from app.archive import archive_done_tasks
+    from app.config import DB_PATH
+    from app.db import init_db, close_db
+
+    await init_db()
+    fill(DB_PATH, args.tasks, args.done)
+    conn = sqlite3.connect(DB_PATH)
+    open_ids = [r[0] for r in conn.execute("SELECT id FROM tasks WHERE is_done=0")]
+    expect_done = conn.execute("SELECT COUNT(*) FROM tasks WHERE is_done=1").fetchone()[0]
+    conn.close()
+    pages_before, _ = db_size(DB_PATH)
+
+    stop = asyncio.Event()
+    writes = asyncio.create_task(writer_latencies(stop, open_ids))
+    await asyncio.sleep(0.2)
+    t0 = time.perf_counter()
+    moved = await archive_done_tasks(batch=args.batch)
+    took = time.perf_counter() - t0
+    stop.set()
+    lat = sorted(await writes)
+    await close_db()
+
+    conn = sqlite3.connect(DB_PATH)
+    left_done = conn.execute("SELECT COUNT(*) FROM tasks WHERE is_done=1").fetchone()[0]
+    archived = conn.execute("SELECT COUNT(*) FROM tasks_archive").fetchone()[0]
+    left_open = conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+    conn.close()
+    assert moved == archived == expect_done and left_done == 0, (moved, archived, expect_done, left_done)
+    assert left_open == len(open_ids)
+    pages_after, free_after = db_size(DB_PATH)
+
+    p = lambda q: lat[min(len(lat) - 1, int(len(lat) * q))] * 1e3  # noqa: E731
+    print(f"tasks={args.tasks} done={expect_done} batch={args.batch}")
+    print(f"archived {moved} in {took:.2f}s ({moved / took:,.0f} rows/s)")
+    print(f"concurrent writes: {len(lat)}  p50 {p(0.5):.2f} ms  p99 {p(0.99):.2f} ms  max {lat[-1] * 1e3:.1f} ms"
+          f"  mean {statistics.mean(lat) * 1e3:.2f} ms")
+    print(f"pages: {pages_before} -> {pages_after} (free {free_after}), file {os.path.getsize(DB_PATH) >> 20} MiB")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--tasks", type=int, default=200_000)
+    p.add_argument("--done", type=float, default=0.6, help="доля выполненных старше ARCHIVE_AFTER_DAYS")
+    p.add_argument("--batch", type=int, default=None)
+    args = p.parse_args()
+    setup_env()
+    if args.batch is None:
+        from app.config import ARCHIVE_BATCH
+        args.batch = ARCHIVE_BATCH
+    asyncio.run(run(args))
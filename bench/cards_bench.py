@@ -0,0 +1,119 @@
+# bench/cards_bench.py
+# Карточки задач: прежний pretty_task по строке (dict, now_local на каждую карточку)
+# против пачки render_cards, плюс разбиение страницы/сводки по 4096 символов.
+# Перед замером проверяется, что тексты совпадают символ в символ.
+#
+#   python -m bench.cards_bench --rows 100000
+import argparse
+import random
+import sqlite3
+import time
+
+from .common import setup_env
+
+
+def old_pretty_task(row) -> str:
+    """Копия реализации до пакетного рендеринга."""
+    from app.utils import from_ts, human_rrule, human_time_diff_ru, now_local
+
+    r = dict(row)
+    mark = "✅" if r.get("is_done") else "🟡"
+    title = r.get("title", "")
+    header = f"#{r.get('id')} {mark} {title} |"
+    due_line = "срок: — |"
+    remain_line = None
+    if r.get("due_at") is not None:
+        dt = from_ts(r["due_at"])
+        due_line = f"срок: {dt.isoformat(timespec='seconds')} |"
+        remain_line = human_time_diff_ru(dt, now_local())
+    pre = r.get("pre_offsets") or r.get("pre_offset_minutes")
+    pre_line = f"предупредить за: {pre} мин |" if pre is not None else "предупредить за: — |"
+    rep_line = f"повтор: {human_rrule(r.get('rrule'))} |"
+    cat_line = f"🏷 {r['category']}" if r.get("category") else ""
+    blocks = [header, due_line, pre_line, rep_line]
+    if cat_line:
+        blocks.append(cat_line)
+    if remain_line:
+        blocks.append(remain_line)
+    return "\n\n".join(blocks)
+
+
+def sample_rows(n: int, seed: int = 42) -> list[sqlite3.Row]:
+    """Строки tasks как из SELECT * (sqlite3.Row), сроки — в пределах ±30 дней."""
+    from app.config import CATEGORIES
+    from app.utils import now_ts
+
+    rnd = random.Random(seed)
+    now = now_ts()
+    rrules = (None, None, None, "FREQ=DAILY;INTERVAL=1", "FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,WE,FR",
+              "FREQ=MONTHLY;INTERVAL=1;COUNT=5")
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE tasks (id INTEGER PRIMARY KEY, user_id, title, category, due_at, is_done, "
+                 "created_at, reminded_at, pre_offset_minutes, pre_reminded_at, rrule, pre_offsets)")
+    conn.executemany(
+        "INSERT INTO tasks (user_id, title, category, due_at, is_done, pre_offset_minutes, rrule, pre_offsets) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(1, f"Задача {rnd.randint(1, 10**6)}", rnd.choice(CATEGORIES + [None]),
+          None if rnd.random() < 0.1 else now + rnd.randint(-30 * 1440, 30 * 1440) // 5 * 300,
+          1 if rnd.random() < 0.1 else 0, rnd.choice((None, None, 10, 60)), rnd.choice(rrules),
+          "1440,60" if rnd.random() < 0.05 else None) for _ in range(n)]
+    )
+    return conn.execute("SELECT * FROM tasks").fetchall()
+
+
+def main(args):
+    setup_env()
+    from app.utils import (
+        CARD_SEP, MAX_MESSAGE, now_local, pack_messages, render_cards, text_len,
+        _due_fragment, _diff_text,
+    )
+
+    rows = sample_rows(args.rows)
+    now = now_local()
+    new = render_cards(rows, now)
+    # одинаковый момент для обеих реализаций — подменяем now_local на время проверки
+    import app.utils as utils
+    orig_now = utils.now_local
+    utils.now_local = lambda: now
+    try:
+        mismatch = [i for i, r in enumerate(rows) if old_pretty_task(r) != new[i]]
+    finally:
+        utils.now_local = orig_now
+    assert not mismatch, f"{len(mismatch)} cards differ, first #{mismatch[0]}"
+
+    t0 = time.perf_counter()
+    for r in rows:
+        old_pretty_task(r)
+    t_old = (time.perf_counter() - t0) / len(rows) * 1e6
+
+    _due_fragment.cache_clear()
+    _diff_text.cache_clear()
+    t0 = time.perf_counter()
+    render_cards(rows)
+    t_cold = (time.perf_counter() - t0) / len(rows) * 1e6
+
+    t0 = time.perf_counter()
+    render_cards(rows)
+    t_warm = (time.perf_counter() - t0) / len(rows) * 1e6
+
+    # страница /list и сводка большого пользователя: разбиение по лимиту Telegram
+    page = rows[:args.page]
+    t0 = time.perf_counter()
+    chunks = pack_messages(render_cards(page), CARD_SEP)
+    t_pack = (time.perf_counter() - t0) * 1e3
+    assert all(text_len(text) <= MAX_MESSAGE for text, _ in chunks)
+    assert sum(n for _, n in chunks) == len(page)
+
+    print(f"rows={args.rows}")
+    print(f"old pretty_task per row:  {t_old:.2f} us/card")
+    print(f"render_cards, cold cache: {t_cold:.2f} us/card  x{t_old / t_cold:.1f}")
+    print(f"render_cards, warm cache: {t_warm:.2f} us/card  x{t_old / t_warm:.1f}")
+    print(f"{len(page)} cards -> {len(chunks)} messages <= {MAX_MESSAGE}, {t_pack:.2f} ms")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, default=100_000)
+    p.add_argument("--page", type=int, default=300, help="карточек в одной «сводке» для разбиения")
+    main(p.parse_args())
@@ -0,0 +1,47 @@
+# bench/common.py
+# Общие помощники бенчмарков: окружение без настоящего токена
+# и синтетическая БД во временном каталоге.
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def setup_env() -> Path:
+    """Импортировать app можно только после этого: config требует BOT_TOKEN, а DB_PATH относительный."""
+    os.environ.setdefault("BOT_TOKEN", "0:bench")
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    workdir = Path(tempfile.mkdtemp(prefix="todobot-bench-"))
+    os.chdir(workdir)
+    return workdir
+
+
+def fill_tasks(db_path: str, users: int, tasks_per_user: int, seed: int = 42):
+    """Задачи с разбросом сроков ±3 дня от «сейчас», часть выполнена, часть без срока."""
+    from app.utils import now_local, to_ts
+
+    rnd = random.Random(seed)
+    now = now_local()
+    created = to_ts(now)
+    conn = sqlite3.connect(db_path)
+
+    def rows():
+        for uid in range(1, users + 1):
+            for _ in range(tasks_per_user):
+                due = None
+                if rnd.random() < 0.9:
+                    due = to_ts(now + timedelta(minutes=rnd.randint(-3 * 1440, 3 * 1440)))
+                yield (uid, f"Задача {rnd.randint(1, 10**6)}", due, 1 if rnd.random() < 0.2 else 0, created)
+
+    conn.executemany(
+        "INSERT INTO tasks (user_id, title, due_at, is_done, created_at) VALUES (?, ?, ?, ?, ?)",
+        rows()
+    )
+    conn.commit()
+    conn.close()
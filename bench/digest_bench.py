@@ -0,0 +1,87 @@
+# bench/digest_bench.py
+# Старый путь сводки (DISTINCT user_id + 2 запроса на пользователя) против
+# одного упорядоченного прохода iter_digests на синтетической БД.
+#
+#   python -m bench.digest_bench --users 100000
+import argparse
+import asyncio
+import time
+
+from .common import setup_env, fill_tasks
+
+
+async def old_digests(db, start, end, time_cap: float):
+    """Копия логики до iter_digests; останавливается по time_cap и отдаёт число пользователей."""
+    from app.scheduler import format_digest
+
+    t0 = time.perf_counter()
+    cur = await db.execute("SELECT DISTINCT user_id FROM tasks WHERE is_done=0")
+    users = [r["user_id"] for r in await cur.fetchall()]
+    done = 0
+    for uid in users:
+        cur1 = await db.execute(
+            "SELECT * FROM tasks WHERE user_id=? AND is_done=0 AND due_at IS NOT NULL AND due_at < ? "
+            "ORDER BY due_at ASC",
+            (uid, int(start.timestamp()))
+        )
+        overdue = await cur1.fetchall()
+        cur2 = await db.execute(
+            "SELECT * FROM tasks WHERE user_id=? AND is_done=0 AND due_at IS NOT NULL AND due_at >= ? AND due_at < ? "
+            "ORDER BY due_at ASC",
+            (uid, int(start.timestamp()), int(end.timestamp()))
+        )
+        today_rows = await cur2.fetchall()
+        if overdue or today_rows:
+            format_digest(overdue, today_rows)
+        done += 1
+        if time.perf_counter() - t0 > time_cap:
+            break
+    return done, len(users)
+
+
+async def main(args):
+    setup_env()
+    from datetime import datetime, timedelta
+    from app.config import DB_PATH, TZ
+    from app.db import init_db, db_conn, close_db
+    from app.scheduler import iter_digests
+    from app.utils import now_local
+
+    await init_db()
+    fill_tasks(DB_PATH, args.users, args.tasks_per_user)
+    if args.with_index:
+        async with db_conn() as db:
+            await db.execute("CREATE INDEX IF NOT EXISTS bench_user_due ON tasks(user_id, is_done, due_at)")
+            await db.commit()
+
+    today = now_local().date()
+    start = datetime(today.year, today.month, today.day, tzinfo=TZ)
+    end = start + timedelta(days=1)
+
+    async with db_conn() as db:
+        t0 = time.perf_counter()
+        n_new = 0
+        async for _uid, _texts in iter_digests(db, start, end):
+            n_new += 1
+        t_new = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        done, total = await old_digests(db, start, end, args.old_time_cap)
+        t_old = time.perf_counter() - t0
+    await close_db()
+
+    t_old_full = t_old / max(done, 1) * total
+    print(f"users={args.users} tasks={args.users * args.tasks_per_user} index={args.with_index}")
+    print(f"new: {t_new:.2f}s, {n_new} digests, 1 query")
+    note = "" if done == total else f" (extrapolated from {done} users in {t_old:.1f}s)"
+    print(f"old: {t_old_full:.2f}s, {2 * total + 1} queries{note}")
+    print(f"speedup: x{t_old_full / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--users", type=int, default=100_000)
+    p.add_argument("--tasks-per-user", type=int, default=3)
+    p.add_argument("--with-index", action="store_true", help="дать старому пути индекс (user_id, is_done, due_at)")
+    p.add_argument("--old-time-cap", type=float, default=30.0, help="сколько секунд гонять старый путь")
+    asyncio.run(main(p.parse_args()))
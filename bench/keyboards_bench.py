@@ -0,0 +1,63 @@
+# bench/keyboards_bench.py
+# Клавиатуры по шагам мастера /add и карточек: построение без кэша, из кэша
+# и сериализация запроса editMessageReplyMarkup (её aiogram делает на каждый вызов).
+#
+#   python -m bench.keyboards_bench --n 20000
+import argparse
+import time
+
+from .common import setup_env
+
+
+def per_call_us(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main(args):
+    setup_env()
+    from aiogram import Bot
+    from aiogram.methods import EditMessageReplyMarkup
+    from app import keyboards as kb
+    from app.config import BOT_TOKEN
+
+    bot = Bot(BOT_TOKEN)
+    steps = [
+        ("categories", kb.categories_kb, lambda i: ()),
+        ("years", kb.years_kb, lambda i: (2026,)),
+        ("months", kb.months_kb, lambda i: ()),
+        ("days", kb._days_kb, lambda i: (28 + i % 4,)),
+        ("hours", kb.hours_kb, lambda i: ()),
+        ("minutes", kb.minutes_kb, lambda i: ()),
+        ("pre_reminder", kb.pre_reminder_kb, lambda i: (60,)),
+        ("repeat_freq", kb.repeat_freq_kb, lambda i: ()),
+        ("confirm", kb.confirm_kb, lambda i: ()),
+        # карточки: id задач повторяются в пределах кэша (типичный /list и напоминания)
+        ("task_actions", kb.inline_task_actions, lambda i: (i % 1000,)),
+        ("per_task_actions", kb.inline_per_task_actions, lambda i: (i % 1000, "qfilter:all")),
+    ]
+
+    def serialize(markup):
+        method = EditMessageReplyMarkup(chat_id=1, message_id=1, reply_markup=markup)
+        return bot.session.build_form_data(bot, method)
+
+    print(f"{'step':<18}{'build':>10}{'cached':>10}{'serialize':>12}   us/call")
+    tot_build = tot_cached = tot_ser = 0.0
+    for name, fn, argf in steps:
+        raw = fn.__wrapped__
+        fn.cache_clear()
+        t_build = per_call_us(lambda i: raw(*argf(i)), args.n)
+        t_cached = per_call_us(lambda i: fn(*argf(i)), args.n)
+        t_ser = per_call_us(lambda i: serialize(fn(*argf(i))), args.n // 4 or 1)
+        tot_build += t_build; tot_cached += t_cached; tot_ser += t_ser
+        print(f"{name:<18}{t_build:>10.1f}{t_cached:>10.2f}{t_ser:>12.1f}")
+    print(f"{'total':<18}{tot_build:>10.1f}{tot_cached:>10.2f}{tot_ser:>12.1f}")
+    print(f"build saved per wizard run + card: x{tot_build / tot_cached:.0f}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--n", type=int, default=20_000, help="вызовов на шаг")
+    main(p.parse_args())
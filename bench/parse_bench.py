@@ -0,0 +1,91 @@
+# bench/parse_bench.py
+# Стоимость parse_local_dt на строку: старый перебор strptime против
+# fromisoformat + определения формата, с холодным и тёплым LRU-кэшем.
+#
+#   python -m bench.parse_bench --rows 200000
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from .common import setup_env
+
+
+def old_parse_local_dt(text, tz):
+    """Копия реализации до fast path."""
+    if not text:
+        return None
+    s = text.strip()
+    formats = (
+        "%Y-%m-%dT%H:%M:%S%z",
+        "%Y-%m-%dT%H:%M%z",
+        "%Y-%m-%d %H:%M:%S",
+        "%Y-%m-%d %H:%M",
+        "%Y-%m-%d",
+    )
+    for fmt in formats:
+        try:
+            dt = datetime.strptime(s, fmt)
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=tz)
+            return dt.astimezone(tz)
+        except ValueError:
+            continue
+    return None
+
+
+def sample_values(n: int, distinct: int, seed: int = 42) -> list[str]:
+    """Значения как в старых БД: в основном to_iso, немного ручного ввода и дат."""
+    from app.utils import now_local, to_iso
+
+    rnd = random.Random(seed)
+    now = now_local().replace(second=0, microsecond=0)
+    pool = []
+    for _ in range(distinct):
+        dt = now + timedelta(minutes=rnd.randint(-5 * 1440, 30 * 1440))
+        kind = rnd.random()
+        if kind < 0.8:
+            pool.append(to_iso(dt))
+        elif kind < 0.9:
+            pool.append(dt.strftime("%Y-%m-%d %H:%M"))
+        elif kind < 0.95:
+            pool.append(dt.strftime("%Y-%m-%dT%H:%M%z"))
+        else:
+            pool.append(dt.strftime("%Y-%m-%d"))
+    return [rnd.choice(pool) for _ in range(n)]
+
+
+def run(fn, values) -> float:
+    t0 = time.perf_counter()
+    for v in values:
+        fn(v)
+    return (time.perf_counter() - t0) / len(values) * 1e6
+
+
+def main(args):
+    setup_env()
+    from app.config import TZ
+    from app.utils import parse_local_dt, _parse_dt
+
+    values = sample_values(args.rows, args.distinct)
+    for v in set(values):
+        assert parse_local_dt(v) == old_parse_local_dt(v, TZ), v
+
+    t_old = run(lambda v: old_parse_local_dt(v, TZ), values)
+    _parse_dt.cache_clear()
+    t_cold = run(_parse_dt.__wrapped__, [v.strip() for v in values])
+    _parse_dt.cache_clear()
+    t_new = run(parse_local_dt, values)
+    info = _parse_dt.cache_info()
+
+    print(f"rows={args.rows} distinct={args.distinct}")
+    print(f"old (strptime loop):     {t_old:.2f} us/row")
+    print(f"new, no cache:           {t_cold:.2f} us/row  x{t_old / t_cold:.1f}")
+    print(f"new, LRU (hits={info.hits}): {t_new:.2f} us/row  x{t_old / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, default=200_000)
+    p.add_argument("--distinct", type=int, default=20_000, help="сколько разных строк среди rows")
+    main(p.parse_args())
@@ -0,0 +1,100 @@
+# bench/query_plans.py
+# EXPLAIN QUERY PLAN для горячих запросов: ни один не должен сканировать таблицу целиком,
+# а страницы /list после курсора — искать по индексу границу диапазона.
+# Код выхода 1, если нашёлся SCAN без индекса или нет нужной границы.
+# Те же проверки (check_plans) выполняет tests/test_query_plans.py.
+#
+#   python -m bench.query_plans
+import asyncio
+import sys
+
+from .common import setup_env
+
+
+def hot_queries() -> dict[str, tuple[str, tuple]]:
+    from app.repository import CLAIM_REMINDERS_SQL, _page_sql
+    from app.scheduler import _digest_sql, _USER_SPAN_SQL, _MARK_SENT_SQL
+    from app.reminders import _TASK_SQL
+    from app.leases import _ACQUIRE_SQL
+    from app.outbox import CLAIM_SQL as OUTBOX_CLAIM_SQL
+    from app.archive import _TAKE_SQL as ARCHIVE_TAKE_SQL
+    from app.handlers.list_filter import _HISTORY_SQL, _HISTORY_STATS_SQL
+
+    queries = {
+        "reminders: claim due": (CLAIM_REMINDERS_SQL, (0, 500)),
+        "reminders: next fire_at": ("SELECT MIN(fire_at) AS next_at FROM reminders", ()),
+        "reminders: sync task": (_TASK_SQL + " WHERE t.id=?", (1,)),
+        "reminders: sync user": (
+            _TASK_SQL + " WHERE t.user_id=? AND t.is_done=0 AND t.due_at IS NOT NULL "
+            "AND t.pre_offset_minutes IS NULL AND t.pre_offsets IS NULL", (1,)),
+        "digest: all": (_digest_sql(False, False), (0,)),
+        "digest: group slice": (_digest_sql(True, True), (0, "Asia/Tashkent", "Asia/Tashkent", 9, 9, 0, 1, 1000)),
+        "digest: user_id span": (_USER_SPAN_SQL, ()),
+        "digest: mark sent": (_MARK_SENT_SQL, (1, 0)),
+        "outbox: claim": (OUTBOX_CLAIM_SQL, (0, 0, 100)),
+        "outbox: next try": ("SELECT MIN(next_try_at) AS next_at FROM outbox WHERE status='pending'", ()),
+        "leases: acquire": (_ACQUIRE_SQL, ("digest", "x", 0, 0)),
+        "archive: take batch": (ARCHIVE_TAKE_SQL, (0, 500)),
+        "history: last done": (_HISTORY_SQL, (1, 1, 20)),
+        "history: stats": (_HISTORY_STATS_SQL, (0, 0, 1, 1)),
+        "per_task: by id": ("SELECT * FROM tasks WHERE id=? AND user_id=?", (1, 1)),
+    }
+    for direction in ("f", "n", "p"):
+        for with_cat in (False, True):
+            params = [1] + (["Работа"] if with_cat else []) + ([0, 0, 0] if direction != "f" else []) + [11]
+            name = f"list: {'category' if with_cat else 'all'} {direction}"
+            queries[name] = (_page_sql(with_cat, direction), tuple(params))
+    return queries
+
+
+def required_seeks() -> dict[str, str]:
+    """Запросы, которым мало индекса: в плане должна быть эта граница диапазона (keyset /list)."""
+    return {f"list: {kind} {direction}": f"<expr>{op}?"
+            for kind in ("all", "category") for direction, op in (("n", ">"), ("p", "<"))}
+
+
+def is_full_scan(detail: str) -> bool:
+    # SCAN (subquery-N) — проход по результату подзапроса, SCAN CONSTANT ROW — SELECT без FROM
+    return (detail.startswith("SCAN") and "USING" not in detail
+            and not detail.startswith(("SCAN (subquery", "SCAN CONSTANT ROW")))
+
+
+async def check_plans(db) -> dict[str, tuple[list[str], list[str]]]:
+    """Имя запроса -> (строки плана, проблемы): SCAN без индекса, нет нужной границы диапазона."""
+    seeks = required_seeks()
+    out = {}
+    for name, (sql, params) in hot_queries().items():
+        try:
+            cur = await db.execute("EXPLAIN QUERY PLAN " + sql, params)
+            details = [r["detail"] for r in await cur.fetchall()]
+        except Exception as e:
+            out[name] = ([], [f"EXPLAIN failed: {e!r}"])  # другие запросы проверяем дальше
+            continue
+        bad = [d for d in details if is_full_scan(d)]
+        if name in seeks and not any(seeks[name] in d for d in details):
+            bad.append(f"no range seek {seeks[name]}")
+        out[name] = (details, bad)
+    return out
+
+
+async def main() -> int:
+    setup_env()
+    from app.db import init_db, db_conn, close_db
+
+    await init_db()
+    async with db_conn() as db:
+        plans = await check_plans(db)
+    await close_db()
+    for name, (details, bad) in plans.items():
+        print(f"{'FAIL' if bad else 'ok  '} {name}")
+        for d in details:
+            print(f"       {d}")
+    failed = [name for name, (_, bad) in plans.items() if bad]
+    if failed:
+        print(f"full scans or missing seeks: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,207 @@
+# bench/repo_bench.py
+# Хранилище задач (app/repository.py): одна и та же последовательность операций
+# на SQLiteTaskRepository и MemoryTaskRepository должна дать одинаковые задачи,
+# напоминания и результаты; затем — SQL-запросов и мкс на операцию для обоих
+# и время хендлеров (быстрый срок, выполнить, страница /list) без диска.
+#
+#   python -m bench.repo_bench --tasks 20000 --ops 2000
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime
+
+from .common import setup_env
+
+RRULES = (None, None, None, "FREQ=DAILY;INTERVAL=1", "FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,WE,FR",
+          "FREQ=MONTHLY;INTERVAL=1;COUNT=3")
+
+
+def new_tasks(n: int, users: int, now: int, seed: int) -> list:
+    from app.config import CATEGORIES
+    from app.repository import NewTask
+
+    rnd = random.Random(seed)
+    return [NewTask(user_id=rnd.randint(1, users), title=f"Задача {i}", category=rnd.choice(CATEGORIES + [None]),
+                    due_at=None if rnd.random() < 0.1 else now + rnd.randint(-3 * 1440, 14 * 1440) // 10 * 600,
+                    pre_offset_minutes=rnd.choice((None, None, 10, 60)), rrule=rnd.choice(RRULES))
+            for i in range(n)]
+
+
+def _norm(v):
+    """Строки задач → dict, Fired → кортеж: результаты обоих хранилищ сравнимы."""
+    if v is None or isinstance(v, (bool, int, str)):
+        return v
+    if isinstance(v, tuple) and hasattr(v, "_fields"):
+        return tuple(_norm(x) for x in v)
+    if isinstance(v, (list, tuple)):
+        return [_norm(x) for x in v]
+    return dict(v)
+
+
+def script(n_ops: int, owners: list[int], now: int, seed: int):
+    """
+    Операции (имя, аргументы): у всех хранилищ одинаковые благодаря seed.
+    owners[id - 1] — владелец задачи; каждая десятая операция — от чужого пользователя.
+    """
+    from app.config import CATEGORIES
+
+    rnd = random.Random(seed)
+    max_id = len(owners)
+    for _ in range(n_ops):
+        tid = rnd.randint(1, max_id)
+        uid = owners[tid - 1] if rnd.random() < 0.9 else owners[rnd.randint(1, max_id) - 1]
+        op = rnd.choice(("reschedule", "complete", "set_category", "set_rrule", "set_pre_offsets",
+                         "snooze", "delete", "get", "list_page", "list_page"))
+        if op == "reschedule":
+            yield op, (uid, tid, now + rnd.randint(-600, 7 * 1440) * 60)
+        elif op == "set_category":
+            yield op, (uid, tid, rnd.choice(CATEGORIES + [None]))
+        elif op == "set_rrule":
+            yield op, (uid, tid, rnd.choice(RRULES))
+        elif op == "set_pre_offsets":
+            yield op, (uid, tid, rnd.choice((None, "1440,60", "30")))
+        elif op == "list_page":
+            yield op, (uid, rnd.choice((None, CATEGORIES[0])), rnd.choice("fnp"),
+                       (rnd.choice((None, now)), rnd.randint(0, max_id)), 11)
+        else:
+            yield op, (uid, tid)
+
+
+async def snapshot(repo) -> tuple[list, list]:
+    from app.db import db_conn
+    from app.repository import MemoryTaskRepository
+
+    key = lambda r: tuple(-1 if v is None else v for v in r)  # noqa: E731
+    if isinstance(repo, MemoryTaskRepository):
+        tasks = [dict(t) for _, t in sorted(repo._tasks.items())]
+        reminders = sorted(repo._reminders.values(), key=key)
+    else:
+        async with db_conn() as db:
+            cur = await db.execute("SELECT * FROM tasks ORDER BY id")
+            tasks = [dict(r) for r in await cur.fetchall()]
+            cur = await db.execute("SELECT task_id, user_id, kind, offset_minutes, fire_at FROM reminders")
+            reminders = sorted((tuple(r) for r in await cur.fetchall()), key=key)
+    return tasks, reminders
+
+
+async def run_script(repo, args, clock, now: int) -> list:
+    from app.db import db_conn
+
+    tasks = new_tasks(args.tasks, args.users, now, args.seed)
+    results = [_norm(await repo.create_many(tasks))]
+    for op, params in script(args.ops, [t.user_id for t in tasks], now, args.seed):
+        results.append((op, _norm(await getattr(repo, op)(*params))))
+    # сутки спустя: наступившие напоминания пачками, повторы переносятся
+    clock.advance(days=1)
+    while True:
+        async with db_conn() as db:
+            claimed, fired = await repo.claim_reminders(db, clock.now, 500)
+            await db.commit()
+        results.append(("claim", claimed, sorted(_norm(fired), key=lambda f: (f[0]["id"], f[1], f[2] or 0))))
+        if claimed < 500:
+            break
+    results.append(("next_fire_at", await repo.next_fire_at()))
+    return results
+
+
+async def check_equivalence(args, clock) -> int:
+    from app.repository import MemoryTaskRepository, SQLiteTaskRepository
+
+    start = clock.now
+    now = int(start.timestamp())
+    out = []
+    for repo in (SQLiteTaskRepository(), MemoryTaskRepository()):
+        clock.now = start
+        results = await run_script(repo, args, clock, now)
+        out.append((results, await snapshot(repo)))
+    (res_sql, (tasks_sql, rem_sql)), (res_mem, (tasks_mem, rem_mem)) = out
+    for i, (a, b) in enumerate(zip(res_sql, res_mem)):
+        assert a == b, f"result #{i} differs:\n sqlite {a}\n memory {b}"
+    assert tasks_sql == tasks_mem, "tasks differ"
+    assert rem_sql == rem_mem, "reminders differ"
+    clock.now = start
+    return len(res_sql)
+
+
+async def per_op(repo, args, qc, now: int) -> dict:
+    """мкс и SQL-запросов на операцию (хранилище уже заполнено теми же new_tasks)."""
+    owners = [t.user_id for t in new_tasks(args.tasks, args.users, now, args.seed)]
+    stats: dict[str, list] = {}
+    for op, params in script(args.ops, owners, now, args.seed + 1):
+        q0, t0 = qc.count, time.perf_counter()
+        await getattr(repo, op)(*params)
+        st = stats.setdefault(op, [0, 0.0, 0])
+        st[0] += 1
+        st[1] += time.perf_counter() - t0
+        st[2] += qc.count - q0
+    return {op: (n, secs / n * 1e6, queries / n) for op, (n, secs, queries) in stats.items()}
+
+
+async def handlers(bot, args, now_dt: datetime) -> dict:
+    """Настоящие хендлеры поверх текущего хранилища: нажатие «завтра», «выполнено», /list."""
+    from app.handlers.list_filter import cb_qfilter
+    from app.handlers.per_task import cb_done, cb_quick_due
+    from .stub_bot import make_callback
+
+    owners = [t.user_id for t in new_tasks(args.tasks, args.users, int(now_dt.timestamp()), args.seed)]
+    rnd = random.Random(args.seed)
+    out = {}
+    for name, handler, data in (("qdue:tom", cb_quick_due, "qdue:tom:{}"), ("done", cb_done, "done:{}"),
+                                ("list first page", cb_qfilter, "qfilter:all")):
+        t0 = time.perf_counter()
+        n = args.ops // 4
+        for i in range(n):
+            tid = rnd.randint(1, args.tasks)
+            await handler(make_callback(bot, owners[tid - 1], data.format(tid), i, now_dt))
+        out[name] = (time.perf_counter() - t0) / n * 1e6
+    return out
+
+
+async def main(args):
+    from app.db import init_db, close_db
+    from app.repository import MemoryTaskRepository, SQLiteTaskRepository, use_repository
+    import app.repository, app.handlers.per_task, app.handlers.list_filter  # noqa: F401 — до FakeClock.install
+    from .stub_bot import FakeClock, QueryCounter, stub_bot
+
+    from app.utils import now_local
+
+    await init_db()
+    start = now_local().replace(microsecond=0)
+    clock = FakeClock(start)
+    clock.install()
+    qc = QueryCounter()
+    qc.install()
+
+    n = await check_equivalence(args, clock)
+    print(f"sqlite == memory: {args.tasks} tasks, {args.ops} ops, {n} results, tasks and reminders identical")
+
+    now = int(start.timestamp())
+    sqlite, memory = SQLiteTaskRepository(), MemoryTaskRepository()
+    await memory.create_many(new_tasks(args.tasks, args.users, now, args.seed))  # в sqlite уже есть после проверки
+    t_sql = await per_op(sqlite, args, qc, now)
+    t_mem = await per_op(memory, args, qc, now)
+    print(f"\n{'operation':<16} {'n':>6} {'sqlite us':>10} {'queries':>8} {'memory us':>10}")
+    for op in sorted(t_sql):
+        n_ops, us, queries = t_sql[op]
+        print(f"{op:<16} {n_ops:>6} {us:>10.0f} {queries:>8.2f} {t_mem[op][1]:>10.1f}")
+
+    bot = stub_bot()
+    h_sql = await handlers(bot, args, start)
+    use_repository(memory)
+    h_mem = await handlers(bot, args, start)
+    print(f"\n{'handler':<16} {'sqlite us':>10} {'memory us':>10}")
+    for name in h_sql:
+        print(f"{name:<16} {h_sql[name]:>10.0f} {h_mem[name]:>10.0f}")
+    await close_db()
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--tasks", type=int, default=20_000)
+    p.add_argument("--users", type=int, default=500)
+    p.add_argument("--ops", type=int, default=2000)
+    p.add_argument("--seed", type=int, default=7)
+    args = p.parse_args()
+    setup_env()
+    asyncio.run(main(args))
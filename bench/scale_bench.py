@@ -0,0 +1,253 @@
+# bench/scale_bench.py
+# Настоящий код планировщика, сводки и /list на синтетических БД разного размера:
+# задержки (p50/p95/p99), SQL-запросы на тик/вызов, пиковый RSS. Каждый размер —
+# в отдельном процессе (честный RSS), итог — JSON для сравнения между коммитами.
+#
+#   python -m bench.scale_bench --sizes 10k,1m --out scale.json
+#   python -m bench.scale_bench --sizes 10m --due-dist peaks --out big.json --compare scale.json
+import argparse
+import asyncio
+import json
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+from .common import ROOT, setup_env
+from .synth import add_args, base_dt, ensure_db, params_from, parse_size
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    v = sorted(values)
+    pick = lambda p: v[min(len(v) - 1, int(len(v) * p))]
+    return {"n": len(v), "p50_ms": pick(0.5) * 1e3, "p95_ms": pick(0.95) * 1e3,
+            "p99_ms": pick(0.99) * 1e3, "max_ms": v[-1] * 1e3}
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: КБ
+
+
+async def _drain_sender(timeout: float = 60.0):
+    from app.sender import send_queue
+    t_end = time.monotonic() + timeout
+    while any(c.active for c in send_queue._chats.values()) and time.monotonic() < t_end:
+        await asyncio.sleep(0.01)
+
+
+async def bench_scheduler(clock, qc, ticks: int) -> dict:
+    from app.db import db_conn
+    from app.scheduler import check_pre_and_due
+
+    lat, queries = [], []
+    for _ in range(ticks):
+        clock.advance(minutes=1)
+        q0, t0 = qc.count, time.perf_counter()
+        await check_pre_and_due()
+        lat.append(time.perf_counter() - t0)
+        queries.append(qc.count - q0)
+    async with db_conn() as db:
+        fired = (await (await db.execute("SELECT COUNT(*) FROM outbox")).fetchone())[0]
+    return {**percentiles(lat), "ticks": ticks, "reminders_fired": fired,
+            "queries_per_tick_avg": sum(queries) / len(queries), "queries_per_tick_max": max(queries)}
+
+
+async def bench_outbox(bot) -> dict:
+    """Выгрузка outbox, накопленного тиками, через send_queue в заглушку Bot."""
+    from app.db import db_conn
+    from app.outbox import outbox
+
+    sent0 = bot.session.messages
+    t0 = time.perf_counter()
+    task = asyncio.create_task(outbox.run())
+    while True:
+        await asyncio.sleep(0.05)
+        async with db_conn() as db:
+            left = (await (await db.execute("SELECT COUNT(*) FROM outbox WHERE status='pending'")).fetchone())[0]
+        if not left or time.perf_counter() - t0 > 120:
+            break
+    took = time.perf_counter() - t0
+    task.cancel()
+    sent = bot.session.messages - sent0
+    return {"messages": sent, "seconds": took, "msg_per_s": sent / took if took else 0}
+
+
+async def bench_digest(clock, qc, bot) -> dict:
+    from app.config import DIGEST_WINDOW_MINUTES, MORNING_DIGEST_HOUR
+    from app.scheduler import send_morning_digest
+
+    start = base_dt().replace(hour=MORNING_DIGEST_HOUR, minute=0)
+    lat, queries = [], []
+    sent0 = bot.session.messages
+    for k in range(DIGEST_WINDOW_MINUTES):
+        clock.now = start.replace(minute=k)
+        q0, t0 = qc.count, time.perf_counter()
+        await send_morning_digest(bot)
+        lat.append(time.perf_counter() - t0)
+        queries.append(qc.count - q0)
+    await bench_outbox(bot)  # сводки уходят через outbox
+    await _drain_sender()
+    return {**percentiles(lat), "slices": len(lat), "digests": bot.session.messages - sent0,
+            "queries_per_slice_avg": sum(queries) / len(queries)}
+
+
+async def bench_list(qc, bot, users: int, calls: int, seed: int) -> dict:
+    from app.handlers.list_filter import cb_qfilter, cb_list_page
+    from .stub_bot import make_callback
+
+    rnd = random.Random(seed)
+    first, nxt, queries = [], [], []
+
+    def callback(uid: int, data: str, message_id: int):
+        return make_callback(bot, uid, data, message_id, base_dt())
+
+    for i in range(calls):
+        uid = rnd.randint(1, users)
+        bot.session.last_markup = None
+        q0, t0 = qc.count, time.perf_counter()
+        await cb_qfilter(callback(uid, "qfilter:all", i))
+        first.append(time.perf_counter() - t0)
+        queries.append(qc.count - q0)
+        markup = bot.session.last_markup
+        page = [b.callback_data for row in (markup.inline_keyboard if markup else []) for b in row
+                if b.callback_data and b.callback_data.startswith("lp:") and ":n:" in b.callback_data]
+        if page:
+            t0 = time.perf_counter()
+            await cb_list_page(callback(uid, page[0], calls + i))
+            nxt.append(time.perf_counter() - t0)
+    return {"first_page": percentiles(first), "next_page": percentiles(nxt),
+            "queries_per_call_avg": sum(queries) / len(queries)}
+
+
+async def run_one(args, params, src: Path, gen_s: float) -> dict:
+    """Один размер в текущем процессе; вызывается из main через --one."""
+    shutil.copy(src, "tasks.db")  # тики и outbox меняют БД — работаем с копией
+
+    from app.db import init_db, close_db
+    from app.sender import send_queue
+    import app.scheduler, app.outbox, app.handlers.list_filter  # noqa: F401 — до FakeClock.install
+    from .stub_bot import FakeClock, QueryCounter, stub_bot, unthrottle_sender
+
+    await init_db()
+    clock = FakeClock(base_dt())
+    clock.install()
+    qc = QueryCounter()
+    qc.install()
+    bot = stub_bot()
+    unthrottle_sender()
+    send_queue.start(bot)
+
+    result = {"params": asdict(params), "generate_s": gen_s, "db_mb": src.stat().st_size / 2**20}
+    result["scheduler"] = await bench_scheduler(clock, qc, args.ticks)
+    result["outbox"] = await bench_outbox(bot)
+    result["digest"] = await bench_digest(clock, qc, bot)
+    result["list"] = await bench_list(qc, bot, params.n_users, args.list_calls, params.seed)
+    result["api_calls"] = dict(bot.session.calls)
+    result["peak_rss_mb"] = peak_rss_mb()
+
+    await send_queue.stop()
+    await close_db()
+    return result
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _flat(d: dict, prefix: str = "") -> dict:
+    out = {}
+    for k, v in d.items():
+        if isinstance(v, dict):
+            out.update(_flat(v, f"{prefix}{k}."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[f"{prefix}{k}"] = v
+    return out
+
+
+def compare(old: dict, new: dict):
+    """Печать метрик с заметным изменением (±10%) между двумя JSON-отчётами."""
+    print(f"\ncompare {old.get('commit')} -> {new.get('commit')}")
+    for size, res in new["results"].items():
+        if size not in old["results"]:
+            continue
+        a, b = _flat(old["results"][size]), _flat(res)
+        for key in sorted(a.keys() & b.keys()):
+            if key.startswith("params.") or not a[key]:
+                continue
+            ratio = b[key] / a[key]
+            if abs(ratio - 1) >= 0.1:
+                print(f"  {size:>8} {key:<40} {a[key]:>12.2f} -> {b[key]:>12.2f}  x{ratio:.2f}")
+
+
+def main(args):
+    out = Path(args.out).resolve()
+    report = {"commit": _git_commit(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "ticks": args.ticks, "list_calls": args.list_calls, "results": {}}
+    passthrough = _strip_values(sys.argv[1:], ("--sizes", "--out", "--compare"))
+    for size in args.sizes.split(","):
+        n = parse_size(size)
+        print(f"[{size}] running…", flush=True)
+        proc = subprocess.run([sys.executable, "-m", "bench.scale_bench", "--one", str(n), *passthrough],
+                              cwd=ROOT, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            sys.exit(proc.returncode)
+        res = json.loads(proc.stdout.strip().splitlines()[-1])
+        report["results"][size] = res
+        s, d, l = res["scheduler"], res["digest"], res["list"]
+        print(f"  db {res['db_mb']:.0f} MB (gen {res['generate_s']:.1f}s), peak RSS {res['peak_rss_mb']:.0f} MB")
+        print(f"  scheduler tick p50/p99 {s['p50_ms']:.1f}/{s['p99_ms']:.1f} ms, "
+              f"{s['queries_per_tick_avg']:.1f} queries/tick, {s['reminders_fired']} reminders")
+        print(f"  outbox {res['outbox']['messages']} msgs at {res['outbox']['msg_per_s']:.0f}/s")
+        print(f"  digest slice p50/max {d['p50_ms']:.1f}/{d['max_ms']:.1f} ms, {d['digests']} digests")
+        print(f"  list first page p50/p99 {l['first_page']['p50_ms']:.2f}/{l['first_page']['p99_ms']:.2f} ms, "
+              f"next page p50 {l['next_page'].get('p50_ms', 0):.2f} ms")
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"written {out}")
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), report)
+
+
+def _strip_values(argv: list[str], names: tuple[str, ...]) -> list[str]:
+    """Убрать из argv опции names (в виде '--x v' и '--x=v')."""
+    out, skip = [], False
+    for a in argv:
+        if skip:
+            skip = False
+            continue
+        if a in names:
+            skip = True
+            continue
+        if a.split("=", 1)[0] in names:
+            continue
+        out.append(a)
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10k,1m", help="через запятую: 10k, 1m, 10m")
+    ap.add_argument("--ticks", type=int, default=60, help="минутных тиков планировщика от BASE")
+    ap.add_argument("--list-calls", type=int, default=300)
+    ap.add_argument("--out", default="scale_bench.json")
+    ap.add_argument("--compare", help="прошлый JSON-отчёт для сравнения")
+    ap.add_argument("--one", type=int, help=argparse.SUPPRESS)
+    add_args(ap)
+    args = ap.parse_args()
+    if args.one:
+        setup_env()
+        params = params_from(args, args.one)
+        src, gen_s = ensure_db(params)  # генерация синхронная — до запуска цикла
+        print(json.dumps(asyncio.run(run_one(args, params, src, gen_s))))
+    else:
+        main(args)
@@ -0,0 +1,141 @@
+# bench/storage_bench.py
+# Профили хранения (config.STORAGE_PROFILES) под нагрузкой: одиночные COMMIT
+# (цена fsync) и смешанная нагрузка — параллельные записи хендлеров и чтения
+# страниц /list, с фоновым checkpoint как в боте. Для сравнения — умолчания
+# SQLite (rollback journal, synchronous=FULL). Каждый профиль — в своём процессе.
+#
+#   python -m bench.storage_bench --seconds 5 --writers 8 --readers 8
+#   python -m bench.storage_bench --dir /var/lib/todobot   # на диске рабочей БД
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from .common import ROOT, fill_tasks, setup_env
+from .scale_bench import _strip_values, percentiles
+
+BASELINE = "sqlite-defaults"
+
+
+async def single_commits(n: int, ids: list[int]) -> dict:
+    from app.db import db_conn
+
+    lat = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        async with db_conn() as db:
+            await db.execute("UPDATE tasks SET title=? WHERE id=?", (f"t{i}", random.choice(ids)))
+            await db.commit()
+        lat.append(time.perf_counter() - t0)
+    return percentiles(lat)
+
+
+async def mixed_load(seconds: float, writers: int, readers: int, users: int, ids: list[int]) -> dict:
+    from app.db import db_conn, checkpoint_db
+    from app.handlers.list_filter import PAGE_SIZE
+    from app.repository import _page_sql
+
+    stop = time.monotonic() + seconds
+    w_lat, r_lat = [], []
+    page_sql = _page_sql(False, "f")
+
+    async def writer(seed: int):
+        rnd = random.Random(seed)
+        while time.monotonic() < stop:
+            t0 = time.perf_counter()
+            async with db_conn() as db:
+                if rnd.random() < 0.3:
+                    await db.execute(
+                        "INSERT INTO tasks (user_id, title, due_at, is_done, created_at) VALUES (?, ?, ?, 0, ?)",
+                        (rnd.randint(1, users), "новая", int(time.time()) + 3600, int(time.time()))
+                    )
+                else:
+                    await db.execute("UPDATE tasks SET due_at=due_at+60 WHERE id=?", (rnd.choice(ids),))
+                await db.commit()
+            w_lat.append(time.perf_counter() - t0)
+
+    async def reader(seed: int):
+        rnd = random.Random(seed)
+        while time.monotonic() < stop:
+            t0 = time.perf_counter()
+            async with db_conn() as db:
+                cur = await db.execute(page_sql, (rnd.randint(1, users), PAGE_SIZE + 1))
+                await cur.fetchall()
+            r_lat.append(time.perf_counter() - t0)
+
+    async def checkpoints():
+        while time.monotonic() < stop:
+            await asyncio.sleep(1)
+            await checkpoint_db()
+
+    await asyncio.gather(*(writer(i) for i in range(writers)), *(reader(100 + i) for i in range(readers)),
+                         checkpoints())
+    return {"writes_per_s": len(w_lat) / seconds, "reads_per_s": len(r_lat) / seconds,
+            "write": percentiles(w_lat), "read": percentiles(r_lat)}
+
+
+async def run_one(args) -> dict:
+    from app.db import init_db, close_db, storage_pragmas
+    from app.config import DB_PATH
+
+    await init_db()
+    fill_tasks(DB_PATH, args.users, args.tasks_per_user)
+    ids = list(range(1, args.users * args.tasks_per_user + 1))
+    result = {"pragmas": storage_pragmas()}
+    result["single_commit"] = await single_commits(args.commits, ids)
+    result["mixed"] = await mixed_load(args.seconds, args.writers, args.readers, args.users, ids)
+    await close_db()
+    return result
+
+
+def main(args):
+    from app.config import STORAGE_PROFILES
+
+    profiles = args.profiles.split(",") if args.profiles else [*STORAGE_PROFILES, BASELINE]
+    passthrough = _strip_values(sys.argv[1:], ("--profiles",))
+    print(f"writers={args.writers} readers={args.readers} {args.seconds:.0f}s, "
+          f"{args.users * args.tasks_per_user} tasks")
+    print(f"{'profile':<16} {'commit p50/p99 ms':>18} {'writes/s':>9} {'write p99':>10} {'reads/s':>9} {'read p99':>9}")
+    for name in profiles:
+        env = dict(os.environ, STORAGE_PROFILE=name)
+        proc = subprocess.run([sys.executable, "-m", "bench.storage_bench", "--one", *passthrough],
+                              cwd=ROOT, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            sys.exit(proc.returncode)
+        res = json.loads(proc.stdout.strip().splitlines()[-1])
+        c, m = res["single_commit"], res["mixed"]
+        print(f"{name:<16} {c['p50_ms']:>8.2f}/{c['p99_ms']:<9.2f} {m['writes_per_s']:>9.0f} "
+              f"{m['write']['p99_ms']:>10.1f} {m['reads_per_s']:>9.0f} {m['read']['p99_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--profiles", help=f"через запятую; по умолчанию все из config и {BASELINE}")
+    ap.add_argument("--seconds", type=float, default=5)
+    ap.add_argument("--writers", type=int, default=8)
+    ap.add_argument("--readers", type=int, default=8)
+    ap.add_argument("--commits", type=int, default=200, help="одиночных COMMIT подряд (цена fsync)")
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--tasks-per-user", type=int, default=50)
+    ap.add_argument("--dir", help="на каком диске создать временную БД (по умолчанию системный tmp)")
+    ap.add_argument("--one", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.dir:
+        args.dir = os.path.abspath(args.dir)  # setup_env меняет текущий каталог
+    setup_env()
+    if args.one:
+        if args.dir:
+            os.chdir(tempfile.mkdtemp(prefix="todobot-bench-", dir=args.dir))
+        import app.config as config
+        # умолчания SQLite: rollback journal, fsync на каждый COMMIT, читатели ждут писателя
+        config.STORAGE_PROFILES[BASELINE] = {"journal_mode": "DELETE", "synchronous": "FULL",
+                                             "busy_timeout": config.DB_BUSY_TIMEOUT_MS}
+        print(json.dumps(asyncio.run(run_one(args))))
+    else:
+        main(args)
@@ -0,0 +1,107 @@
+# bench/stub_bot.py
+# Заглушки для прогона настоящего кода без сети: Bot с сессией, которая
+# записывает вызовы API, подмена часов на BASE синтетической БД и счётчик SQL.
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message
+
+
+class RecordingSession(BaseSession):
+    """Отвечает на любой метод API успехом и считает вызовы по типам."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls: Counter = Counter()
+        self.messages = 0
+        self.last = None
+        self.last_markup = None  # reply_markup последнего send/edit — для «нажатия» кнопок
+        self._next_id = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        self.last = method
+        if getattr(method, "reply_markup", None) is not None:
+            self.last_markup = method.reply_markup
+        if isinstance(method, SendMessage):
+            self.messages += 1
+            self._next_id += 1
+            return Message(message_id=self._next_id, date=datetime.now(),
+                           chat=Chat(id=method.chat_id, type="private"), text=method.text)
+        return True
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+
+def stub_bot() -> Bot:
+    from app.config import BOT_TOKEN
+    return Bot(BOT_TOKEN, session=RecordingSession())
+
+
+def make_callback(bot: Bot, uid: int, data: str, message_id: int, date: datetime):
+    """CallbackQuery нажатия кнопки; через model_validate с bot в контексте — так вложенный Message тоже привязан к боту."""
+    from aiogram.types import CallbackQuery
+    return CallbackQuery.model_validate({
+        "id": str(message_id), "from": {"id": uid, "is_bot": False, "first_name": "U"},
+        "chat_instance": "1", "data": data,
+        "message": {"message_id": message_id, "date": int(date.timestamp()),
+                    "chat": {"id": uid, "type": "private"}, "text": "…"},
+    }, context={"bot": bot})
+
+
+def unthrottle_sender():
+    """Снять лимиты Telegram с send_queue: замеряем свой код, а не token bucket."""
+    from app import sender
+    sender.SEND_CHAT_RATE = sender.SEND_CHAT_BURST = 1e9
+    sender.send_queue._global = sender.TokenBucket(1e9, 1e9)
+
+
+class FakeClock:
+    """now_local/now_ts во всех загруженных модулях app.* показывают self.now."""
+
+    def __init__(self, start: datetime):
+        self.now = start
+
+    def advance(self, **kw):
+        self.now += timedelta(**kw)
+
+    def install(self):
+        now_local = lambda: self.now
+        now_ts = lambda: int(self.now.timestamp())
+        for name, mod in list(sys.modules.items()):
+            if name == "app" or name.startswith("app."):
+                if hasattr(mod, "now_local"):
+                    mod.now_local = now_local
+                if hasattr(mod, "now_ts"):
+                    mod.now_ts = now_ts
+
+
+class QueryCounter:
+    """Считает execute/executemany через db_conn (чтения и записи)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def install(self):
+        from app import db
+
+        orig_execute, orig_many = db.Session.execute, db.Session.executemany
+        counter = self
+
+        async def execute(self, sql, parameters=None):
+            counter.count += 1
+            return await orig_execute(self, sql, parameters)
+
+        async def executemany(self, sql, parameters):
+            counter.count += 1
+            return await orig_many(self, sql, parameters)
+
+        db.Session.execute, db.Session.executemany = execute, executemany
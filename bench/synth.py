@@ -0,0 +1,176 @@
+# bench/synth.py
+# Воспроизводимые синтетические tasks.db: схема — настоящими миграциями,
+# напоминания — настоящим reminder_rows, всё относительно фиксированного BASE.
+# Готовые файлы кэшируются по параметрам и переиспользуются между запусками.
+#
+#   python -m bench.synth --tasks 1m --recurring 0.1 --due-dist peaks
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from pathlib import Path
+
+from .common import ROOT
+
+# Момент «сейчас» синтетической БД: бенчмарк подменяет часы на него.
+# 08:30 — чтобы первый час тиков захватил пик сводок и напоминаний в 09:00.
+BASE_ISO = "2030-01-07T08:30:00+05:00"
+CACHE_DIR = Path(os.environ.get("TODOBOT_BENCH_CACHE", ROOT / "bench" / ".cache"))
+
+DUE_DISTS = ("uniform", "peaks", "past")
+_RRULES = ("FREQ=DAILY;INTERVAL=1", "FREQ=WEEKLY;INTERVAL=1", "FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,WE,FR",
+           "FREQ=MONTHLY;INTERVAL=1", "FREQ=DAILY;INTERVAL=2")
+
+
+@dataclass(frozen=True)
+class SynthParams:
+    tasks: int = 10_000
+    users: int = 0                 # 0 — tasks // 20
+    recurring: float = 0.1         # доля задач с RRULE
+    done: float = 0.2              # доля выполненных
+    no_due: float = 0.1            # доля задач без срока
+    pre: float = 0.3               # доля задач со своим пред-офсетом
+    due_dist: str = "uniform"      # uniform: ±7 дней; peaks: 70% в 09/12/18:00; past: 60% просрочено
+    seed: int = 42
+
+    @property
+    def n_users(self) -> int:
+        return self.users or max(1, self.tasks // 20)
+
+    def filename(self) -> str:
+        return (f"synth-{self.tasks}-{self.n_users}-r{self.recurring}-d{self.done}-n{self.no_due}"
+                f"-p{self.pre}-{self.due_dist}-s{self.seed}.db")
+
+
+def parse_size(text: str) -> int:
+    """'10k' -> 10000, '1m' -> 1000000."""
+    text = text.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if mult > 1 else text) * mult)
+
+
+def base_dt() -> datetime:
+    from app.config import TZ
+    return datetime.fromisoformat(BASE_ISO).astimezone(TZ)
+
+
+def _due(rnd: random.Random, p: SynthParams, base_ts: int) -> int:
+    day = 86400
+    if p.due_dist == "peaks" and rnd.random() < 0.7:
+        midnight = base_ts - (8 * 3600 + 30 * 60)
+        return midnight + rnd.randint(-7, 7) * day + rnd.choice((9, 12, 18)) * 3600
+    if p.due_dist == "past" and rnd.random() < 0.6:
+        return base_ts - rnd.randint(60, 30 * day)
+    return base_ts + rnd.randint(-7 * day, 7 * day) // 60 * 60
+
+
+async def _create_schema(path: Path):
+    import aiosqlite
+    from app.migrations import migrate
+
+    async with aiosqlite.connect(path, isolation_level=None) as db:
+        db.row_factory = aiosqlite.Row
+        await db.execute("PRAGMA journal_mode=WAL;")
+        await migrate(db)
+
+
+def generate(p: SynthParams, path: Path):
+    from app.config import CATEGORIES
+    from app.reminders import reminder_rows
+
+    asyncio.run(_create_schema(path))
+    rnd = random.Random(p.seed)
+    base_ts = int(base_dt().timestamp())
+    users = p.n_users
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous=OFF")
+    settings = {}
+    for uid in range(1, users + 1):
+        if rnd.random() < 0.2:
+            settings[uid] = (rnd.choice((None, 15, 30, 60)), None, rnd.choice((None, 8, 9, 10)))
+    conn.executemany(
+        "INSERT INTO user_settings (user_id, default_pre_offset_minutes, tz, digest_hour) VALUES (?, ?, ?, ?)",
+        [(uid, *s) for uid, s in settings.items()]
+    )
+
+    chunk_tasks, chunk_rem = [], []
+
+    def flush():
+        conn.executemany(
+            "INSERT INTO tasks (id, user_id, title, category, due_at, is_done, created_at, reminded_at, "
+            "pre_offset_minutes, pre_reminded_at, rrule) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", chunk_tasks)
+        conn.executemany(
+            "INSERT INTO reminders (task_id, user_id, kind, offset_minutes, fire_at) VALUES (?, ?, ?, ?, ?)", chunk_rem)
+        chunk_tasks.clear(); chunk_rem.clear()
+
+    for task_id in range(1, p.tasks + 1):
+        uid = rnd.randint(1, users)
+        due = None if rnd.random() < p.no_due else _due(rnd, p, base_ts)
+        is_done = 1 if rnd.random() < p.done else 0
+        pre = rnd.choice((10, 30, 60, 1440)) if rnd.random() < p.pre else None
+        rrule = rnd.choice(_RRULES) if due is not None and rnd.random() < p.recurring else None
+        # установившееся состояние: всё, что уже наступило, считается отправленным
+        sent = base_ts if due is not None and due <= base_ts else None
+        row = {
+            "id": task_id, "user_id": uid, "due_at": due, "is_done": is_done,
+            "reminded_at": sent, "pre_reminded_at": sent, "pre_offset_minutes": pre, "pre_offsets": None,
+            "default_pre_offset_minutes": settings.get(uid, (None,))[0],
+        }
+        chunk_tasks.append((task_id, uid, f"Задача {task_id}", rnd.choice(CATEGORIES + [None]), due, is_done,
+                            base_ts - rnd.randint(0, 90 * 86400), sent, pre, sent, rrule))
+        chunk_rem.extend(r for r in reminder_rows(row, base_ts) if r[4] > base_ts)
+        if len(chunk_tasks) >= 50_000:
+            flush()
+    flush()
+    conn.commit()
+    conn.execute("PRAGMA optimize")
+    conn.close()
+
+
+def ensure_db(p: SynthParams) -> tuple[Path, float]:
+    """Путь к готовой БД (из кэша или свежесгенерированной) и время генерации (0 — из кэша)."""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = CACHE_DIR / p.filename()
+    if path.exists():
+        return path, 0.0
+    tmp = path.with_suffix(".tmp")
+    for f in (tmp, Path(f"{tmp}-wal"), Path(f"{tmp}-shm")):
+        f.unlink(missing_ok=True)
+    t0 = time.perf_counter()
+    generate(p, tmp)
+    tmp.rename(path)
+    return path, time.perf_counter() - t0
+
+
+def add_args(ap: argparse.ArgumentParser):
+    d = SynthParams()
+    ap.add_argument("--users", type=int, default=d.users, help="0 — по 20 задач на пользователя")
+    ap.add_argument("--recurring", type=float, default=d.recurring)
+    ap.add_argument("--done", type=float, default=d.done)
+    ap.add_argument("--no-due", type=float, default=d.no_due)
+    ap.add_argument("--pre", type=float, default=d.pre)
+    ap.add_argument("--due-dist", choices=DUE_DISTS, default=d.due_dist)
+    ap.add_argument("--seed", type=int, default=d.seed)
+
+
+def params_from(args, tasks: int) -> SynthParams:
+    return SynthParams(tasks, args.users, args.recurring, args.done, args.no_due, args.pre, args.due_dist, args.seed)
+
+
+if __name__ == "__main__":
+    from .common import setup_env
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tasks", default="10k")
+    add_args(ap)
+    args = ap.parse_args()
+    setup_env()
+    params = params_from(args, parse_size(args.tasks))
+    path, took = ensure_db(params)
+    print(f"{path} ({path.stat().st_size / 2**20:.1f} MB{f', {took:.1f}s' if took else ', cached'})")
+    print(asdict(params))
@@ -0,0 +1,110 @@
+# bench/webhook_bench.py
+# Пропускная способность webhook-режима: POST апдейтов (в формате Telegram)
+# на локальный WebhookServer; диспетчер с обработчиками-счётчиками, без сети.
+#
+#   python -m bench.webhook_bench --updates 20000 --concurrency 64
+import argparse
+import asyncio
+import random
+import time
+
+from .common import setup_env
+
+SECRET = "bench-secret"
+
+
+def recorded_updates(n: int, seed: int = 42) -> list[dict]:
+    """Команды и нажатия кнопок мастера — то, что бот получает чаще всего."""
+    rnd = random.Random(seed)
+    commands = ["/start", "/list", "/add", "/settings", "Купить молоко", "/done 12"]
+    buttons = ["y:2026", "m:5", "d:17", "h:9", "min:30", "pre:def", "rep:NONE", "save_task", "qfilter:all", "lp:a:n:-:40"]
+    out = []
+    for i in range(n):
+        uid = rnd.randint(1, 5000)
+        user = {"id": uid, "is_bot": False, "first_name": "U", "language_code": "ru"}
+        chat = {"id": uid, "type": "private", "first_name": "U"}
+        if rnd.random() < 0.4:
+            out.append({"update_id": i, "message": {
+                "message_id": i, "date": 1760000000, "chat": chat, "from": user, "text": rnd.choice(commands),
+            }})
+        else:
+            out.append({"update_id": i, "callback_query": {
+                "id": str(i), "from": user, "chat_instance": "1", "data": rnd.choice(buttons),
+                "message": {"message_id": i, "date": 1760000000, "chat": chat, "text": "🧩 Выбор параметров"},
+            }})
+    return out
+
+
+async def main(args):
+    setup_env()
+    import aiohttp
+    from aiogram import Bot, Dispatcher, Router
+    from app.config import BOT_TOKEN
+    from app.webhook import WebhookServer
+
+    handled = 0
+    done = asyncio.Event()
+    total = args.updates
+
+    router = Router()
+
+    @router.message()
+    @router.callback_query()
+    async def count(_event):
+        nonlocal handled
+        handled += 1
+        if handled == total:
+            done.set()
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot(BOT_TOKEN)
+    server = WebhookServer(dp, bot, secret=SECRET, host="127.0.0.1", port=args.port,
+                           queue_size=args.queue_size, workers=args.workers)
+    await server.start()
+
+    updates = recorded_updates(total)
+    url = f"http://127.0.0.1:{args.port}{server.path}"
+    latencies, statuses = [], {}
+    it = iter(updates)
+
+    async def client(session):
+        for upd in it:
+            while True:
+                t0 = time.perf_counter()
+                async with session.post(url, json=upd, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as r:
+                    await r.read()
+                latencies.append(time.perf_counter() - t0)
+                statuses[r.status] = statuses.get(r.status, 0) + 1
+                if r.status != 503:
+                    break
+                await asyncio.sleep(0.01)  # как Telegram: повтор после отказа
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=args.concurrency)) as session:
+        async with session.post(url, json=updates[0], headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}) as r:
+            assert r.status == 401, r.status
+        t0 = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(args.concurrency)))
+        t_accept = time.perf_counter() - t0
+        await asyncio.wait_for(done.wait(), timeout=120)
+        t_all = time.perf_counter() - t0
+
+    await server.stop()
+    await bot.session.close()
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    print(f"updates={total} concurrency={args.concurrency} workers={args.workers} queue={args.queue_size}")
+    print(f"accepted: {total / t_accept:.0f} upd/s, handled: {total / t_all:.0f} upd/s ({handled} handled)")
+    print(f"HTTP latency ms: p50={pct(0.5):.2f} p95={pct(0.95):.2f} p99={pct(0.99):.2f}")
+    print(f"statuses: {statuses}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--updates", type=int, default=20_000)
+    p.add_argument("--concurrency", type=int, default=64)
+    p.add_argument("--workers", type=int, default=16)
+    p.add_argument("--queue-size", type=int, default=1000)
+    p.add_argument("--port", type=int, default=8089)
+    asyncio.run(main(p.parse_args()))
@@ -1,27 +1,88 @@
 import asyncio
+import functools
+import logging
 from aiogram import Bot, Dispatcher
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from app.config import BOT_TOKEN, TZ, MORNING_DIGEST_HOUR
-from app.db import init_db
+from app.archive import archive_done_tasks
+from app.config import (
+    BOT_TOKEN, TZ, BOT_MODE, ARCHIVE_EVERY_MINUTES, DB_CHECKPOINT_SECONDS, DB_OPTIMIZE_MINUTES, SHUTDOWN_JOBS_SECONDS,
+)
+from app.db import init_db, close_db, checkpoint_db, optimize_db, profiler
+from app.fsm_storage import SQLiteStorage
+from app.leases import release_lease
+from app.metrics import setup_metrics, start_metrics_server
 from app.router import build_router
-from app.scheduler import check_pre_and_due, send_morning_digest
+from app.scheduler import run_reminders, send_morning_digest
+from app.user_settings import settings_cache
+from app.sender import send_queue
+from app.outbox import outbox
+from app.webhook import run_webhook
+
+# задания планировщика, которые выполняются сейчас: AsyncIOExecutor.shutdown
+# только отменяет корутины и не ждёт их, а им ещё нужна БД
+_running_jobs: set[asyncio.Task] = set()
+
+def tracked(job):
+    @functools.wraps(job)
+    async def run(*args, **kwargs):
+        task = asyncio.current_task()
+        _running_jobs.add(task)
+        try:
+            return await job(*args, **kwargs)
+        finally:
+            _running_jobs.discard(task)
+    return run
 
 async def main():
     await init_db()
+    if profiler is not None:
+        profiler.install_signal()
+    await settings_cache.warm()
     bot = Bot(BOT_TOKEN)
-    dp = Dispatcher()
+    dp = Dispatcher(storage=SQLiteStorage())
     dp.include_router(build_router())
+    setup_metrics(dp)
+    metrics = await start_metrics_server()
 
     scheduler = AsyncIOScheduler(timezone=str(TZ))
-    scheduler.add_job(check_pre_and_due, "interval", minutes=1, args=[bot], id="reminders", coalesce=True, max_instances=1)
-    scheduler.add_job(send_morning_digest, "cron", hour=MORNING_DIGEST_HOUR, minute=0, args=[bot], id="morning_digest", coalesce=True)
+    scheduler.add_job(tracked(send_morning_digest), "cron", minute="*", args=[bot], id="morning_digest", coalesce=True, max_instances=1, misfire_grace_time=30)
+    scheduler.add_job(tracked(archive_done_tasks), "interval", minutes=ARCHIVE_EVERY_MINUTES, id="archive", coalesce=True, max_instances=1)
+    scheduler.add_job(tracked(checkpoint_db), "interval", seconds=DB_CHECKPOINT_SECONDS, id="wal_checkpoint", coalesce=True, max_instances=1)
+    scheduler.add_job(tracked(optimize_db), "interval", minutes=DB_OPTIMIZE_MINUTES, id="db_optimize", coalesce=True, max_instances=1)
+    send_queue.start(bot)
     scheduler.start()
+    reminders = asyncio.create_task(run_reminders())
+    outbox_loop = asyncio.create_task(outbox.run())
 
-    print("Bot is up.")
-    await dp.start_polling(bot)
+    print(f"Bot is up ({BOT_MODE}).")
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            # getUpdates не работает, пока зарегистрирован webhook
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        scheduler.pause()  # новые запуски не начинаются, текущие доработают
+        reminders.cancel()
+        outbox_loop.cancel()
+        await asyncio.gather(reminders, outbox_loop, return_exceptions=True)
+        if _running_jobs:
+            await asyncio.wait(_running_jobs, timeout=SHUTDOWN_JOBS_SECONDS)
+        scheduler.shutdown(wait=False)  # отменяет не успевшие
+        await asyncio.gather(*_running_jobs, return_exceptions=True)
+        await send_queue.stop()
+        if metrics:
+            await metrics.cleanup()
+        await release_lease("digest")
+        await release_lease("archive")
+        await close_db()
+        if profiler is not None:
+            profiler.log_dump()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     try:
         asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
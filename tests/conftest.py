@@ -0,0 +1,24 @@
+# tests/conftest.py
+# app.config требует BOT_TOKEN при импорте, а DB_PATH относительный — БД тестов
+# создаётся во временном каталоге (фикстура db_dir).
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+os.environ.setdefault("BOT_TOKEN", "0:test")
+
+
+@pytest.fixture(scope="session")
+def db_dir(tmp_path_factory):
+    path = tmp_path_factory.mktemp("db")
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(cwd)
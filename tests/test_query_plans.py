@@ -0,0 +1,29 @@
+# tests/test_query_plans.py
+# Горячие запросы используют свои индексы: EXPLAIN QUERY PLAN на свежей БД после
+# всех миграций (проверки — bench/query_plans.py, там же ручной вывод планов).
+import asyncio
+
+import pytest
+
+from bench.query_plans import check_plans, hot_queries
+
+
+@pytest.fixture(scope="module")
+def plans(db_dir):
+    from app.db import init_db, db_conn, close_db
+
+    async def run():
+        await init_db()
+        try:
+            async with db_conn() as db:
+                return await check_plans(db)
+        finally:
+            await close_db()
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("name", list(hot_queries()))
+def test_uses_index(plans, name):
+    details, bad = plans[name]
+    assert not bad, f"{name}: {bad}\n" + "\n".join(details)